@@ -21,6 +21,7 @@
 
 from . import generator
 from . import carrier_file
+from . import carrier_file_event
 from . import stock
 from . import csv_writer
 from . import wizard
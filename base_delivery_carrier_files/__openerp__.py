@@ -33,9 +33,14 @@ It contains :
 The delivery orders can be grouped in one files
 or be exported each one in a separate file.
 The files can be generated automatically
-on the shipment of a Delivery Order or from a manual action.
+on the shipment of a Delivery Order, by a scheduled action which runs
+every minute, or from a manual action.
+A scheduled action can also append the Delivery Orders done since its
+last run to the file of the current day, week or month.
 They are exported to a defined path or
 in a document directory of your choice if the "document" module is installed.
+On the disk, the files can be compressed (gzip or zip) and split
+when they exceed a maximum size.
 
 A generic carrier file is included in the module.
 It can also be used as a basis to create your own sub-module.
@@ -54,12 +59,14 @@ Sub-modules already exist to generate file according to specs of :
                 'stock',
                 'delivery'],
     'data': ['carrier_file_view.xml',
+             'carrier_file_data.xml',
              'stock_view.xml',
              'wizard/generate_carrier_files_view.xml',
              'security/ir.model.access.csv'],
     'demo': ['carrier_file_demo.xml', 'carrier_file_demo.yml'],
     'test': ['test/carrier_file.yml',
-             'test/carrier_file_manual.yml'],
+             'test/carrier_file_manual.yml',
+             'test/carrier_file_incremental.yml'],
     'images': [],
     'installable': True,
     'auto_install': False,
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+"""
+Micro-benchmark of the rows of the carrier files (BaseLine)
+
+It does not need Odoo, base_line.py is loaded from its path:
+
+    python bench_base_line.py [--rows 100000] [--compare old_base_line.py]
+
+--compare runs the same benchmark on another version of base_line.py,
+for instance one extracted with `git show <rev>:<path>`.
+"""
+
+import argparse
+import imp
+import os
+import timeit
+
+BASE_LINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, 'generator', 'base_line.py')
+
+# same definitions as the TNT and La Poste lines
+TNT_FIELDS = (('reference', 15), ('name', 30), ('street1', 30),
+              ('street2', 30), ('street3', 30), ('city', 30), ('zip', 9),
+              ('state', 30), ('country', 2), ('country_name', 30),
+              ('phone', 16), ('fax', 16), ('contact', 22),
+              ('tnt_account', 9), ('vat', 20), ('mail', 50),
+              ('address_type', 1), ('notes', 50))
+LAPOSTE_FIELDS = ('reference', 'firstname', 'lastname', 'company_name',
+                  'street1', 'street2', 'street3', 'street4', 'zip', 'city',
+                  'country_code', 'phone', 'mail', '', '', '', '', '', '',
+                  '', 'weight')
+
+VALUES = {
+    'reference': u'OUT/000042',
+    'name': u'Camptocamp SA',
+    'lastname': u'Camptocamp SA',
+    'street1': u'EPFL Innovation Park, Bâtiment A',
+    'zip': u'1015',
+    'city': u'Lausanne',
+    'country': u'CH',
+    'country_code': u'CH',
+    'country_name': u'Switzerland',
+    'phone': u'+41 21 619 10 10',
+    'mail': u'info@example.com',
+    'weight': 12.5,
+    'notes': u'Express',
+}
+
+
+def load_line_class(path, name, fields):
+    module = imp.load_source('bench_base_line_%d' % abs(hash(path)), path)
+    return type(name, (module.BaseLine,), {'fields': fields})
+
+
+def bench(path, rows, repeat):
+    results = {}
+    for name, fields in (('TNTLine', TNT_FIELDS),
+                         ('LaPosteLine', LAPOSTE_FIELDS)):
+        line_class = load_line_class(path, name, fields)
+        # the columns are looked up once, as in the generators which
+        # assign the fields they know
+        header = set(line_class().get_header())
+        values = [(key, value) for key, value in VALUES.iteritems()
+                  if key in header]
+
+        def build():
+            line = line_class()
+            for field_name, value in values:
+                setattr(line, field_name, value)
+            return line.get_fields()
+
+        best = min(timeit.repeat(build, number=rows, repeat=repeat))
+        results[name] = rows / best
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--compare', metavar='BASE_LINE_PY')
+    args = parser.parse_args()
+
+    versions = [('current', BASE_LINE)]
+    if args.compare:
+        versions.insert(0, ('compared', args.compare))
+    for label, path in versions:
+        results = bench(path, args.rows, args.repeat)
+        for name, rate in sorted(results.iteritems()):
+            print '%-10s %-12s %12.0f rows/s' % (label, name, rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+"""
+Benchmark of the carrier file generators (La Poste and TNT)
+
+The pickings are the in-memory fakes of the tests: the values of their
+rows are given to the generator as if they had been prefetched, so no
+database is needed, only the Odoo sources and the addons path:
+
+    python bench_generators.py --addons-path=/path/to/addons,... \\
+        [--sizes 1000,10000,100000] [--output results.json] \\
+        [--compare previous_results.json] [--timeout 600]
+
+Each case runs in its own process to measure its peak memory, a case
+which crashes or runs longer than --timeout seconds is reported as
+failed and the next cases are run.
+The files are not written on the disk, only their size is counted.
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import platform
+import Queue
+import resource
+import sys
+import time
+
+GENERATORS = {
+    'la_poste': 'delivery_carrier_file_laposte.generator.laposte_generator',
+    'tnt_express_shipper': 'delivery_carrier_file_tnt.generator.tnt_generator',
+}
+MODES = ('single', 'grouped')
+SIZES = (1000, 10000, 100000)
+TIMEOUT = 600
+# floor of the measured durations, so the rates are always numbers
+MIN_DURATION = 1e-6
+
+
+class CountingFile(object):
+
+    """ File handle counting the bytes written """
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+def import_generators(addons_path):
+    import openerp
+    from openerp.modules import module
+    openerp.tools.config['addons_path'] = addons_path
+    module.initialize_sys_path()
+    from openerp.addons.base_delivery_carrier_files.generator import (
+        new_file_generator
+    )
+    for module_path in GENERATORS.itervalues():
+        __import__('openerp.addons.%s' % module_path)
+    return new_file_generator
+
+
+def run_case(addons_path, carrier, mode, size, queue):
+    """ Generate the files of a case, in a child process """
+    new_file_generator = import_generators(addons_path)
+    from openerp.addons.base_delivery_carrier_files.tests.common import (
+        FakeConfiguration, FakePicking, fake_values
+    )
+    generator = new_file_generator(carrier)
+    configuration = FakeConfiguration(mode == 'grouped')
+    pickings = [FakePicking(index) for index in xrange(1, size + 1)]
+    generator._values = dict((picking.id, fake_values(picking))
+                             for picking in pickings)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.time()
+    output_bytes = 0
+    files = 0
+    for __, rows, __ in generator.iter_files(pickings, configuration):
+        file_handle = CountingFile()
+        generator.write_file(file_handle, rows, configuration)
+        output_bytes += file_handle.size
+        files += 1
+    duration = time.time() - start
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        'carrier': carrier,
+        'mode': mode,
+        'pickings': size,
+        'files': files,
+        'seconds': duration,
+        'rows_per_second': size / max(duration, MIN_DURATION),
+        'output_bytes': output_bytes,
+        # ru_maxrss is in KB on Linux
+        'peak_rss_kb': rss_after,
+        'peak_rss_increase_kb': rss_after - rss_before,
+    })
+
+
+def wait_result(process, queue, timeout):
+    """ Wait for the result of a case, None when its process crashes
+    or times out """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            return queue.get(timeout=1)
+        except Queue.Empty:
+            if not process.is_alive():
+                break
+    # the result may have been sent just before the end of the process
+    try:
+        return queue.get(timeout=1)
+    except Queue.Empty:
+        return None
+
+
+def run(addons_path, sizes, timeout=TIMEOUT):
+    results = []
+    for carrier in sorted(GENERATORS):
+        for mode in MODES:
+            for size in sizes:
+                queue = multiprocessing.Queue()
+                process = multiprocessing.Process(
+                    target=run_case,
+                    args=(addons_path, carrier, mode, size, queue))
+                process.start()
+                result = wait_result(process, queue, timeout)
+                timed_out = process.is_alive()
+                if timed_out:
+                    process.terminate()
+                process.join()
+                if result is None:
+                    if timed_out:
+                        error = 'timed out after %d s' % timeout
+                    else:
+                        error = 'crashed, exit code %s' % process.exitcode
+                    result = {'carrier': carrier,
+                              'mode': mode,
+                              'pickings': size,
+                              'error': error}
+                results.append(result)
+                print_result(result)
+    return results
+
+
+def case_key(result):
+    return (result['carrier'], result['mode'], result['pickings'])
+
+
+def print_result(result, previous=None):
+    if result.get('error'):
+        print ('%(carrier)-20s %(mode)-8s %(pickings)7d pickings '
+               'FAILED: %(error)s' % result)
+        return
+    line = ('%(carrier)-20s %(mode)-8s %(pickings)7d pickings '
+            '%(rows_per_second)10.0f rows/s %(peak_rss_increase_kb)8d KB '
+            '%(output_bytes)11d bytes' % result)
+    # results stored by older runs may have no rate
+    if (previous and not previous.get('error') and
+            previous.get('rows_per_second')):
+        line += '  (x%.2f rows/s, %+d KB)' % (
+            result['rows_per_second'] / previous['rows_per_second'],
+            result['peak_rss_increase_kb'] -
+            previous['peak_rss_increase_kb'])
+    print line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--addons-path', required=True)
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)))
+    parser.add_argument('--output', metavar='JSON',
+                        help='store the results in this file')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='compare with the results of a previous run')
+    parser.add_argument('--timeout', type=int, default=TIMEOUT,
+                        help='maximum duration of a case in seconds')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = run(args.addons_path, sizes, timeout=args.timeout)
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = dict((case_key(result), result)
+                            for result in json.load(previous_file)['cases'])
+        print '\nCompared with %s:' % args.compare
+        for result in results:
+            print_result(result, previous.get(case_key(result)))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'date': datetime.datetime.utcnow().isoformat(),
+                       'python': sys.version.split()[0],
+                       'platform': platform.platform(),
+                       'cases': results},
+                      output_file, indent=2, sort_keys=True)
+
+    if any(result.get('error') for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
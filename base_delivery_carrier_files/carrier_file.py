@@ -19,17 +19,65 @@
 #
 ##############################################################################
 
-import os
 import logging
+from multiprocessing.pool import ThreadPool
 
 from openerp import models, fields, api, exceptions
+from openerp.tools import ustr
 from openerp.tools.translate import _
 from .generator import new_file_generator
+from .file_output import FileOutput
+
+
+def _write_on_disk(directory, filename, write, **options):
+    """
+    Write a file on the disk, in temporary files renamed once complete
+    so a partial file is never picked up by the carrier.
+    It doesn't use the ORM so it can run outside of the request thread.
+
+    :param str directory: directory where the file is written
+    :param str filename: name of the file to write
+    :param write: function receiving the file handle to write in
+    :param options: compression, max_size and append, see `FileOutput`
+    :return: list of the names of the files written
+    """
+    output = FileOutput(directory, filename, **options)
+    try:
+        write(output)
+        return output.close()
+    except Exception:
+        output.abort()
+        raise
+
+
+def _write_content_on_disk(args):
+    """
+    Write the content of a file on the disk, used by the pool of
+    workers of `CarrierFile._write_files_parallel`
+
+    :param tuple args: directory, filename, content of the file
+                       and options of `FileOutput`
+    :return: the exception raised or None
+    """
+    directory, filename, file_content, options = args
+    try:
+        _write_on_disk(directory, filename,
+                       lambda file_handle: file_handle.write(file_content),
+                       **options)
+    except Exception as e:
+        return e
 
 
 class CarrierFile(models.Model):
     _name = 'delivery.carrier.file'
 
+    # number of delivery orders appended to the file of the period
+    # and committed at once by the incremental export
+    _incremental_batch_size = 500
+    # number of files per worker generated in memory before
+    # they are written on the disk in parallel
+    _parallel_files_per_worker = 10
+
     @api.model
     def get_type_selection(self):
         """
@@ -61,49 +109,198 @@ class CarrierFile(models.Model):
                 raise exceptions.Warning(
                     _('Export path is not defined '
                       'for carrier file %s') % (carrier_file.name,))
-            full_path = os.path.join(carrier_file.export_path, filename)
-            with open(full_path, 'w') as file_handle:
-                file_handle.write(file_content)
+            _write_on_disk(
+                carrier_file.export_path, filename,
+                lambda file_handle: file_handle.write(file_content),
+                **carrier_file._get_output_options())
         return True
 
-    @api.one
+    @api.multi
+    def _write_file_rows(self, filename, file_generator, rows):
+        """
+        Stream the rows produced by the file generator in the file.
+
+        On the disk, the rows are written in a temporary file in the
+        export path, which is renamed once complete, so a partial file
+        is never picked up by the carrier.
+        Other write modes receive the content of the file in
+        `_write_file`.
+
+        :param str filename: name of the file to write
+        :param file_generator: generator which writes the rows
+        :param rows: iterator of the rows to write
+        :return: True if write is successful
+        """
+        self.ensure_one()
+        if self.write_mode != 'disk':
+            file_content = file_generator._get_file(rows, self)
+            return self._write_file(filename, file_content)
+        self._check_export_path()
+        _write_on_disk(
+            self.export_path, filename,
+            lambda file_handle: file_generator.write_file(file_handle,
+                                                          rows, self),
+            **self._get_output_options())
+        return True
+
+    @api.multi
+    def _get_output_options(self):
+        """
+        Options of the files written on the disk, see `FileOutput`
+        """
+        self.ensure_one()
+        return {'compression': self.compression or 'none',
+                'max_size': self.max_file_size * 1024}
+
+    @api.multi
+    def _check_export_path(self):
+        for carrier_file in self:
+            if not carrier_file.export_path:
+                raise exceptions.Warning(
+                    _('Export path is not defined '
+                      'for carrier file %s') % (carrier_file.name,))
+
+    @api.multi
+    def _write_files_sequential(self, file_generator, pickings):
+        """
+        Generate and write the files one after the other
+
+        :return: tuple with the list of ids of the pickings written
+                 and a dict {picking id: error message} of the failures
+        """
+        self.ensure_one()
+        log = logging.getLogger('delivery.carrier.file')
+        done_ids = []
+        failures = {}
+        for filename, rows, picking_ids in file_generator.iter_files(
+                pickings, self):
+            # we pass the errors because the files can still be
+            # generated manually
+            try:
+                if self._write_file_rows(filename, file_generator, rows):
+                    done_ids += picking_ids
+            except Exception as e:
+                log.exception("Could not create the picking file "
+                              "for pickings %s: %s",
+                              picking_ids, e)
+                failures.update(dict.fromkeys(picking_ids, ustr(e)))
+        return done_ids, failures
+
+    @api.multi
+    def _write_files_parallel(self, file_generator, pickings):
+        """
+        Generate the files one per picking and write them on the disk
+        with a pool of workers.
+
+        The content of the files is built in the current thread
+        as it reads the database, only the writes on the disk are
+        done concurrently. The files are generated and written by
+        chunks, so only the content of a chunk of files is kept
+        in memory.
+
+        :return: tuple with the list of ids of the pickings written
+                 and a dict {picking id: error message} of the failures
+        """
+        self.ensure_one()
+        log = logging.getLogger('delivery.carrier.file')
+        self._check_export_path()
+        chunk_size = self.write_workers * self._parallel_files_per_worker
+        done_ids = []
+        failures = {}
+        files = []
+        pool = ThreadPool(self.write_workers)
+        try:
+            for filename, rows, picking_ids in file_generator.iter_files(
+                    pickings, self):
+                try:
+                    file_content = file_generator._get_file(rows, self)
+                except Exception as e:
+                    log.exception("Could not create the picking file "
+                                  "for pickings %s: %s",
+                                  picking_ids, e)
+                    failures.update(dict.fromkeys(picking_ids, ustr(e)))
+                    continue
+                files.append((filename, file_content, picking_ids))
+                if len(files) >= chunk_size:
+                    self._write_chunk_parallel(pool, files, done_ids,
+                                               failures)
+                    files = []
+            if files:
+                self._write_chunk_parallel(pool, files, done_ids, failures)
+        finally:
+            pool.close()
+            pool.join()
+        return done_ids, failures
+
+    @api.multi
+    def _write_chunk_parallel(self, pool, files, done_ids, failures):
+        """
+        Write a chunk of files on the disk with the pool of workers
+
+        :param pool: pool of workers
+        :param list files: tuples (filename, content, picking ids)
+        :param list done_ids: extended with the ids of the pickings written
+        :param dict failures: updated with the errors of the other pickings
+        """
+        self.ensure_one()
+        log = logging.getLogger('delivery.carrier.file')
+        options = self._get_output_options()
+        errors = pool.map(
+            _write_content_on_disk,
+            [(self.export_path, filename, content, options)
+             for filename, content, __ in files])
+        for (filename, __, picking_ids), error in zip(files, errors):
+            if error is None:
+                done_ids += picking_ids
+                continue
+            log.error("Could not create the picking file %s "
+                      "for pickings %s: %s",
+                      filename, picking_ids, error)
+            failures.update(dict.fromkeys(picking_ids, ustr(error)))
+
+    @api.multi
     def _generate_files(self, picking_ids):
         """
         Generate one or more files according to carrier_file configuration
         for all picking_ids
 
+        When the pickings are not grouped and the files are written
+        on the disk by more than one worker, the files are written
+        concurrently.
+        The pickings of the files successfully written are flagged
+        at once.
+
         :param browse_record carrier_file: browsable carrier file
                                            configuration
         :param list picking_ids: list of ids of pickings for which
                                  we have to generate a file
-        :return: True if successful
+        :return: dict {picking id: error message} of the pickings
+                 for which the file could not be written
         """
-        log = logging.getLogger('delivery.carrier.file')
+        self.ensure_one()
         file_generator = new_file_generator(self.type)
 
         picking_obj = self.env["stock.picking"]
         pickings = picking_obj.browse(picking_ids)
+        file_generator.prefetch(pickings, self)
 
-        # must return a list of generated pickings ids to update
-        files = file_generator.generate_files(pickings, self)
+        if (not self.group_pickings and self.write_mode == 'disk' and
+                self.write_workers > 1):
+            done_ids, failures = self._write_files_parallel(
+                file_generator, pickings)
+        else:
+            done_ids, failures = self._write_files_sequential(
+                file_generator, pickings)
 
-        for f in files:
-            filename, file_content, picking_ids = f
-            # we pass the errors because the files can still be
-            # generated manually
-            # at first I would like to open a new cursor and
-            # commit the write after each file created
-            # but I encountered lock because the picking
-            # was already modified in the current transaction
-            try:
-                if self._write_file(filename, file_content):
-                    picking_obj.browse(picking_ids).write({
-                        'carrier_file_generated': True})
-            except Exception as e:
-                log.exception("Could not create the picking file "
-                              "for pickings %s: %s",
-                              picking_ids, e)
-        return True
+        # at first I would like to open a new cursor and
+        # commit the write after each file created
+        # but I encountered lock because the picking
+        # was already modified in the current transaction
+        if done_ids:
+            picking_obj.browse(done_ids).write(
+                {'carrier_file_generated': True,
+                 'carrier_file_error': False})
+        return failures
 
     @api.one
     def generate_files(self, picking_ids):
@@ -118,7 +315,193 @@ class CarrierFile(models.Model):
                                  which we have to generate a file
         :return: True if successful
         """
-        return self._generate_files(picking_ids)
+        self._generate_files(picking_ids)
+        return True
+
+    @api.multi
+    def _find_new_pickings(self, limit):
+        """
+        Search the done delivery orders not yet exported, done since
+        the activation of the incremental export, in the order they
+        have been done.
+
+        The delivery orders exported are flagged, there is no
+        high-water mark on the done date: a delivery order committed
+        after the ones done later than it is exported by the next run.
+        The delivery orders whose rows could not be generated are
+        skipped until their error is removed.
+
+        :param int limit: maximum number of delivery orders to return
+        :return: list of tuples (picking id, done date)
+        """
+        self.ensure_one()
+        self.env.cr.execute(
+            "SELECT p.id, p.date_done "
+            "FROM stock_picking p "
+            "JOIN delivery_carrier c ON c.id = p.carrier_id "
+            "JOIN stock_picking_type t ON t.id = p.picking_type_id "
+            "WHERE c.carrier_file_id = %s "
+            "AND p.state = 'done' "
+            "AND NOT COALESCE(p.carrier_file_generated, false) "
+            "AND p.carrier_file_error IS NULL "
+            "AND t.code = 'outgoing' "
+            "AND p.date_done >= %s "
+            "ORDER BY p.date_done, p.id LIMIT %s",
+            (self.id, self.incremental_start_date, limit)
+        )
+        return self.env.cr.fetchall()
+
+    @api.multi
+    def _export_new_pickings(self, commit=True):
+        """
+        Append the delivery orders done since the last run to the file
+        of the current period.
+
+        The delivery orders are exported by batches. The rows of a
+        batch are written in temporary files, appended to the files
+        of the period once the delivery orders are committed as
+        exported: when the commit fails, the rows are dropped and
+        exported again by the next run. A crash between the commit
+        and the append leaves the rows in the temporary files, the
+        files of these delivery orders can be generated manually.
+
+        When the rows of a batch can't be generated, the delivery
+        orders of the batch are checked one by one, the error of the
+        failing ones is stored on them so they are skipped and the
+        other ones are exported.
+
+        :param bool commit: commit after each batch
+        :return: number of delivery orders exported
+        """
+        self.ensure_one()
+        self._check_export_path()
+        file_generator = new_file_generator(self.type)
+        picking_obj = self.env['stock.picking']
+        count = 0
+        while True:
+            new_pickings = self._find_new_pickings(
+                self._incremental_batch_size)
+            if not new_pickings:
+                break
+            pickings = picking_obj.browse([row[0] for row in new_pickings])
+            file_generator.prefetch(pickings, self)
+            filename = file_generator._get_filename_period(self)
+            filename = file_generator.sanitize_filename(filename)
+            output = FileOutput(self.export_path, filename, append=True,
+                                **self._get_output_options())
+            try:
+                try:
+                    with self.env.cr.savepoint():
+                        file_generator.write_file(
+                            output,
+                            file_generator._iter_rows(pickings, self),
+                            self)
+                except Exception:
+                    output.abort()
+                    if not self._isolate_failing_pickings(file_generator,
+                                                          pickings):
+                        raise
+                    if commit:
+                        self.env.cr.commit()
+                    # the batch is exported again without the
+                    # failing delivery orders
+                    continue
+                output.close(commit=False)
+                pickings.write({'carrier_file_generated': True})
+                self.write({'last_export_date': new_pickings[-1][1]})
+                if commit:
+                    self.env.cr.commit()
+            except Exception:
+                output.abort()
+                raise
+            output.commit()
+            count += len(pickings)
+        return count
+
+    @api.multi
+    def _isolate_failing_pickings(self, file_generator, pickings):
+        """
+        Generate the rows of the delivery orders one by one and store
+        the error of the ones failing, so the next runs skip them.
+
+        :return: the delivery orders failing
+        """
+        self.ensure_one()
+        log = logging.getLogger('delivery.carrier.file')
+        failing = pickings.browse()
+        for picking in pickings:
+            try:
+                with self.env.cr.savepoint():
+                    list(file_generator._iter_rows(picking, self))
+            except Exception as e:
+                log.exception("Could not export the delivery order %s "
+                              "in the carrier file %s: %s",
+                              picking.name, self.name, e)
+                picking.write({'carrier_file_error': ustr(e)})
+                failing |= picking
+        return failing
+
+    @api.model
+    def run_incremental_exports(self):
+        """
+        Export the new delivery orders of the carrier files
+        exported incrementally.
+        Called by the scheduled action.
+        """
+        log = logging.getLogger('delivery.carrier.file')
+        carrier_files = self.search([('incremental_export', '=', True)])
+        for carrier_file in carrier_files:
+            try:
+                count = carrier_file._export_new_pickings()
+            except Exception as e:
+                self.env.cr.rollback()
+                self.env.invalidate_all()
+                log.exception("Could not export the delivery orders "
+                              "of the carrier file %s: %s",
+                              carrier_file.name, e)
+            else:
+                log.info("%d delivery orders appended to the carrier "
+                         "file %s", count, carrier_file.name)
+        return True
+
+    @api.constrains('incremental_export', 'write_mode', 'compression')
+    def _check_incremental_export(self):
+        for carrier_file in self:
+            if not carrier_file.incremental_export:
+                continue
+            if carrier_file.write_mode != 'disk':
+                raise exceptions.ValidationError(
+                    _('The incremental export of the carrier file %s '
+                      'can only write on the disk.') % (carrier_file.name,))
+            if carrier_file.compression == 'zip':
+                raise exceptions.ValidationError(
+                    _('The incremental export of the carrier file %s '
+                      'can not append to zip files, use gzip.') %
+                    (carrier_file.name,))
+
+    @api.model
+    def create(self, vals):
+        # only the delivery orders done after the activation of the
+        # incremental export are exported
+        if (vals.get('incremental_export') and
+                'incremental_start_date' not in vals):
+            vals = dict(vals, incremental_start_date=fields.Datetime.now())
+        return super(CarrierFile, self).create(vals)
+
+    @api.multi
+    def write(self, vals):
+        starting = self.browse()
+        if (vals.get('incremental_export') and
+                'incremental_start_date' not in vals):
+            starting = self.filtered(
+                lambda record: not record.incremental_export)
+        result = super(CarrierFile, self).write(vals)
+        if starting:
+            # only the delivery orders done after the activation of the
+            # incremental export are exported
+            super(CarrierFile, starting).write(
+                {'incremental_start_date': fields.Datetime.now()})
+        return result
 
     name = fields.Char('Name', size=64, required=True)
     type = fields.Selection(get_type_selection, 'Type', required=True)
@@ -131,6 +514,37 @@ class CarrierFile(models.Model):
     write_mode = fields.Selection(get_write_mode_selection, 'Write on',
                                   required=True)
     export_path = fields.Char('Export Path', size=256)
+    compression = fields.Selection(
+        [('none', 'None'), ('gzip', 'Gzip'), ('zip', 'Zip')],
+        'Compression', default='none',
+        help='Files written on the disk are compressed '
+             'while they are generated.')
+    max_file_size = fields.Integer(
+        'Maximum File Size (KB)',
+        help='Files written on the disk are split in many files '
+             'when they exceed this size. 0 means no limit.')
+    write_workers = fields.Integer(
+        'Parallel Writes', default=1,
+        help='Number of files written at the same time on the disk '
+             'when the pickings are not grouped in one file.')
+    incremental_export = fields.Boolean(
+        'Scheduled incremental export',
+        help='The delivery orders done are appended by a scheduled '
+             'action to the file of the current period, instead of '
+             'being exported at the delivery order process.')
+    export_period = fields.Selection(
+        [('day', 'Day'), ('week', 'Week'), ('month', 'Month')],
+        'Export Period', default='day',
+        help='A new file is started for each period '
+             'by the incremental export.')
+    incremental_start_date = fields.Datetime(
+        'Incremental Export Start', readonly=True,
+        help='Only the delivery orders done since this date '
+             'are exported by the incremental export.')
+    last_export_date = fields.Datetime(
+        'Last Exported Done Date', readonly=True,
+        help='Done date of the last delivery order exported '
+             'by the incremental export.')
     auto_export = fields.Boolean('Export at delivery order process',
                                  help='The file will be automatically '
                                  'generated when a delivery order '
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+import logging
+
+from openerp import models, fields, api
+
+
+class CarrierFileEvent(models.Model):
+    """ Delivery orders processed, waiting for the automatic
+    generation of their carrier files
+
+    The validation of the stock moves only inserts the events,
+    the files are generated by a scheduled action, see `consume`.
+    """
+    _name = 'delivery.carrier.file.event'
+    _description = 'Carrier File Generation Queue'
+    _order = 'id'
+    _log_access = False
+
+    # number of events consumed and committed at once
+    _batch_size = 200
+
+    picking_id = fields.Many2one('stock.picking', 'Delivery Order',
+                                 required=True, ondelete='cascade')
+
+    @api.model
+    def enqueue(self, picking_ids):
+        """
+        Queue the pickings having a carrier file exported at the
+        delivery order process with one query.
+
+        :param list picking_ids: ids of the pickings of the moves done
+        """
+        if not picking_ids:
+            return
+        self.env.cr.execute(
+            "INSERT INTO delivery_carrier_file_event (picking_id) "
+            "SELECT p.id "
+            "FROM stock_picking p "
+            "JOIN delivery_carrier c ON c.id = p.carrier_id "
+            "JOIN delivery_carrier_file f ON f.id = c.carrier_file_id "
+            "WHERE p.id IN %s "
+            "AND f.auto_export "
+            "AND NOT COALESCE(f.incremental_export, false)",
+            (tuple(picking_ids),)
+        )
+
+    @api.model
+    def _pop_batch(self, limit):
+        """
+        Remove the oldest events from the queue
+
+        :return: tuple with the ids of the events removed and the ids
+                 of their pickings, without duplicates
+        """
+        self.env.cr.execute(
+            "DELETE FROM delivery_carrier_file_event "
+            "WHERE id IN (SELECT id FROM delivery_carrier_file_event "
+            "             ORDER BY id LIMIT %s) "
+            "RETURNING id, picking_id",
+            (limit,)
+        )
+        rows = self.env.cr.fetchall()
+        return ([row[0] for row in rows],
+                list(set(row[1] for row in rows)))
+
+    @api.model
+    def _drop_events(self, event_ids):
+        """
+        Remove events from the queue, used when the generation
+        of their files failed and has been rolled back
+
+        :param list event_ids: ids of the events to remove
+        """
+        if not event_ids:
+            return
+        self.env.cr.execute(
+            "DELETE FROM delivery_carrier_file_event WHERE id IN %s",
+            (tuple(event_ids),)
+        )
+
+    @api.model
+    def consume(self, commit=True):
+        """
+        Generate the carrier files of the queued pickings, by batches
+        committed one after the other.
+
+        The pickings not yet done are dropped, they are queued again
+        when their next moves are done.
+        Called by the scheduled action.
+
+        :param bool commit: commit after each batch, the errors
+                            are raised when False
+        """
+        log = logging.getLogger('delivery.carrier.file')
+        picking_obj = self.env['stock.picking']
+        while True:
+            event_ids, picking_ids = self._pop_batch(self._batch_size)
+            if not picking_ids:
+                break
+            pickings = picking_obj.browse(picking_ids).exists().filtered(
+                lambda picking: picking.state == 'done')
+            try:
+                failures = pickings._generate_carrier_files(auto=True)
+            except Exception as e:
+                if not commit:
+                    raise
+                self.env.cr.rollback()
+                self.env.invalidate_all()
+                log.exception("Could not generate the carrier files "
+                              "of the pickings %s: %s", picking_ids, e)
+                # the batch is skipped, the files can still be
+                # generated manually. The rollback restored the events
+                # of the batch, the events queued meanwhile are kept.
+                self._drop_events(event_ids)
+            else:
+                if failures:
+                    log.error("Could not generate the carrier files "
+                              "of the pickings %s", failures.keys())
+            if commit:
+                self.env.cr.commit()
+        return True
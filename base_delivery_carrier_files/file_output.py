@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+import gzip
+import os
+import shutil
+import struct
+import time
+import zipfile
+import zlib
+
+
+class _ZipStream(object):
+
+    """
+    File-like object writing a zip archive of a single member, the
+    member is compressed while it is written.
+
+    zipfile can only add a complete file to an archive, so the member
+    is written with a data descriptor: its CRC and sizes follow the
+    compressed data instead of being in its header. The archive can't
+    be larger than 4GB (no zip64).
+    """
+
+    def __init__(self, fileobj, name):
+        # flag 0x08: the CRC and the sizes are in the data descriptor
+        self._flags = 0x08
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+            self._flags |= 0x800
+        self._fileobj = fileobj
+        self._name = name
+        self._crc = 0
+        self._file_size = 0
+        self._compress_size = 0
+        self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                            zlib.DEFLATED, -15)
+        date_time = time.localtime()[:6]
+        self._dos_date = ((date_time[0] - 1980) << 9 |
+                          date_time[1] << 5 | date_time[2])
+        self._dos_time = (date_time[3] << 11 | date_time[4] << 5 |
+                          date_time[5] // 2)
+        self._header_offset = fileobj.tell()
+        fileobj.write(self._header(zipfile.structFileHeader,
+                                   zipfile.stringFileHeader) + name)
+
+    def _header(self, fmt, signature):
+        values = [signature]
+        if fmt == zipfile.structCentralDir:
+            # version made by, system
+            values += [20, 0]
+        values += [20, 0, self._flags, zipfile.ZIP_DEFLATED,
+                   self._dos_time, self._dos_date]
+        if fmt == zipfile.structCentralDir:
+            values += [self._crc, self._compress_size, self._file_size,
+                       len(self._name), 0, 0, 0, 0, 0,
+                       self._header_offset]
+        else:
+            values += [0, 0, 0, len(self._name), 0]
+        return struct.pack(fmt, *values)
+
+    def _write_compressed(self, data):
+        self._fileobj.write(data)
+        self._compress_size += len(data)
+
+    def write(self, data):
+        self._crc = zlib.crc32(data, self._crc) & 0xffffffff
+        self._file_size += len(data)
+        self._write_compressed(self._compressor.compress(data))
+
+    def flush(self):
+        """ Write the data buffered by the compressor """
+        self._write_compressed(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def close(self):
+        self._write_compressed(self._compressor.flush())
+        self._fileobj.write(struct.pack('<4sLLL', b'PK\x07\x08', self._crc,
+                                        self._compress_size,
+                                        self._file_size))
+        central_offset = self._fileobj.tell()
+        self._fileobj.write(self._header(zipfile.structCentralDir,
+                                         zipfile.stringCentralDir) +
+                            self._name)
+        central_size = self._fileobj.tell() - central_offset
+        self._fileobj.write(struct.pack(zipfile.structEndArchive,
+                                        zipfile.stringEndArchive,
+                                        0, 0, 1, 1, central_size,
+                                        central_offset, 0))
+
+    def trailer_size(self):
+        """ Size written by close, besides the compressed data """
+        return (16 + struct.calcsize(zipfile.structCentralDir) +
+                len(self._name) + struct.calcsize(zipfile.structEndArchive))
+
+
+class FileOutput(object):
+
+    """
+    File-like object writing a carrier file on the disk, compressed
+    while it is written and rotated by size.
+
+    The files are rotated by size only, the incremental export of
+    the carrier files starts a new file for each period instead.
+
+    Each part is written in a temporary file, the temporary files
+    are renamed once all the parts are complete, so a partial file is
+    never picked up by the carrier. When the size of a part would
+    exceed max_size, the next writes go in a new part: 'out.csv',
+    'out_2.csv', 'out_3.csv', ...
+    The writers of the generators write one row per call of write,
+    so the files are rotated between two rows. As the compressors
+    buffer the data, they are flushed before a row which could exceed
+    max_size, so the size of a compressed part is known when it is
+    compared to max_size.
+
+    With append, the rows are appended to the last part instead,
+    as the rows already exported can't be written again. Only the new
+    rows are written in the temporary file (in a new member for gzip,
+    a gzip file can contain many members), its content is appended to
+    the part by commit, so the part is never copied and a crash while
+    writing leaves the part as it was.
+
+    close(commit=False) completes the parts without renaming their
+    temporary files, they are renamed by commit or removed by abort.
+    This way, the rows can be made visible only once the transaction
+    of their delivery orders is committed.
+
+    Usage:
+
+    output = FileOutput('/tmp', 'out.csv', compression='gzip')
+    try:
+        output.write(content)
+        filenames = output.close()
+    except Exception:
+        output.abort()
+        raise
+    """
+
+    def __init__(self, directory, filename, compression='none',
+                 max_size=0, append=False):
+        if compression == 'zip' and append:
+            raise ValueError("Zip files can't be appended")
+        self.directory = directory
+        self.filename = filename
+        self.compression = compression or 'none'
+        self.max_size = max_size
+        self.append = append
+        self.filenames = []
+        self._index = 1
+        self._pending = []
+        self._raw = None
+        self._stream = None
+        self._size = 0
+        self._base_size = 0
+        self._part_empty = True
+        # bytes written in the compressor since it has been flushed
+        self._unflushed = 0
+        if append:
+            # continue in the last part
+            while (max_size and
+                   os.path.exists(self._path(self._index + 1))):
+                self._index += 1
+        self._open()
+
+    def _part_name(self, index):
+        """ Name of a part before compression """
+        if index == 1:
+            return self.filename
+        base, extension = os.path.splitext(self.filename)
+        return '%s_%d%s' % (base, index, extension)
+
+    def _output_name(self, index):
+        """ Name of the file of a part on the disk """
+        name = self._part_name(index)
+        if self.compression == 'gzip':
+            return name + '.gz'
+        if self.compression == 'zip':
+            return os.path.splitext(name)[0] + '.zip'
+        return name
+
+    def _path(self, index):
+        return os.path.join(self.directory, self._output_name(index))
+
+    def _tmp_path(self, index):
+        return os.path.join(self.directory,
+                            '.%s.part' % self._output_name(index))
+
+    def _open(self):
+        path = self._path(self._index)
+        # size of the part the rows are appended to, for the rotation
+        self._base_size = 0
+        if self.append and os.path.exists(path):
+            self._base_size = os.path.getsize(path)
+        self._raw = open(self._tmp_path(self._index), 'wb')
+        self._unflushed = 0
+        self._part_empty = not self._base_size
+        if self.compression == 'gzip':
+            self._stream = gzip.GzipFile(
+                filename=self._part_name(self._index),
+                mode='wb', fileobj=self._raw)
+        elif self.compression == 'zip':
+            self._stream = _ZipStream(self._raw,
+                                      self._part_name(self._index))
+        else:
+            self._stream = self._raw
+        self._size = self._base_size + self._raw.tell()
+
+    def _close_part(self):
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        tmp_path = self._tmp_path(self._index)
+        self._pending.append((tmp_path, self._path(self._index),
+                              bool(self._base_size)))
+        self.filenames.append(self._output_name(self._index))
+        self._raw = self._stream = None
+
+    def _trailer_size(self):
+        """ Upper bound of the size written when the part is closed """
+        if self.compression == 'gzip':
+            # end of the deflate stream, CRC and size
+            return 16
+        if self.compression == 'zip':
+            return 8 + self._stream.trailer_size()
+        return 0
+
+    def _exceeds_max_size(self, data):
+        """ Whether writing data would make the part exceed max_size
+
+        The compressed size of the data is at most its size, plus a few
+        bytes counted with the trailer.
+
+        """
+        if self._stream is self._raw:
+            return self._size + len(data) > self.max_size
+        limit = self.max_size - self._trailer_size() - len(data)
+        if self._size + self._unflushed <= limit:
+            return False
+        # only the data flushed by the compressor is in the file
+        self._stream.flush()
+        self._unflushed = 0
+        self._size = self._base_size + self._raw.tell()
+        return self._size > limit
+
+    def write(self, data):
+        if (self.max_size and not self._part_empty and
+                self._exceeds_max_size(data)):
+            self._close_part()
+            self._index += 1
+            self._open()
+        self._stream.write(data)
+        self._part_empty = False
+        if self._stream is self._raw:
+            self._size += len(data)
+        else:
+            self._unflushed += len(data)
+            self._size = self._base_size + self._raw.tell()
+
+    def close(self, commit=True):
+        """
+        Complete the last part
+
+        :param bool commit: rename the temporary files of the parts,
+                            when False, call commit or abort later
+        :return: list of the names of the files written
+        """
+        if self._raw is not None:
+            self._close_part()
+        if commit:
+            self.commit()
+        return self.filenames
+
+    def commit(self):
+        """ Rename the temporary files of the parts completed, or append
+        their content to the parts continued """
+        while self._pending:
+            tmp_path, path, append = self._pending[0]
+            if append:
+                self._append_part(tmp_path, path)
+                os.remove(tmp_path)
+            else:
+                os.rename(tmp_path, path)
+            self._pending.pop(0)
+
+    @staticmethod
+    def _append_part(tmp_path, path):
+        """ Append the content of a temporary file to a part, the part
+        is truncated to its previous size when the append fails """
+        size = os.path.getsize(path)
+        with open(path, 'ab') as part:
+            try:
+                with open(tmp_path, 'rb') as tmp_file:
+                    shutil.copyfileobj(tmp_file, part)
+                part.flush()
+                os.fsync(part.fileno())
+            except Exception:
+                part.truncate(size)
+                raise
+
+    def abort(self):
+        """ Close and remove the temporary files not yet renamed """
+        try:
+            if self._raw is not None:
+                if self._stream is not self._raw:
+                    self._stream.close()
+                self._raw.close()
+        finally:
+            tmp_paths = [pending[0] for pending in self._pending]
+            if self._raw is not None:
+                tmp_paths.append(self._tmp_path(self._index))
+            for tmp_path in tmp_paths:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._pending = []
+            self._raw = self._stream = None
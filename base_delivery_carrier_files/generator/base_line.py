@@ -20,6 +20,40 @@
 ##############################################################################
 
 
+class _FieldValue(object):
+
+    """
+    Descriptor giving access to the value of a field in the
+    list of values of a row
+    """
+    __slots__ = ('index', 'name')
+
+    def __init__(self, index, name):
+        self.index = index
+        self.name = name
+
+    def __get__(self, row, cls=None):
+        if row is None:
+            return self
+        return row._values[self.index]
+
+    def __set__(self, row, value):
+        row._values[self.index] = value
+
+
+class _LineMeta(type):
+
+    """
+    Compile the "fields" of the BaseLine classes when they are created
+    """
+
+    def __new__(mcs, name, bases, attrs):
+        attrs.setdefault('__slots__', ())
+        cls = super(_LineMeta, mcs).__new__(mcs, name, bases, attrs)
+        cls._compile_fields()
+        return cls
+
+
 class BaseLine(object):
 
     """
@@ -69,23 +103,63 @@ class BaseLine(object):
     row.field2 = 'long_name'
     row.get_fields()
     => ['x', 'long']
+
+    The fields definition is compiled once when the class is created:
+    the values of a row are kept in a list, accessed through a
+    descriptor per field, and the instances have no __dict__, so
+    only the fields declared in "fields" can be assigned.
     """
+    __metaclass__ = _LineMeta
+    __slots__ = ('_values',)
+
     fields = ()
 
+    # compiled from "fields" by _compile_fields
+    _field_names = ()
+    _value_names = ()
+    _columns = ()
+
     def __init__(self):
         """
-        Create an instance attribute for each field
+        Initialize an empty value for each field
         in the fields class property
         Unless if the field name is empty
         (in order to leave a column empty in the row)
         """
         if not self.fields:
             raise ValueError("Fields Missing")
-        for field in self.fields:
-            field_name, _ = self._field_definition(field)
+        self._values = [''] * len(self._value_names)
+
+    @classmethod
+    def _compile_fields(cls):
+        """
+        Parse the class attribute "fields" once for all the rows:
+        keep the names of the columns, the index of their value
+        and their max width, and add a descriptor for each field.
+        """
+        field_names = []
+        value_names = []
+        columns = []
+        for field in cls.fields:
+            field_name, width = cls._field_definition(field)
+            field_names.append(field_name)
             if not field_name:
+                columns.append((None, False))
                 continue
-            setattr(self, field_name, '')
+            if field_name not in value_names:
+                value_names.append(field_name)
+            index = value_names.index(field_name)
+            columns.append((index, width))
+        cls._field_names = tuple(field_names)
+        cls._value_names = tuple(value_names)
+        cls._columns = tuple(columns)
+        for index, field_name in enumerate(value_names):
+            setattr(cls, field_name, _FieldValue(index, field_name))
+        # fields of a parent class which are not columns of this one
+        for base in cls.__mro__[1:]:
+            for field_name in getattr(base, '_value_names', ()):
+                if field_name not in value_names:
+                    setattr(cls, field_name, None)
 
     @staticmethod
     def _field_definition(field):
@@ -118,20 +192,21 @@ class BaseLine(object):
         :return: a list of values for each field in the
                  order of the class attribute "fields"
         """
+        values = self._values
         res = []
-        for field in self.fields:
-            field_name, width = self._field_definition(field)
-            if field_name:
-                value = getattr(self, field_name)
-                if value in (False, None):
-                    value = ''
-                elif not isinstance(value, (str, unicode)):
-                    value = unicode(value)
-                if width:
-                    value = value[0:width]
-            else:
+        append = res.append
+        for index, width in self._columns:
+            if index is None:
+                append('')
+                continue
+            value = values[index]
+            if value in (False, None):
                 value = ''
-            res.append(value)
+            elif not isinstance(value, basestring):
+                value = unicode(value)
+            if width:
+                value = value[0:width]
+            append(value)
         return res
 
     def get_header(self):
@@ -141,8 +216,4 @@ class BaseLine(object):
 
         :return: a list of field names
         """
-        res = []
-        for field in self.fields:
-            field_name, _ = self._field_definition(field)
-            res.append(field_name)
-        return res
+        return list(self._field_names)
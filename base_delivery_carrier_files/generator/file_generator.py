@@ -29,8 +29,16 @@ except ImportError:
 
 class CarrierFileGenerator(object):
 
+    # values used to generate the rows, mapped to the fields of the
+    # pickings as dotted paths which follow many2one fields, like
+    # {'zip': 'partner_id.zip'}
+    # With a tuple of paths, the first value set is used.
+    # The values of all the pickings are loaded at once, see _load_values
+    columns_map = {}
+
     def __init__(self, carrier_name):
         self.carrier_name = carrier_name
+        self._values = {}
 
     @classmethod
     def carrier_for(cls, carrier_name):
@@ -54,11 +62,31 @@ class CarrierFileGenerator(object):
         date = timestamp or datetime.datetime.now()
         return date.strftime('%Y%m%d_%H%M%S')
 
+    @staticmethod
+    def _filename_period(period, timestamp=None):
+        """
+        Return the period to put in the filename of the files
+        exported incrementally, formatted like :
+        20120214 for a day, 2012_W07 for a week, 201202 for a month
+
+        :param str period: 'day', 'week' or 'month'
+        :param datetime timestamp: optional datetime value to use instead of
+                                   the current date and time
+        :return: a period as str
+        """
+        date = timestamp or datetime.datetime.now()
+        formats = {'day': '%Y%m%d',
+                   'week': '%Y_W%W',
+                   'month': '%Y%m'}
+        return date.strftime(formats[period])
+
     def generate_files(self, pickings, configuration):
         """
-        Base method to generate the pickings files, one file per picking
+        Base method to generate the pickings files, the content of
+        the files is generated in memory.
         It returns a list of tuple with a filename, its content and a
-        list of pickings ids contained in the file
+        list of pickings ids contained in the file.
+        The files are the ones of iter_files.
 
         :param browse_record pickings: list of browsable pickings records
         :param browse_record configuration: configuration of
@@ -67,10 +95,171 @@ class CarrierFileGenerator(object):
                  [('filename1', file, [picking ids]),
                   ('filename2', file2, [picking ids])]
         """
+        return [(filename, self._get_file(rows, configuration), picking_ids)
+                for filename, rows, picking_ids
+                in self.iter_files(pickings, configuration)]
+
+    def iter_files(self, pickings, configuration):
+        """
+        Same as generate_files but the content of the files is not
+        generated: the rows are produced lazily, one picking at a time,
+        when they are consumed by write_file.
+        This way, the memory used does not depend on the number of pickings
+        grouped in a file.
+
+        :param browse_record pickings: list of browsable pickings records
+        :param browse_record configuration: configuration of
+                                            the file to generate
+        :return: iterator of tuple with the files to create like:
+                 ('filename1', rows iterator, [picking ids])
+        """
         if configuration.group_pickings:
-            return self._generate_files_grouped(pickings, configuration)
+            return self._iter_files_grouped(pickings, configuration)
         else:
-            return self._generate_files_single(pickings, configuration)
+            return self._iter_files_single(pickings, configuration)
+
+    def write_file(self, file_handle, rows, configuration):
+        """
+        Stream the rows in a file opened by the caller, the rows are
+        written as soon as they are produced.
+
+        :param file file_handle: file to write in
+        :param rows: iterable of rows to write in the file
+        :param browse_record configuration: configuration of
+                                            the file to generate
+        :return: the file_handle with the rows written in it
+        """
+        return self._write_rows(file_handle, rows, configuration)
+
+    def _get_filename_period(self, configuration, extension='csv'):
+        """
+        Generate the filename of the file of the current period when
+        the pickings are exported incrementally: the pickings of a run
+        are appended to the file of the period.
+        Inherit and implement in subclasses.
+
+        :param browse_record configuration: configuration of
+                                            the file to generate
+        :param str extension: extension of the file to create, csv by default
+        :return: a string with the name of the file
+        """
+        period = self._filename_period(configuration.export_period)
+        return "%s_%s.%s" % ('out', period, extension)
+
+    def prefetch(self, pickings, configuration):
+        """
+        Load at once the values of columns_map for all the pickings,
+        instead of loading them picking by picking in _get_rows.
+        The values of the pickings prefetched before are dropped,
+        so the memory used does not grow with the batches exported
+        by the same generator.
+
+        :param browse_record pickings: list of browsable pickings records
+        :param browse_record configuration: configuration of
+                                            the file to generate
+        """
+        if self.columns_map:
+            self._values = self._load_values(pickings)
+
+    def _get_values(self, picking):
+        """
+        Returns the values of columns_map for a picking, loaded by
+        prefetch or read for this picking only otherwise.
+
+        :param browse_record picking: the picking for which
+                                      we generate a row in the file
+        :return: dict with the keys of columns_map
+        """
+        if picking.id not in self._values:
+            self._values.update(self._load_values(picking))
+        return self._values[picking.id]
+
+    @staticmethod
+    def _fill_line(line, values):
+        """
+        Assign the values to the fields of the line having the same name
+
+        :param BaseLine line: line to fill
+        :param dict values: values as returned by _get_values
+        """
+        for field_name in line.get_header():
+            if field_name in values:
+                setattr(line, field_name, values[field_name])
+
+    def _load_values(self, pickings):
+        """
+        Read the values of columns_map for the pickings with one
+        read per model and level of many2one.
+
+        :param browse_record pickings: recordset of pickings
+        :return: dict {picking id: {key of columns_map: value}}
+        """
+        tree = {}
+        for paths in self.columns_map.itervalues():
+            if not isinstance(paths, tuple):
+                paths = (paths,)
+            for path in paths:
+                node = tree
+                for field_name in path.split('.'):
+                    node = node.setdefault(field_name, {})
+        rows = {}
+        self._read_tree(pickings, tree, rows)
+
+        def resolve(picking_id, path):
+            model = pickings
+            record_id = picking_id
+            value = False
+            for field_name in path.split('.'):
+                if not record_id:
+                    return False
+                value = rows[(model._name, record_id)][field_name]
+                field = model._fields[field_name]
+                if field.type == 'many2one':
+                    model = model.env[field.comodel_name]
+                    record_id = value
+            return value
+
+        values = {}
+        for picking_id in pickings.ids:
+            picking_values = values[picking_id] = {}
+            for key, paths in self.columns_map.iteritems():
+                if not isinstance(paths, tuple):
+                    paths = (paths,)
+                for path in paths:
+                    value = resolve(picking_id, path)
+                    if value:
+                        break
+                picking_values[key] = value
+        return values
+
+    @classmethod
+    def _read_tree(cls, records, tree, rows):
+        """
+        Read the fields of a tree of field names on records and
+        recursively on the records of their many2one fields.
+
+        :param records: recordset to read
+        :param dict tree: {field name: tree of the related fields}
+        :param dict rows: filled with {(model, id): {field name: value}}
+        """
+        if not records:
+            return
+        model = records._name
+        for row in records.read(tree.keys(), load='_classic_write'):
+            rows.setdefault((model, row['id']), {}).update(row)
+        for field_name, subtree in tree.iteritems():
+            if not subtree:
+                continue
+            field = records._fields[field_name]
+            if field.type != 'many2one':
+                raise ValueError("Only many2one fields can be followed "
+                                 "in columns_map (%s)" % field_name)
+            related_ids = set(rows[(model, record_id)][field_name]
+                              for record_id in records.ids)
+            related_ids.discard(False)
+            related = records.env[field.comodel_name].browse(
+                list(related_ids))
+            cls._read_tree(related, subtree, rows)
 
     def _get_filename_single(self, picking, configuration, extension='csv'):
         """
@@ -113,13 +302,30 @@ class CarrierFileGenerator(object):
         """
         return NotImplementedError
 
+    def _iter_rows(self, pickings, configuration):
+        """
+        Yield the rows of the pickings, the rows of a picking
+        are only generated when the rows of the previous picking
+        have been consumed.
+
+        :param browse_record pickings: list of browsable pickings records
+        :param browse_record configuration: configuration of
+                                            the file to generate
+        :return: iterator of rows
+        """
+        for picking in pickings:
+            for row in self._get_rows(picking, configuration):
+                yield row
+
     def _write_rows(self, file_handle, rows, configuration):
         """
         Write the rows in the file (file_handle).
         Inherit and implement in subclasses.
+        The rows can be a generator, they must be written while
+        they are iterated.
 
         :param StringIO file_handle: file to write in
-        :param rows: rows to write in the file
+        :param rows: iterable of rows to write in the file
         :param browse_record configuration: configuration of
                                             the file to generate
         :return: the file_handle as StringIO with the rows written in it
@@ -147,51 +353,43 @@ class CarrierFileGenerator(object):
             file_handle.close()
         return file_content
 
-    def _generate_files_single(self, pickings, configuration):
+    def _iter_files_single(self, pickings, configuration):
         """
         Base method to generate the pickings files, one file per picking
-        It returns a list of tuple with a filename, its content and a
+        It yields a tuple with a filename, the rows of the file and a
         list of pickings ids in the file
 
         :param browse_record pickings: list of browsable pickings records
         :param browse_record configuration: configuration of
                                             the file to generate
-        :return: list of tuple with files to create like:
-                 [('filename1', file, [picking ids]),
-                  ('filename2', file2, [picking ids])]
+        :return: iterator of tuple with files to create like:
+                 ('filename1', rows iterator, [picking ids])
         """
-        files = []
         for picking in pickings:
             filename = self._get_filename_single(picking, configuration)
             filename = self.sanitize_filename(filename)
-            rows = self._get_rows(picking, configuration)
-            file_content = self._get_file(rows, configuration)
-            files.append((filename, file_content, [picking.id]))
-        return files
+            yield (filename,
+                   self._iter_rows([picking], configuration),
+                   [picking.id])
 
-    def _generate_files_grouped(self, pickings, configuration):
+    def _iter_files_grouped(self, pickings, configuration):
         """
         Base method to generate the pickings files, one file
         for all pickings
-        It returns a list of tuple with a filename, its content
-         and a list of pickings ids in the file
+        It yields a tuple with a filename, the rows of the file
+        and a list of pickings ids in the file
 
         :param browse_record pickings: list of browsable pickings records
         :param browse_record configuration: configuration of
                                             the file to generate
-        :return: list of tuple with files to create like:
-                 [('filename1', file, [picking ids]),
-                  ('filename2', file2, [picking ids])]
+        :return: iterator of tuple with files to create like:
+                 ('filename1', rows iterator, [picking ids])
         """
-        files = []
-        rows = []
         filename = self._get_filename_grouped(configuration)
         filename = self.sanitize_filename(filename)
-        for picking in pickings:
-            rows += self._get_rows(picking, configuration)
-        file_content = self._get_file(rows, configuration)
-        files.append((filename, file_content, [p.id for p in pickings]))
-        return files
+        yield (filename,
+               self._iter_rows(pickings, configuration),
+               [p.id for p in pickings])
 
 
 def new_file_generator(carrier_name):
@@ -49,6 +49,22 @@ class LaPosteFileGenerator(CarrierFileGenerator):
     def carrier_for(cls, carrier_name):
         return carrier_name == 'generic'
 
+    columns_map = {
+        'reference': 'name',
+        'name': 'partner_id.name',
+        'street1': 'partner_id.street',
+        'street2': 'partner_id.street2',
+        'zip': 'partner_id.zip',
+        'city': 'partner_id.city',
+        'state': 'partner_id.state_id.name',
+        'country_code': 'partner_id.country_id.code',
+        'phone': ('partner_id.phone', 'partner_id.mobile'),
+        'mail': 'partner_id.email',
+        'fax': 'partner_id.fax',
+        'delivery_name': 'carrier_id.name',
+        'weight': 'weight',
+    }
+
     def _get_rows(self, picking, configuration):
         """
         Returns the rows to create in the file for a picking
@@ -59,24 +75,11 @@ class LaPosteFileGenerator(CarrierFileGenerator):
                                             the file to generate
         :return: list of rows
         """
+        values = self._get_values(picking)
         line = GenericLine()
-        line.reference = picking.name
-        partner = picking.partner_id
-        if partner:
-            line.name = partner.name
-            line.contact = partner.name
-            line.street1 = partner.street
-            line.street2 = partner.street2
-            line.zip = partner.zip
-            line.city = partner.city
-            line.state = (partner.state_id and
-                          partner.state_id.name)
-            line.country_code = partner.country_id and partner.country_id.code
-            line.phone = partner.phone or partner.mobile
-            line.mail = partner.email
-            line.fax = partner.fax
-        line.delivery_name = picking.carrier_id and picking.carrier_id.name
-        line.weight = "%.2f" % (picking.weight,)
+        self._fill_line(line, values)
+        line.contact = values['name']
+        line.weight = "%.2f" % (values['weight'],)
         return [line.get_fields()]
 
     def _write_rows(self, file_handle, rows, configuration):
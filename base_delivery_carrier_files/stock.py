@@ -25,12 +25,36 @@ from openerp import models, fields, api
 class stock_picking(models.Model):
     _inherit = "stock.picking"
 
+    def init(self, cr):
+        # used by the incremental export of the carrier files
+        # only the done delivery orders not yet exported are indexed
+        cr.execute("SELECT indexname FROM pg_indexes "
+                   "WHERE indexname = 'stock_picking_carrier_file_todo_index'")
+        if not cr.fetchone():
+            cr.execute("CREATE INDEX stock_picking_carrier_file_todo_index "
+                       "ON stock_picking (date_done, id) "
+                       "WHERE state = 'done' "
+                       "AND NOT COALESCE(carrier_file_generated, false)")
+
     @api.multi
     def generate_carrier_files(self, auto=True,
                                recreate=False):
         """
         Generates all the files for a list of pickings according to
         their configuration carrier file.
+        See `_generate_carrier_files`.
+
+        :return: True
+        """
+        self._generate_carrier_files(auto=auto, recreate=recreate)
+        return True
+
+    @api.multi
+    def _generate_carrier_files(self, auto=True,
+                                recreate=False):
+        """
+        Generates all the files for a list of pickings according to
+        their configuration carrier file.
         Does nothing on pickings without carrier or without
         carrier file configuration.
         Generate files only for outgoing pickings.
@@ -41,7 +65,8 @@ class stock_picking(models.Model):
                      or called manually from the wizard. When auto is True,
                      only the carrier files set as "auto_export"
                      are exported
-        :return: True if successful
+        :return: dict {picking id: error message} of the pickings
+                 for which the file could not be written
         """
         carrier_file_ids = {}
         for picking in self:
@@ -56,39 +81,39 @@ class stock_picking(models.Model):
                 continue
             if auto and not carrier.carrier_file_id.auto_export:
                 continue
+            # exported by the scheduled action
+            if auto and carrier.carrier_file_id.incremental_export:
+                continue
             p_carrier_file_id = picking.carrier_id.carrier_file_id.id
             carrier_file_ids.setdefault(p_carrier_file_id, []).append(
                 picking.id)
 
         carrier_files = self.env["delivery.carrier.file"].browse(
             carrier_file_ids.keys())
+        failures = {}
         for carrier_file in carrier_files:
-            carrier_file.generate_files(carrier_file_ids[carrier_file.id])
-        return True
-
-    @api.multi
-    def action_done(self):
-        result = super(stock_picking, self).action_done()
-        self.generate_carrier_files(auto=True)
-        return result
+            failures.update(carrier_file._generate_files(
+                carrier_file_ids[carrier_file.id]))
+        return failures
 
     carrier_file_generated = fields.Boolean(
         'Carrier File Generated', readonly=True, copy=False,
         help="The file for the delivery carrier has been generated.")
+    carrier_file_error = fields.Text(
+        'Carrier File Error', copy=False,
+        help="The delivery order could not be appended to the carrier "
+             "file, it is exported again by the next run once this "
+             "error is removed.")
 
 
 class stock_move(models.Model):
     _inherit = 'stock.move'
 
     @api.multi
-    def write(self, values):
-        write_result = super(stock_move, self).write(values)
-        if values.get('state') and values['state'] == 'done':
-            picking_ids = map(lambda p: p.id, self.mapped('picking_id'))
-            done_pickings = self.env['stock.picking'].search([
-                ('id', 'in', picking_ids),
-                ('state', '=', 'done')
-            ])
-            if done_pickings:
-                done_pickings.generate_carrier_files()
-        return write_result
+    def action_done(self):
+        result = super(stock_move, self).action_done()
+        # the files are generated by a scheduled action,
+        # see delivery.carrier.file.event
+        self.env['delivery.carrier.file.event'].enqueue(
+            self.mapped('picking_id').ids)
+        return result
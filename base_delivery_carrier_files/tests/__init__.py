@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from . import test_file_generator
+from . import test_file_output
+from . import test_carrier_file
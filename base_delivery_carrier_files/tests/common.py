@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""
+In-memory pickings and configurations for the tests and the benchmarks
+of the file generators: the values of the rows of the pickings are
+given to the generators as if they had been prefetched.
+"""
+
+
+class FakePicking(object):
+
+    def __init__(self, picking_id):
+        self.id = picking_id
+        self.name = u'OUT/%05d' % picking_id
+
+
+class FakeConfiguration(object):
+
+    def __init__(self, group_pickings=True):
+        self.group_pickings = group_pickings
+        self.tnt_account = u'123456789'
+        self.export_period = 'day'
+
+
+def fake_values(picking):
+    """ Values of columns_map of a picking, as loaded by prefetch """
+    index = picking.id
+    return {
+        'reference': picking.name,
+        'name': u'Customer %d' % index,
+        'lastname': u'Customer %d' % index,
+        'company_name': u'Company %d' % (index % 100),
+        'title': index % 2,
+        'contact': u'Contact %d' % index,
+        'street1': u'%d, rue du Général Leclerc' % index,
+        'street2': u'Bâtiment %d' % (index % 10),
+        'zip': u'%05d' % (index % 100000),
+        'city': u'Chambéry',
+        'state': u'Savoie',
+        'country': u'FR',
+        'country_code': u'FR',
+        'country_name': u'France',
+        'phone': u'+33 4 79 00 00 %02d' % (index % 100),
+        'fax': False,
+        'vat': u'FR%011d' % index,
+        'mail': u'customer%d@example.com' % index,
+        'notes': u'La Poste Colissimo',
+        'delivery_name': u'La Poste',
+        'weight': 0.5 + index % 20,
+    }
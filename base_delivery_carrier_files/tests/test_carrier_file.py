@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from datetime import timedelta
+import os
+import shutil
+import tempfile
+
+import mock
+
+from openerp import fields
+from openerp.tests.common import TransactionCase
+
+from .. import carrier_file as carrier_file_module
+from ..generator import CarrierFileGenerator, new_file_generator
+from ..generator.generic_generator import LaPosteFileGenerator
+
+
+def file_prefix(picking):
+    """ Start of the name of the file of a picking """
+    return CarrierFileGenerator.sanitize_filename(picking.name) + '_'
+
+
+class TestCarrierFileParallel(TransactionCase):
+
+    """ Files of pickings written on the disk by a pool of workers """
+
+    def setUp(self):
+        super(TestCarrierFileParallel, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.carrier_file = self.env['delivery.carrier.file'].create({
+            'name': 'Parallel',
+            'type': 'generic',
+            'write_mode': 'disk',
+            'export_path': self.directory,
+            'write_workers': 2,
+        })
+        self.pickings = self.env['stock.picking'].browse()
+        for __ in range(3):
+            self.pickings |= self.env['stock.picking'].create({
+                'partner_id': self.ref('base.res_partner_2'),
+                'picking_type_id': self.ref('stock.picking_type_out'),
+            })
+
+    def _files(self):
+        return sorted(os.listdir(self.directory))
+
+    def _file_of(self, picking):
+        [filename] = [filename for filename in self._files()
+                      if filename.startswith(file_prefix(picking))]
+        with open(os.path.join(self.directory, filename)) as f:
+            return f.read()
+
+    def test_write_parallel(self):
+        # 2 files per chunk, the 3 files are written in 2 chunks
+        with mock.patch.object(type(self.carrier_file),
+                               '_parallel_files_per_worker', 1):
+            failures = self.carrier_file._generate_files(self.pickings.ids)
+        self.assertEqual(failures, {})
+        self.assertEqual(len(self._files()), 3)
+        for picking in self.pickings:
+            self.assertTrue(picking.carrier_file_generated)
+            self.assertTrue(
+                self._file_of(picking).startswith('"%s",' % picking.name))
+
+    def test_write_parallel_failure(self):
+        failing = self.pickings[1]
+        write_on_disk = carrier_file_module._write_on_disk
+
+        def _write_on_disk(directory, filename, write, **options):
+            if filename.startswith(file_prefix(failing)):
+                raise IOError('No space left on device')
+            return write_on_disk(directory, filename, write, **options)
+
+        with mock.patch.object(carrier_file_module, '_write_on_disk',
+                               side_effect=_write_on_disk):
+            failures = self.carrier_file._generate_files(self.pickings.ids)
+        self.assertEqual(failures, {failing.id: u'No space left on device'})
+        self.assertEqual(len(self._files()), 2)
+        self.assertFalse(failing.carrier_file_generated)
+        self.assertTrue(self.pickings[0].carrier_file_generated)
+        self.assertTrue(self.pickings[2].carrier_file_generated)
+
+    def test_generate_files(self):
+        """ generate_files returns True for each carrier file """
+        self.assertEqual(
+            self.carrier_file.generate_files(self.pickings.ids), [True])
+        self.assertEqual(len(self._files()), 3)
+
+
+class TestCarrierFileIncremental(TransactionCase):
+
+    """ Delivery orders appended to the file of the period """
+
+    def setUp(self):
+        super(TestCarrierFileIncremental, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.carrier_file = self.env['delivery.carrier.file'].create({
+            'name': 'Incremental',
+            'type': 'generic',
+            'write_mode': 'disk',
+            'export_path': self.directory,
+            'incremental_export': True,
+            'export_period': 'month',
+        })
+        self.carrier = self.env.ref('delivery.free_delivery_carrier')
+        self.carrier.carrier_file_id = self.carrier_file
+
+    def _done_picking(self, date_done=None):
+        picking = self.env['stock.picking'].create({
+            'partner_id': self.ref('base.res_partner_2'),
+            'picking_type_id': self.ref('stock.picking_type_out'),
+            'carrier_id': self.carrier.id,
+        })
+        # the state of a picking is computed from its moves
+        self.env.cr.execute(
+            "UPDATE stock_picking SET state = 'done', date_done = %s "
+            "WHERE id = %s",
+            (date_done or self.carrier_file.incremental_start_date,
+             picking.id))
+        picking.invalidate_cache()
+        return picking
+
+    def _exported_names(self):
+        filename = new_file_generator('generic')._get_filename_period(
+            self.carrier_file)
+        self.assertEqual(os.listdir(self.directory), [filename])
+        with open(os.path.join(self.directory, filename)) as f:
+            return [line.split(',')[0].strip('"')
+                    for line in f.read().splitlines()]
+
+    def test_export(self):
+        before = self._done_picking(date_done='2000-01-01 00:00:00')
+        first = self._done_picking() | self._done_picking()
+        self.assertEqual(
+            self.carrier_file._export_new_pickings(commit=False), 2)
+        self.assertEqual(self._exported_names(), first.mapped('name'))
+        # the rows of the second run are appended
+        second = self._done_picking()
+        self.assertEqual(
+            self.carrier_file._export_new_pickings(commit=False), 1)
+        self.assertEqual(self._exported_names(),
+                         (first | second).mapped('name'))
+        self.assertTrue(all((first | second).mapped(
+            'carrier_file_generated')))
+        # done before the activation of the incremental export
+        self.assertFalse(before.carrier_file_generated)
+        self.assertEqual(
+            self.carrier_file._export_new_pickings(commit=False), 0)
+
+    def test_export_late_picking(self):
+        """ A delivery order committed after the export of the ones
+        done after it is exported by the next run """
+        start = fields.Datetime.from_string(
+            self.carrier_file.incremental_start_date)
+        first = self._done_picking(date_done=fields.Datetime.to_string(
+            start + timedelta(minutes=1)))
+        self.carrier_file._export_new_pickings(commit=False)
+        late = self._done_picking(date_done=fields.Datetime.to_string(start))
+        self.assertEqual(
+            self.carrier_file._export_new_pickings(commit=False), 1)
+        self.assertEqual(self._exported_names(),
+                         (first | late).mapped('name'))
+
+    def test_export_failure(self):
+        """ The rows are not appended when the batch fails """
+        first = self._done_picking()
+        self.carrier_file._export_new_pickings(commit=False)
+        second = self._done_picking()
+        write = type(self.carrier_file).write
+
+        def failing_write(records, vals):
+            if 'last_export_date' in vals:
+                raise IOError('Connection lost')
+            return write(records, vals)
+
+        with self.assertRaises(IOError):
+            with self.env.cr.savepoint():
+                with mock.patch.object(type(self.carrier_file), 'write',
+                                       failing_write):
+                    self.carrier_file._export_new_pickings(commit=False)
+        self.env.invalidate_all()
+        self.assertEqual(self._exported_names(), first.mapped('name'))
+        self.assertFalse(second.carrier_file_generated)
+        # exported once by the next run
+        self.carrier_file._export_new_pickings(commit=False)
+        self.assertEqual(self._exported_names(),
+                         (first | second).mapped('name'))
+
+    def test_export_failing_picking(self):
+        """ A delivery order whose rows fail does not block the others """
+        pickings = self._done_picking() | self._done_picking()
+        failing = self._done_picking()
+        pickings |= self._done_picking()
+        get_rows = LaPosteFileGenerator._get_rows
+
+        def _get_rows(generator, picking, configuration):
+            if picking == failing:
+                raise ValueError('No address')
+            return get_rows(generator, picking, configuration)
+
+        with mock.patch.object(LaPosteFileGenerator, '_get_rows',
+                               _get_rows):
+            self.assertEqual(
+                self.carrier_file._export_new_pickings(commit=False), 3)
+        self.assertEqual(self._exported_names(), pickings.mapped('name'))
+        self.assertTrue(all(pickings.mapped('carrier_file_generated')))
+        self.assertFalse(failing.carrier_file_generated)
+        self.assertEqual(failing.carrier_file_error, u'No address')
+        # skipped until the error is removed
+        self.assertEqual(
+            self.carrier_file._export_new_pickings(commit=False), 0)
+        failing.carrier_file_error = False
+        self.assertEqual(
+            self.carrier_file._export_new_pickings(commit=False), 1)
+        self.assertEqual(self._exported_names(),
+                         (pickings | failing).mapped('name'))
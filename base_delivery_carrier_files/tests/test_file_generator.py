@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import unittest
+try:
+    import cStringIO as StringIO
+except ImportError:
+    import StringIO
+
+from ..generator import new_file_generator
+from .common import FakeConfiguration, FakePicking, fake_values
+
+
+class TestFileGenerator(unittest.TestCase):
+
+    """ The files streamed by iter_files and write_file are the
+    ones generated in memory """
+
+    def setUp(self):
+        super(TestFileGenerator, self).setUp()
+        self.generator = new_file_generator('generic')
+        self.generator._filename_date = lambda timestamp=None: (
+            '20120214_094435')
+        self.pickings = [FakePicking(index) for index in range(1, 4)]
+        self.generator._values = dict(
+            (picking.id, fake_values(picking)) for picking in self.pickings)
+
+    def _stream_files(self, configuration):
+        files = []
+        for filename, rows, picking_ids in self.generator.iter_files(
+                self.pickings, configuration):
+            file_handle = StringIO.StringIO()
+            self.generator.write_file(file_handle, rows, configuration)
+            files.append((filename, file_handle.getvalue(), picking_ids))
+        return files
+
+    def _rows_content(self, pickings, configuration):
+        """ Content of a file with all its rows given at once """
+        rows = []
+        for picking in pickings:
+            rows += self.generator._get_rows(picking, configuration)
+        return self.generator._get_file(rows, configuration)
+
+    def test_single(self):
+        configuration = FakeConfiguration(False)
+        files = self._stream_files(configuration)
+        self.assertEqual(
+            files,
+            [('OUT%05d_20120214_094435.csv' % picking.id,
+              self._rows_content([picking], configuration),
+              [picking.id])
+             for picking in self.pickings])
+        self.assertEqual(
+            files, self.generator.generate_files(self.pickings,
+                                                 configuration))
+
+    def test_grouped(self):
+        configuration = FakeConfiguration(True)
+        files = self._stream_files(configuration)
+        content = self._rows_content(self.pickings, configuration)
+        self.assertEqual(files, [('out_20120214_094435.csv', content,
+                                  [1, 2, 3])])
+        self.assertEqual(
+            files, self.generator.generate_files(self.pickings,
+                                                 configuration))
+        self.assertEqual(len(content.splitlines()), 3)
+        self.assertTrue(content.startswith(
+            '"OUT/00001","Customer 1","Customer 1","1, rue du G'))
+
+    def test_prefetch_batches(self):
+        """ Only the values of the last batch prefetched are kept """
+        configuration = FakeConfiguration(True)
+        self.generator._load_values = lambda pickings: dict(
+            (picking.id, fake_values(picking)) for picking in pickings)
+        self.generator.prefetch(self.pickings[:2], configuration)
+        self.generator.prefetch(self.pickings[2:], configuration)
+        self.assertEqual(self.generator._values.keys(), [3])
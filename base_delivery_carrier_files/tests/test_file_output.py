@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from ..file_output import FileOutput
+
+
+class TestFileOutput(unittest.TestCase):
+
+    def setUp(self):
+        super(TestFileOutput, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(TestFileOutput, self).tearDown()
+
+    def _write(self, rows, **options):
+        output = FileOutput(self.directory, 'out.csv', **options)
+        for row in rows:
+            output.write(row)
+        return output.close()
+
+    def _read(self, filename):
+        with open(os.path.join(self.directory, filename), 'rb') as f:
+            return f.read()
+
+    def _read_gzip(self, filename):
+        archive = gzip.open(os.path.join(self.directory, filename), 'rb')
+        try:
+            return archive.read()
+        finally:
+            archive.close()
+
+    def _files(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_write(self):
+        filenames = self._write(['a;1\n', 'b;2\n'])
+        self.assertEqual(filenames, ['out.csv'])
+        self.assertEqual(self._files(), ['out.csv'])
+        self.assertEqual(self._read('out.csv'), 'a;1\nb;2\n')
+
+    def test_gzip(self):
+        filenames = self._write(['a;1\n', 'b;2\n'], compression='gzip')
+        self.assertEqual(filenames, ['out.csv.gz'])
+        self.assertEqual(self._files(), ['out.csv.gz'])
+        self.assertEqual(self._read_gzip('out.csv.gz'), 'a;1\nb;2\n')
+
+    def test_zip(self):
+        filenames = self._write(['a;1\n', 'b;2\n'], compression='zip')
+        self.assertEqual(filenames, ['out.zip'])
+        self.assertEqual(self._files(), ['out.zip'])
+        archive = zipfile.ZipFile(os.path.join(self.directory, 'out.zip'))
+        try:
+            self.assertEqual(archive.namelist(), ['out.csv'])
+            self.assertEqual(archive.read('out.csv'), 'a;1\nb;2\n')
+        finally:
+            archive.close()
+
+    def test_rotation(self):
+        """ The files are split between two rows """
+        filenames = self._write(['a;1\n', 'b;2\n', 'c;3\n', 'd;4\n', 'e;5\n'],
+                                max_size=10)
+        self.assertEqual(filenames, ['out.csv', 'out_2.csv', 'out_3.csv'])
+        self.assertEqual(self._read('out.csv'), 'a;1\nb;2\n')
+        self.assertEqual(self._read('out_2.csv'), 'c;3\nd;4\n')
+        self.assertEqual(self._read('out_3.csv'), 'e;5\n')
+
+    def test_abort(self):
+        output = FileOutput(self.directory, 'out.csv')
+        output.write('a;1\n')
+        output.abort()
+        self.assertEqual(self._files(), [])
+
+    def test_append(self):
+        self.assertEqual(self._write(['a;1\n'], append=True), ['out.csv'])
+        self.assertEqual(self._write(['b;2\n'], append=True), ['out.csv'])
+        self.assertEqual(self._files(), ['out.csv'])
+        self.assertEqual(self._read('out.csv'), 'a;1\nb;2\n')
+
+    def test_append_gzip(self):
+        """ The rows appended are in a new member of the gzip file """
+        self._write(['a;1\n'], compression='gzip', append=True)
+        self._write(['b;2\n'], compression='gzip', append=True)
+        self.assertEqual(self._files(), ['out.csv.gz'])
+        self.assertEqual(self._read_gzip('out.csv.gz'), 'a;1\nb;2\n')
+
+    def test_append_rotation(self):
+        """ The rows are appended to the last part """
+        self._write(['a;1\n', 'b;2\n', 'c;3\n'], max_size=10)
+        filenames = self._write(['d;4\n', 'e;5\n'], max_size=10, append=True)
+        self.assertEqual(filenames, ['out_2.csv', 'out_3.csv'])
+        self.assertEqual(self._read('out.csv'), 'a;1\nb;2\n')
+        self.assertEqual(self._read('out_2.csv'), 'c;3\nd;4\n')
+        self.assertEqual(self._read('out_3.csv'), 'e;5\n')
+
+    def test_append_abort(self):
+        """ The file is unchanged when an append is aborted """
+        self._write(['a;1\n'])
+        output = FileOutput(self.directory, 'out.csv', append=True)
+        output.write('b;2\n')
+        self.assertEqual(self._read('out.csv'), 'a;1\n')
+        output.abort()
+        self.assertEqual(self._files(), ['out.csv'])
+        self.assertEqual(self._read('out.csv'), 'a;1\n')
+
+    def test_append_new_rows_only(self):
+        """ Only the rows appended are in the temporary file """
+        self._write(['a;1\n'])
+        output = FileOutput(self.directory, 'out.csv', append=True)
+        output.write('b;2\n')
+        output.close(commit=False)
+        self.assertEqual(self._read('.out.csv.part'), 'b;2\n')
+        output.commit()
+        self.assertEqual(self._files(), ['out.csv'])
+        self.assertEqual(self._read('out.csv'), 'a;1\nb;2\n')
+
+    def test_append_zip(self):
+        with self.assertRaises(ValueError):
+            FileOutput(self.directory, 'out.csv', compression='zip',
+                       append=True)
+
+    def test_close_without_commit(self):
+        """ The files are only renamed by commit """
+        output = FileOutput(self.directory, 'out.csv', max_size=10)
+        for row in ['a;1\n', 'b;2\n', 'c;3\n']:
+            output.write(row)
+        self.assertEqual(output.close(commit=False), ['out.csv', 'out_2.csv'])
+        self.assertEqual(self._files(), ['.out.csv.part', '.out_2.csv.part'])
+        output.commit()
+        self.assertEqual(self._files(), ['out.csv', 'out_2.csv'])
+        self.assertEqual(self._read('out_2.csv'), 'c;3\n')
+
+    def test_abort_after_close(self):
+        """ The rows appended are dropped when aborted before commit """
+        self._write(['a;1\n'])
+        output = FileOutput(self.directory, 'out.csv', append=True)
+        output.write('b;2\n')
+        output.close(commit=False)
+        output.abort()
+        self.assertEqual(self._files(), ['out.csv'])
+        self.assertEqual(self._read('out.csv'), 'a;1\n')
+
+    def _rows(self, count):
+        return ['%d;%s\n' % (index, str(index * 7919) * 5)
+                for index in range(count)]
+
+    def test_rotation_compressed(self):
+        """ The compressed parts don't exceed max_size """
+        rows = self._rows(2000)
+        for compression in ('gzip', 'zip'):
+            filenames = self._write(rows, compression=compression,
+                                    max_size=4096)
+            self.assertGreater(len(filenames), 1)
+            content = ''
+            for filename in filenames:
+                path = os.path.join(self.directory, filename)
+                self.assertLessEqual(os.path.getsize(path), 4096)
+                if compression == 'gzip':
+                    content += self._read_gzip(filename)
+                else:
+                    archive = zipfile.ZipFile(path)
+                    try:
+                        self.assertIsNone(archive.testzip())
+                        content += archive.read(archive.namelist()[0])
+                    finally:
+                        archive.close()
+            self.assertEqual(content, ''.join(rows))
+
+    def test_zip_streamed(self):
+        """ The zip member is compressed while the rows are written """
+        output = FileOutput(self.directory, 'out.csv', compression='zip')
+        output.write('a;1\n' * 10000)
+        self.assertEqual(self._files(), ['.out.zip.part'])
+        self.assertLess(
+            os.path.getsize(os.path.join(self.directory, '.out.zip.part')),
+            10000)
+        output.close()
+        self.assertEqual(self._files(), ['out.zip'])
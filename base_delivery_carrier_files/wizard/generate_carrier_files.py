@@ -42,9 +42,21 @@ class DeliveryCarrierFileGenerate(models.TransientModel):
         """
         if not self.pickings:
             raise exceptions.Warning(_('No delivery orders selected'))
-        self.pickings.generate_carrier_files(
+        failures = self.pickings._generate_carrier_files(
             auto=False, recreate=self.recreate)
-        return {'type': 'ir.actions.act_window_close'}
+        if not failures:
+            return {'type': 'ir.actions.act_window_close'}
+        pickings = self.env['stock.picking'].browse(failures.keys())
+        self.report = '\n'.join(
+            u'%s: %s' % (picking.name, failures[picking.id])
+            for picking in pickings)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
 
     pickings = fields.Many2many('stock.picking',
                                 string='Delivery Orders',
@@ -56,3 +68,6 @@ class DeliveryCarrierFileGenerate(models.TransientModel):
               "for selected picking even if they already had one.\n"
               "By default, delivery orders with existing file will be "
               "skipped."))
+    report = fields.Text(
+        'Errors', readonly=True,
+        help="Delivery orders for which the file could not be generated.")
@@ -22,6 +22,7 @@
 #
 ##############################################################################
 from openerp import models, fields, api, _
+from openerp.tools import float_round, ustr
 from openerp.exceptions import Warning as UserError
 import openerp.addons.decimal_precision as dp
 import logging
@@ -29,6 +30,37 @@ import logging
 _logger = logging.getLogger(__name__)
 
 
+def _weight_precision(env):
+    """Digits of the weights, read once from the current cursor."""
+    return dp.get_precision('Stock Weight')(env.cr)[1]
+
+
+def _write_weights(records, weights, precision=None):
+    """Save the weights of records with one write per distinct weight.
+
+    The weights are saved with `write`, so the overrides of write,
+    the access rights and the recomputation of the fields depending on
+    the weight are applied, but the records with the same weight are
+    written together.
+
+    params:
+        records: recordset having a weight field
+        weights: dict with record ids as keys and weights as values,
+            a None weight is saved as 0
+        precision: digits of the weights, see `_weight_precision`
+    """
+    if not weights:
+        return
+    if precision is None:
+        precision = _weight_precision(records.env)
+    ids_by_weight = {}
+    for record_id, weight in weights.iteritems():
+        weight = float_round(weight or 0., precision_digits=precision)
+        ids_by_weight.setdefault(weight, []).append(record_id)
+    for weight, record_ids in ids_by_weight.iteritems():
+        records.browse(record_ids).write({'weight': weight})
+
+
 class StockPackOperation(models.Model):
     _inherit = 'stock.pack.operation'
 
@@ -41,37 +73,88 @@ class StockPackOperation(models.Model):
     def get_weight(self):
         """Calc and save weight of pack.operations.
 
-        Warning: Type conversion not implemented
-                it will return False if at least one uom or uos not in kg
+        Warning: it will return False if the weight of at least one
+                operation can't be computed, see `_compute_weights`
         return:
             the sum of the weight of [self]
         """
-        total_weight = 0
-        kg = self.env.ref('product.product_uom_kgm').id
-        units = self.env.ref('product.product_uom_unit').id
-        allowed = (False, kg, units)
-        cant_calc_total = False
+        weights = self._compute_weights()
+        _write_weights(self, weights)
+        if None in weights.values():
+            return False
+        return sum(weights.itervalues())
+
+    @api.multi
+    def _compute_weights(self):
+        """Compute the weight in kg of many operations at once.
 
+        The products and units of measure are read once for all the
+        operations.
+        The quantity is converted in the unit of measure of the product
+        and multiplied by the weight of the product. When the product
+        has no weight or is in another category of unit, a quantity
+        expressed in a weight unit of measure is converted in kg.
+
+        return:
+            dict with operation ids as keys and weights as values,
+            None when the unit of measure of the operation is neither a
+            weight nor in the category of the unit of measure of the
+            product
+        """
+        kg = self.env.ref('product.product_uom_kgm')
+        uoms = (self.mapped('product_uom_id') |
+                self.mapped('product_id.uom_id') |
+                kg)
+        factors = dict((uom.id, (uom.factor, uom.category_id.id))
+                       for uom in uoms)
+        kg_factor, weight_category = factors[kg.id]
+
+        weights = {}
         for operation in self:
             product = operation.product_id
-
-            # if not defined we assume it's in kg
-            if not (
-                product.uom_id.id in allowed or
-                product.uos_id.id in allowed
-            ):
+            if not product:
+                weights[operation.id] = 0.
+                continue
+            uom = operation.product_uom_id or product.uom_id
+            factor, category = factors[uom.id]
+            # quantity in the reference unit of measure of the category
+            ref_qty = operation.product_qty / factor
+            product_factor, product_category = factors[product.uom_id.id]
+            if category == product_category and (
+                    product.weight or category != weight_category):
+                weights[operation.id] = (product.weight * ref_qty *
+                                         product_factor)
+            elif category == weight_category:
+                weights[operation.id] = ref_qty * kg_factor
+            else:
                 _logger.warning(
                     'Type conversion not implemented for product %s' %
                     product.id)
-                cant_calc_total = True
+                weights[operation.id] = None
+        return weights
 
-            operation.weight = (product.weight * operation.product_qty)
-
-            total_weight += operation.weight
+    @api.multi
+    def _sum_weights(self, weights, field):
+        """Sum the weights of the operations grouped by a many2one field.
 
-        if cant_calc_total:
-            return False
-        return total_weight
+        params:
+            weights: as returned by `_compute_weights`
+            field: name of the many2one, like 'picking_id' or
+                'result_package_id'
+        return:
+            dict with the ids of the related records as keys and the
+            sum of the weights as values, False when one of the weights
+            is None
+        """
+        totals = {}
+        for operation in self:
+            key = operation[field].id
+            weight = weights[operation.id]
+            if weight is None or totals.get(key, 0.) is False:
+                totals[key] = False
+            else:
+                totals[key] = totals.get(key, 0.) + weight
+        return totals
 
 
 class StockQuantPackage(models.Model):
@@ -112,39 +195,106 @@ class StockQuantPackage(models.Model):
         Then I put PACK65 and PACK66 in the PACK67 having a box that
         weights 0.5kg, the weight of PACK67 should be: 13.5kg
 
+        The weights of the packages, of their children and of their
+        pack operations are computed and saved at once, see
+        `_compute_weights`.
+
         """
-        total_weight = 0
+        weights = self._compute_weights()
+        return sum(weights[package.id] for package in self)
 
-        for package in self:
-            # weight of the wrapper
-            packaging_weight = 0
-            if package.ul_id:
-                packaging_weight = package.ul_id.weight
+    @api.multi
+    def _get_package_tree(self):
+        """ Get the packages and all their descendants with one query
 
-            # package.pack_operations would be too easy
-            operations = self.env['stock.pack.operation'].search(
-                [('result_package_id', '=', package.id),
-                 ('product_id', '!=', False),
-                 ])
+        :return: list of tuples (package id, parent id, weight of the
+                 logistic unit)
 
-            # we make use get_weight with  @api.muli instead of
-            # sum([op.get_weight for op in operations])
+        """
+        self.env.cr.execute(
+            "WITH RECURSIVE tree(id) AS ("
+            "    SELECT id FROM stock_quant_package WHERE id IN %s "
+            "    UNION "
+            "    SELECT child.id FROM stock_quant_package child "
+            "    JOIN tree ON child.parent_id = tree.id"
+            ") "
+            "SELECT package.id, package.parent_id, COALESCE(ul.weight, 0) "
+            "FROM stock_quant_package package "
+            "JOIN tree ON tree.id = package.id "
+            "LEFT JOIN product_ul ul ON ul.id = package.ul_id",
+            (tuple(self.ids),)
+        )
+        return self.env.cr.fetchall()
 
-            # sum of the pack_operation
-            payload_weight = operations.get_weight()
+    @api.multi
+    def _compute_payload_weights(self, precision=None):
+        """ Compute and save the weight of the pack operations of the
+        packages at once
+
+        As in `StockPackOperation.get_weight`, the payload of a package
+        is 0 when the weight of one of its operations can't be computed.
 
-            # sum of the packages contained in this package (children)
-            child_packages_weight = package.children_ids.get_weight()
+        :param precision: digits of the weights, read when not given
+        :return: dict with package ids as keys and payload weights as values
 
-            # sum and save in package
-            package.weight = (
-                payload_weight +
-                child_packages_weight +
-                packaging_weight)
+        """
+        operations = self.env['stock.pack.operation'].search(
+            [('result_package_id', 'in', self.ids),
+             ('product_id', '!=', False),
+             ])
+        weights = operations._compute_weights()
+        _write_weights(operations, weights, precision=precision)
+        payloads = dict.fromkeys(self.ids, 0.)
+        totals = operations._sum_weights(weights, 'result_package_id')
+        for package_id, total in totals.iteritems():
+            payloads[package_id] = total or 0.
+        return payloads
 
-            total_weight += package.weight
+    @api.multi
+    def _compute_weights(self):
+        """ Compute and save the weights of the packages and their children
 
-        return total_weight
+        The whole tree of packages is read at once, the weights are
+        summed bottom-up and saved with one write per distinct weight,
+        see `_write_weights`.
+
+        :return: dict with package ids as keys and weights as values
+
+        """
+        if not self.ids:
+            return {}
+        precision = _weight_precision(self.env)
+        tree = self._get_package_tree()
+        packages = self.browse([row[0] for row in tree])
+        weights = packages._compute_payload_weights(precision=precision)
+        parents = {}
+        for package_id, parent_id, ul_weight in tree:
+            weights[package_id] += float(ul_weight)
+            parents[package_id] = parent_id
+
+        # depth of the packages in the tree, to add the weight of the
+        # children to their parent before the parent is added to its own
+        depths = {}
+        for package_id in parents:
+            chain = []
+            current = package_id
+            while current in parents and current not in depths:
+                chain.append(current)
+                current = parents[current]
+            depth = depths.get(current, -1)
+            for node in reversed(chain):
+                depth += 1
+                depths[node] = depth
+        for package_id in sorted(depths, key=depths.get, reverse=True):
+            # rounded as it would be when saved through the ORM
+            weights[package_id] = float_round(weights[package_id],
+                                              precision_digits=precision)
+            parent_id = parents[package_id]
+            if parent_id in weights:
+                weights[parent_id] += weights[package_id]
+
+        _write_weights(packages, weights, precision=precision)
+        return weights
 
     @api.multi
     def get_operations(self):
@@ -230,6 +380,92 @@ class StockPicking(models.Model):
             labels.append(pack_label)
         return labels
 
+    @api.multi
+    def _get_shipping_label_values(self, package_ids=None,
+                                   batch_result=None):
+        """ Call the carrier and prepare the values of the labels
+
+        :param package_ids: optional list of ``stock.quant.package`` ids
+                            only packs in this list will have their label
+                            printed (all are generated when None)
+        :param batch_result: in a batch, the result of the picking
+                             returned by `_call_carriers_batch`, it is
+                             used by the carrier modules implementing it
+
+        :return: list of dict of values for ``shipping.label`` records
+
+        """
+        self.ensure_one()
+        if package_ids:
+            shipping_labels = self.generate_shipping_labels(
+                package_ids=package_ids
+            )
+        else:
+            shipping_labels = self.generate_shipping_labels()
+        return self._prepare_shipping_label_values(shipping_labels)
+
+    @api.multi
+    def _get_batch_package_ids(self, package_ids, packages_by_picking):
+        """ In a batch, keep only the given packages of the picking
+
+        :param package_ids: see `generate_labels_batch`
+        :param packages_by_picking: packages of the pickings of the batch,
+                                    as returned by `_get_packages_by_picking`
+
+        """
+        self.ensure_one()
+        if not package_ids:
+            return package_ids
+        picking_package_ids = packages_by_picking[self.id].ids
+        return [package_id for package_id in package_ids
+                if package_id in picking_package_ids]
+
+    @api.multi
+    def _prepare_shipping_label_values(self, shipping_labels):
+        """ Prepare the values of the ``shipping.label`` records
+
+        :param shipping_labels: labels as returned by
+                                `generate_shipping_labels`
+
+        """
+        self.ensure_one()
+        values = []
+        for label in shipping_labels:
+            data = {
+                'name': label['name'],
+                'res_id': self.id,
+                'res_model': 'stock.picking',
+                'datas': label['file'].encode('base64'),
+                'file_type': label['file_type'],
+            }
+            if label.get('package_id'):
+                data['package_id'] = label['package_id']
+            values.append(data)
+        return values
+
+    @api.model
+    def _create_shipping_labels(self, values):
+        """ Create the ``shipping.label`` records from a list of values
+
+        The ORM has no multi-records create, so the records are created
+        one by one, but the computed fields are recomputed once for all
+        of them.
+
+        """
+        label_obj = self.env['shipping.label']
+        context_attachment = self.env.context.copy()
+        # remove default_type setted for stock_picking
+        # as it would try to define default value of attachement
+        if 'default_type' in context_attachment:
+            del context_attachment['default_type']
+        label_obj = label_obj.with_context(context_attachment)
+        labels = label_obj.browse()
+        with self.env.norecompute():
+            for data in values:
+                labels |= label_obj.create(data)
+        label_obj.recompute()
+        return labels
+
     @api.multi
     def generate_labels(self, package_ids=None):
         """ Generate the labels.
@@ -238,33 +474,116 @@ class StockPicking(models.Model):
         the labels only of these packages.
 
         """
-        label_obj = self.env['shipping.label']
-
         for pick in self:
-            if package_ids:
-                shipping_labels = pick.generate_shipping_labels(
-                    package_ids=package_ids
-                )
-            else:
-                shipping_labels = pick.generate_shipping_labels()
-            for label in shipping_labels:
-                data = {
-                    'name': label['name'],
-                    'res_id': pick.id,
-                    'res_model': 'stock.picking',
-                    'datas': label['file'].encode('base64'),
-                    'file_type': label['file_type'],
-                }
-                if label.get('package_id'):
-                    data['package_id'] = label['package_id']
-                context_attachment = self.env.context.copy()
-                # remove default_type setted for stock_picking
-                # as it would try to define default value of attachement
-                if 'default_type' in context_attachment:
-                    del context_attachment['default_type']
-                label_obj.with_context(context_attachment).create(data)
+            values = pick._get_shipping_label_values(package_ids=package_ids)
+            self._create_shipping_labels(values)
         return True
 
+    @api.multi
+    def _prefetch_label_data(self):
+        """ Load in cache the data commonly used by the label generators
+
+        Reading the fields on the whole recordset avoids one query per
+        picking when the carrier modules browse them afterwards.
+        Inherit it to add the data specific to a carrier.
+
+        :return: the packages of the pickings, as returned by
+                 `_get_packages_by_picking`
+
+        """
+        self.mapped('carrier_id')
+        self.mapped('option_ids.tmpl_option_id')
+        self.mapped('partner_id.country_id')
+        self.mapped('company_id.partner_id')
+        return self._get_packages_by_picking()
+
+    @api.multi
+    def _call_carriers_batch(self, package_ids=None,
+                             packages_by_picking=None):
+        """ Request the labels of many pickings of a carrier type at once
+
+        Called by `generate_labels_batch` before the labels of the
+        pickings are generated one by one. Inherit it when a carrier
+        accepts requests for many pickings, or to run the calls of the
+        pickings concurrently. The threads must not use the ORM, so
+        the requests have to be prepared before and their responses
+        handled after, in the current thread.
+
+        The default implementation does not call anything: the generic
+        `generate_shipping_labels` of the carrier modules use the ORM,
+        so their calls are made one picking at a time by
+        `_get_shipping_label_values`.
+
+        :param package_ids: see `generate_labels_batch`
+        :param packages_by_picking: packages of the pickings, as returned
+                                    by `_prefetch_label_data`
+        :return: dict with the picking ids as keys and the carrier
+                 results as values, given to `_get_shipping_label_values`
+
+        """
+        return {}
+
+    @api.multi
+    def generate_labels_batch(self, package_ids=None):
+        """ Generate the labels of many pickings at once.
+
+        The pickings are grouped by carrier type and the data they need
+        is loaded up front. Each picking is processed in its own
+        savepoint, so a failure on one of them does not prevent the
+        labels of the others from being generated. When the carrier
+        call of a whole group fails, its error is reported for each
+        picking of the group and the other groups are still processed.
+        The ``shipping.label`` records are all created once the carriers
+        have been called.
+
+        :param package_ids: optional list of ``stock.quant.package`` ids
+                            only packs in this list will have their label
+                            printed (all are generated when None)
+
+        :return: dict with the picking ids as keys and as values
+                 False when the labels have been generated or
+                 the error message otherwise
+
+        """
+        report = {}
+        values = []
+        pickings_by_type = {}
+        for pick in self:
+            pickings_by_type.setdefault(pick.carrier_type, []).append(pick.id)
+        for carrier_type, picking_ids in pickings_by_type.iteritems():
+            pickings = self.browse(picking_ids)
+            packages_by_picking = pickings._prefetch_label_data()
+            try:
+                with self.env.cr.savepoint():
+                    batch_results = pickings._call_carriers_batch(
+                        package_ids=package_ids,
+                        packages_by_picking=packages_by_picking)
+            except Exception as err:
+                _logger.exception('Label generation failed for '
+                                  'pickings %s', pickings.mapped('name'))
+                report.update(dict.fromkeys(pickings.ids, ustr(err)))
+                continue
+            for pick in pickings:
+                pick_package_ids = pick._get_batch_package_ids(
+                    package_ids, packages_by_picking)
+                if package_ids and not pick_package_ids:
+                    # no label to print for this picking
+                    report[pick.id] = False
+                    continue
+                try:
+                    with self.env.cr.savepoint():
+                        values += pick._get_shipping_label_values(
+                            package_ids=pick_package_ids,
+                            batch_result=batch_results.get(pick.id))
+                except Exception as err:
+                    _logger.exception('Label generation failed for '
+                                      'picking %s', pick.name)
+                    report[pick.id] = ustr(err)
+                else:
+                    report[pick.id] = False
+        self._create_shipping_labels(values)
+        return report
+
     @api.multi
     def action_generate_carrier_label(self):
         """ Method for the 'Generate Label' button.
@@ -328,22 +647,50 @@ class StockPicking(models.Model):
 
     @api.multi
     @api.returns('stock.quant.package')
-    def _get_packages_from_picking(self):
-        """ Get all the packages from the picking """
+    def _get_packages_from_picking(self, packages_by_picking=None):
+        """ Get all the packages from the picking
+
+        :param packages_by_picking: optional packages of many pickings
+                                    loaded at once, as returned by
+                                    `_get_packages_by_picking`
+
+        """
         self.ensure_one()
-        operation_obj = self.env['stock.pack.operation']
-        packages = self.env['stock.quant.package'].browse()
-        operations = operation_obj.search(
-            ['|',
-             ('package_id', '!=', False),
-             ('result_package_id', '!=', False),
-             ('picking_id', '=', self.id)]
+        if packages_by_picking is not None and \
+                self.id in packages_by_picking:
+            return packages_by_picking[self.id]
+        return self._get_packages_by_picking()[self.id]
+
+    @api.multi
+    def _get_packages_by_picking(self):
+        """ Get the packages of many pickings with a single query
+
+        :return: dict with the picking ids as keys and the
+                 ``stock.quant.package`` recordsets as values
+
+        """
+        package_obj = self.env['stock.quant.package']
+        result = dict((picking_id, package_obj.browse())
+                      for picking_id in self.ids)
+        if not self.ids:
+            return result
+        # Take the destination package. If empty, the package is
+        # moved so take the source one.
+        self.env.cr.execute(
+            "SELECT DISTINCT picking_id, "
+            "       COALESCE(result_package_id, package_id) "
+            "FROM stock_pack_operation "
+            "WHERE picking_id IN %s "
+            "AND (package_id IS NOT NULL OR result_package_id IS NOT NULL) "
+            "ORDER BY 1, 2",
+            (tuple(self.ids),)
         )
-        for operation in operations:
-            # Take the destination package. If empty, the package is
-            # moved so take the source one.
-            packages |= operation.result_package_id or operation.package_id
-        return packages
+        rows = self.env.cr.fetchall()
+        # browse all the packages together to share the prefetching
+        packages = package_obj.browse([row[1] for row in rows])
+        for picking_id, package_id in rows:
+            result[picking_id] |= packages.browse(package_id)
+        return result
 
     @api.multi
     def write(self, vals):
@@ -396,12 +743,12 @@ class StockPicking(models.Model):
     def set_pack_weight(self):
         # I cannot loop on the "quant_ids" of packages, because, at this step,
         # this field doesn't have a value yet
-        self.ensure_one()
-        for packop in self.pack_operation_ids:
-            package = packop.result_package_id or packop.package_id
-            if package:
-                weight = package.get_weight()
-                package.write({'weight': weight})
+        packages = self.env['stock.quant.package'].browse()
+        for picking_packages in self._get_packages_by_picking().itervalues():
+            packages |= picking_packages
+        # the weights of the packages of all the pickings are computed
+        # at once
+        packages._compute_weights()
         return
 
     @api.multi
@@ -1 +1,2 @@
 from . import test_get_weight
+from . import test_generate_labels_batch
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import mock
+
+from openerp.exceptions import Warning as UserError
+from openerp.tests.common import TransactionCase
+
+
+class TestGenerateLabelsBatch(TransactionCase):
+    """Test the label generation of many pickings at once."""
+
+    def setUp(self):
+        super(TestGenerateLabelsBatch, self).setUp()
+        picking_type = self.env.ref('stock.picking_type_out')
+        partner = self.env.ref('base.res_partner_12')
+        carrier = self.env.ref('delivery.free_delivery_carrier')
+        self.pickings = self.env['stock.picking'].browse()
+        for values in ({'carrier_id': carrier.id},
+                       {'carrier_id': carrier.id},
+                       {}):
+            values.update(partner_id=partner.id,
+                          picking_type_id=picking_type.id)
+            self.pickings |= self.env['stock.picking'].create(values)
+        self.failing = self.pickings[1]
+
+    def _get_labels(self, picking):
+        return self.env['shipping.label'].search(
+            [('res_id', '=', picking.id),
+             ('res_model', '=', 'stock.picking')])
+
+    def test_generate_labels_batch(self):
+        """Each picking gets its labels, the errors are reported."""
+        failing = self.failing
+
+        def generate_default_label(picking, package_ids=None):
+            if picking == failing:
+                raise UserError('No label for %s' % picking.name)
+            return {'name': '%s.pdf' % picking.name,
+                    'file': 'PDF of %s' % picking.name,
+                    'file_type': 'pdf'}
+
+        with mock.patch.object(type(self.pickings), 'generate_default_label',
+                               generate_default_label):
+            report = self.pickings.generate_labels_batch()
+
+        self.assertEqual(set(report), set(self.pickings.ids))
+        for picking in self.pickings - failing:
+            self.assertFalse(report[picking.id])
+            labels = self._get_labels(picking)
+            self.assertEqual(len(labels), 1)
+            self.assertEqual(labels.name, '%s.pdf' % picking.name)
+            self.assertEqual(labels.datas.decode('base64'),
+                             'PDF of %s' % picking.name)
+        self.assertIn('No label for', report[failing.id])
+        self.assertFalse(self._get_labels(failing))
+
+    def test_generate_labels_batch_carrier_error(self):
+        """A failing carrier call is reported for its group only."""
+        carrier_pickings = self.pickings.filtered('carrier_id')
+        other = self.pickings - carrier_pickings
+
+        def generate_default_label(picking, package_ids=None):
+            return {'name': '%s.pdf' % picking.name,
+                    'file': 'PDF of %s' % picking.name,
+                    'file_type': 'pdf'}
+
+        def _call_carriers_batch(pickings, package_ids=None,
+                                 packages_by_picking=None):
+            if pickings & carrier_pickings:
+                raise UserError('Carrier unavailable')
+            return {}
+
+        model = type(self.pickings)
+        with mock.patch.object(model, 'generate_default_label',
+                               generate_default_label), \
+                mock.patch.object(model, '_call_carriers_batch',
+                                  _call_carriers_batch):
+            report = self.pickings.generate_labels_batch()
+
+        self.assertEqual(set(report), set(self.pickings.ids))
+        for picking in carrier_pickings:
+            self.assertIn('Carrier unavailable', report[picking.id])
+            self.assertFalse(self._get_labels(picking))
+        self.assertFalse(report[other.id])
+        self.assertEqual(len(self._get_labels(other)), 1)
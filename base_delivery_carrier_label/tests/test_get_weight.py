@@ -175,6 +175,38 @@ class TestGetWeight(TransactionCase):
             packages_weight + products_weight
         )
 
+    def test_get_weight_nested(self):
+        """Check the weight of packages put in another package."""
+        # prepare some data
+        weights = [2, 4, 2]
+        products = self._get_products(weights)
+        picking = self._generate_picking(products)
+        uls = self._create_ul()
+        parent = self.env['stock.quant.package'].create(
+            {'ul_id': uls[1].id})
+        children = [
+            self.env['stock.quant.package'].create(
+                {'ul_id': uls[0].id, 'parent_id': parent.id}
+            ) for __ in range(2)
+        ]
+        for idx, product in enumerate(products):
+            self._create_operation(picking, {
+                'product_qty': 1,
+                'product_id': product.id,
+                'product_uom_id': product.uom_id.id,
+                'result_package_id': children[idx % 2].id,
+            })
+        # end of prepare data
+
+        expected = (sum(weights) +
+                    2 * uls[0].weight +
+                    uls[1].weight)
+        self.assertAlmostEqual(parent.get_weight(), expected)
+        self.assertAlmostEqual(parent.weight, expected)
+        self.assertAlmostEqual(
+            sum([child.weight for child in children]),
+            sum(weights) + 2 * uls[0].weight)
+
     def test_get_weight_with_uom(self):
         """Check with differents uom."""
         # prepare some data
@@ -210,11 +242,8 @@ class TestGetWeight(TransactionCase):
                 'weight': weights[2],
             })
         )
-        products_weight = (
-            weights[0] * 1000 +  # tonne
-            weights[1] * 1 +  # kg
-            weights[2] * 0.01  # g
-        )
+        # the products have a weight, it is used whatever their uom
+        products_weight = sum(weights)
         picking = self._generate_picking(products)
         operations = []
         for product in products:
@@ -226,9 +255,55 @@ class TestGetWeight(TransactionCase):
             }))
         # end of prepare data
 
-        # because uom conversion is not implemented
-        self.assertEqual(package.get_weight(), False)
+        self.assertAlmostEqual(
+            package.get_weight(), products_weight, places=2)
+        self.assertAlmostEqual(package.weight, products_weight, places=2)
+
+    def test_get_weight_uom_not_convertible(self):
+        """An operation in a uom of another category has no weight."""
+        product = self._create_product({
+            'name': 'Sold by the meter',
+            'uom_id': self.env.ref('product.product_uom_meter').id,
+            'uom_po_id': self.env.ref('product.product_uom_meter').id,
+            'weight': 0.2,
+        })
+        picking = self._generate_picking([product])
+        operation = self._create_operation(picking, {
+            'product_qty': 3,
+            'product_id': product.id,
+            'product_uom_id': self.env.ref('product.product_uom_unit').id,
+        })
+        self.assertEqual(operation.get_weight(), False)
 
-        # if one day, uom conversion is implemented:
-        # self.assertEqual(package.get_weight(), products_weight)
-        self.assertEqual(products_weight, products_weight)  # flak8 warning
+    def test_get_weight_uom_same_category(self):
+        """The quantity is converted in the uom of the product."""
+        product = self._create_product({
+            'name': 'Sold by the unit',
+            'weight': 0.5,
+        })
+        picking = self._generate_picking([product])
+        operation = self._create_operation(picking, {
+            'product_qty': 2,
+            'product_id': product.id,
+            'product_uom_id': self.env.ref('product.product_uom_dozen').id,
+        })
+        self.assertAlmostEqual(operation.get_weight(), 12.)
+        self.assertAlmostEqual(operation.weight, 12.)
+
+    def test_get_weight_uom_weight_without_product_weight(self):
+        """A quantity in a weight uom is the weight of the operation."""
+        kg = self.env.ref('product.product_uom_kgm')
+        product = self._create_product({
+            'name': 'Sold by the kg',
+            'uom_id': kg.id,
+            'uos_id': kg.id,
+            'uom_po_id': kg.id,
+        })
+        picking = self._generate_picking([product])
+        operation = self._create_operation(picking, {
+            'product_qty': 500,
+            'product_id': product.id,
+            'product_uom_id': self.env.ref('product.product_uom_gram').id,
+        })
+        self.assertAlmostEqual(operation.get_weight(), 0.5)
+        self.assertAlmostEqual(operation.weight, 0.5)
@@ -54,6 +54,21 @@ class LaPosteLine(BaseLine):
 
 class LaPosteFileGenerator(CarrierFileGenerator):
 
+    columns_map = {
+        'reference': 'name',
+        'lastname': ('address_id.name', 'address_id.partner_id.name'),
+        'company_name': 'address_id.partner_id.name',
+        'title': 'address_id.partner_id.title',
+        'street1': 'address_id.street',
+        'street2': 'address_id.street2',
+        'zip': 'address_id.zip',
+        'city': 'address_id.city',
+        'country_code': 'address_id.country_id.code',
+        'phone': ('address_id.phone', 'address_id.mobile'),
+        'mail': 'address_id.email',
+        'weight': 'weight',
+    }
+
     @classmethod
     def carrier_for(cls, carrier_name):
         return carrier_name == 'la_poste'
@@ -67,6 +82,10 @@ class LaPosteFileGenerator(CarrierFileGenerator):
         return super(LaPosteFileGenerator, self
                      )._get_filename_grouped(configuration, extension='txt')
 
+    def _get_filename_period(self, configuration, extension='csv'):
+        return super(LaPosteFileGenerator, self
+                     )._get_filename_period(configuration, extension='txt')
+
     def _get_rows(self, picking, configuration):
         """
         Returns the rows to create in the file for a picking
@@ -77,23 +96,13 @@ class LaPosteFileGenerator(CarrierFileGenerator):
                generate
         :return: list of rows
         """
+        values = self._get_values(picking)
         line = LaPosteLine()
-        line.reference = picking.name
-        address = picking.address_id
-        if address:
-            line.lastname = address.name or (address.partner_id
-                                             and address.partner_id.name)
-            # if a company, put company name
-            if picking.address_id.partner_id.title:
-                line.company_name = address.partner_id.name
-            line.street1 = address.street
-            line.street2 = address.street2
-            line.zip = address.zip
-            line.city = address.city
-            line.country = address.country_id.code
-            line.phone = address.phone or picking.address_id.mobile
-            line.mail = address.email
-        line.weight = "%.2f" % (picking.weight,)
+        self._fill_line(line, values)
+        # if a company, put company name
+        if not values['title']:
+            line.company_name = ''
+        line.weight = "%.2f" % (values['weight'],)
         return [line.get_fields()]
 
     def _write_rows(self, file_handle, rows, configuration):
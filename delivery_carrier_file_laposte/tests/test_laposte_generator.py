@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import unittest
+
+from openerp.addons.base_delivery_carrier_files.tests.common import (
+    FakeConfiguration, FakePicking)
+from ..generator.laposte_generator import LaPosteFileGenerator
+
+
+class TestLaPosteGenerator(unittest.TestCase):
+
+    def setUp(self):
+        super(TestLaPosteGenerator, self).setUp()
+        self.generator = LaPosteFileGenerator('la_poste')
+        self.picking = FakePicking(1)
+        # values of columns_map as loaded by prefetch
+        self.values = {
+            'reference': u'OUT/00001',
+            'lastname': u'Jean Dupont',
+            'company_name': u'Camptocamp',
+            'title': 1,
+            'street1': u'18, rue du Lac',
+            'street2': False,
+            'zip': u'73370',
+            'city': u'Le Bourget-du-Lac',
+            'country_code': u'FR',
+            'phone': u'+33 4 79 26 57 94',
+            'mail': u'jean.dupont@example.com',
+            'weight': 2.5,
+        }
+        self.generator._values = {self.picking.id: self.values}
+
+    def test_row(self):
+        rows = self.generator._get_rows(self.picking, FakeConfiguration())
+        self.assertEqual(
+            rows,
+            [[u'OUT/00001', '', u'Jean Dupont', u'Camptocamp',
+              u'18, rue du Lac', '', '', '', u'73370', u'Le Bourget-du-Lac',
+              u'FR', u'+33 4 79 26 57 94', u'jean.dupont@example.com',
+              '', '', '', '', '', '', '', '2.50']])
+
+    def test_row_no_company(self):
+        """ The company name is only given for the companies """
+        self.values['title'] = False
+        rows = self.generator._get_rows(self.picking, FakeConfiguration())
+        self.assertEqual(rows[0][3], '')
+
+    def test_file(self):
+        configuration = FakeConfiguration()
+        [(__, content, picking_ids)] = self.generator.generate_files(
+            [self.picking], configuration)
+        self.assertEqual(picking_ids, [1])
+        self.assertEqual(
+            content,
+            '"OUT/00001";"";"Jean Dupont";"Camptocamp";"18, rue du Lac";'
+            '"";"";"";"73370";"Le Bourget-du-Lac";"FR";"+33 4 79 26 57 94";'
+            '"jean.dupont@example.com";"";"";"";"";"";"";"";"2.50"\n')
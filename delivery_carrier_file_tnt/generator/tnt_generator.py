@@ -51,6 +51,24 @@ class TNTLine(BaseLine):
 
 class TNTFileGenerator(CarrierFileGenerator):
 
+    columns_map = {
+        'reference': 'name',
+        'name': 'address_id.partner_id.name',
+        'contact': 'address_id.name',
+        'street1': 'address_id.street',
+        'street2': 'address_id.street2',
+        'zip': 'address_id.zip',
+        'state': 'address_id.state_id.name',
+        'city': 'address_id.city',
+        'country': 'address_id.country_id.code',
+        'country_name': 'address_id.country_id.name',
+        'phone': ('address_id.phone', 'address_id.mobile'),
+        'fax': 'address_id.fax',
+        'vat': 'address_id.partner_id.vat',
+        'mail': 'address_id.email',
+        'notes': 'carrier_id.name',
+    }
+
     @classmethod
     def carrier_for(cls, carrier_name):
         return carrier_name == 'tnt_express_shipper'
@@ -65,28 +83,13 @@ class TNTFileGenerator(CarrierFileGenerator):
                generate
         :return: list of rows
         """
+        values = self._get_values(picking)
         line = TNTLine()
-        line.reference = picking.name
-        if picking.address_id:
-            line.name = (picking.address_id.partner_id
-                         and picking.address_id.partner_id.name)
-            line.contact = picking.address_id.name
-            line.street1 = picking.address_id.street
-            line.street2 = picking.address_id.street2
-            line.zip = picking.address_id.zip
-            line.state = (picking.address_id.state_id
-                          and picking.address_id.state_id.name)
-            line.city = picking.address_id.city
-            line.country = picking.address_id.country_id.code
-            line.country_name = picking.address_id.country_id.name
-            line.phone = picking.address_id.phone or picking.address_id.mobile
-            line.fax = picking.address_id.fax
-            line.vat = picking.address_id.partner_id.vat
-            line.mail = picking.address_id.email
+        self._fill_line(line, values)
         line.tnt_account = configuration.tnt_account
         line.address_type = 'R'
         # according to specs, this field need at least on char
-        line.notes = picking.carrier_id and picking.carrier_id.name or '*'
+        line.notes = values['notes'] or '*'
         return [line.get_fields()]
 
     def _write_rows(self, file_handle, rows, configuration):
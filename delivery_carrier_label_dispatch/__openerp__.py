@@ -38,6 +38,11 @@ put in a pack before the labels can be printed.
 
 If you don't define your pack it will be considered a picking is a single pack.
 
+For large dispatches, the labels can be generated in background: the
+dispatches are queued and the scheduled action "Generate Dispatch Labels"
+generates the labels by chunks of pickings, showing the progress on the
+dispatch, then attaches the merged PDF to it.
+
 Contributors
 ------------
 
@@ -47,6 +52,7 @@ Contributors
     'website': 'http://www.camptocamp.com/',
     'data': [
         'picking_dispatch_view.xml',
+        'picking_dispatch_data.xml',
         'wizard/generate_labels_view.xml',
         'wizard/apply_carrier_view.xml',
     ],
@@ -18,13 +18,96 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
+import os
+import shutil
+import subprocess
+import tempfile
+from distutils.spawn import find_executable
 from StringIO import StringIO
 from PyPDF2 import PdfFileReader, PdfFileWriter
 
+# number of pdf merged together in a temporary file before the final merge
+CHUNK_SIZE = 100
 
-def assemble_pdf(pdf_list):
+
+def _merge_pdf(sources, output):
+    """ Write the pages of the pdf files ``sources`` in ``output``
+
+    The writer and the readers are dropped when it returns, so the memory
+    used is bounded by the size of ``sources``.
+    """
+    writer = PdfFileWriter()
+    for source in sources:
+        reader = PdfFileReader(source)
+        for page in range(reader.getNumPages()):
+            writer.addPage(reader.getPage(page))
+    writer.write(output)
+
+
+def _write_chunk(pending):
+    """ Merge the pdf contents ``pending`` in a temporary file
+
+    :return: path of the temporary file
+    """
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    with os.fdopen(fd, 'wb') as chunk:
+        _merge_pdf((StringIO(pdf) for pdf in pending), chunk)
+    return path
+
+
+def _combine_command(paths, output_path):
+    """ Return the command line of an external tool concatenating the
+    pdf files ``paths`` in ``output_path``, None when none is installed
+    """
+    qpdf = find_executable('qpdf')
+    if qpdf:
+        return [qpdf, '--empty', '--pages'] + paths + ['--', output_path]
+    pdfunite = find_executable('pdfunite')
+    if pdfunite:
+        return [pdfunite] + paths + [output_path]
+    return None
+
+
+def _combine_chunks(paths, output):
+    """ Concatenate the pdf files ``paths`` in the file object ``output``
+
+    qpdf or pdfunite copy the pages from the disk without loading the
+    whole document. When none of them is installed, the chunks are
+    merged with PyPDF2, which reads them from the disk but keeps the
+    pages of the final document until it is written.
+    """
+    fd, output_path = tempfile.mkstemp(suffix='.pdf')
+    os.close(fd)
+    try:
+        command = _combine_command(paths, output_path)
+        if command:
+            subprocess.check_call(command)
+            with open(output_path, 'rb') as combined:
+                shutil.copyfileobj(combined, output)
+            return
+        sources = [open(path, 'rb') for path in paths]
+        try:
+            _merge_pdf(sources, output)
+        finally:
+            for source in sources:
+                source.close()
+    finally:
+        os.unlink(output_path)
+
+
+def assemble_pdf(pdf_list, output=None, chunk_size=CHUNK_SIZE):
     """
     Assemble a list of pdf
+
+    The pdf are merged by chunks of ``chunk_size``, each chunk is written
+    in its own temporary file and its readers and sources are released
+    before the next one is read. The temporary files are then
+    concatenated, see ``_combine_chunks``.
+
+    :param pdf_list: iterable of pdf contents, it is consumed lazily
+    :param output: optional file object in which the merged pdf is
+                   written, when not given the pdf is returned
+    :param chunk_size: number of pdf merged in memory at once
     """
     # Even though we are using PyPDF2 we can't use PdfFileMerger
     # as this issue still exists in mostly used wkhtmltohpdf reports version
@@ -37,14 +120,28 @@ def assemble_pdf(pdf_list):
     #     merger.write(merged_pdf)
     #     return merged_pdf.read(), 'pdf'
 
-    output = PdfFileWriter()
-    for pdf in pdf_list:
-        if not pdf:
-            continue
-        reader = PdfFileReader(StringIO(pdf))
-
-        for page in range(reader.getNumPages()):
-            output.addPage(reader.getPage(page))
-    s = StringIO()
-    output.write(s)
-    return s.getvalue()
+    return_value = output is None
+    if return_value:
+        output = StringIO()
+    paths = []
+    try:
+        pending = []
+        for pdf in pdf_list:
+            if not pdf:
+                continue
+            pending.append(pdf)
+            if len(pending) >= chunk_size:
+                paths.append(_write_chunk(pending))
+                pending = []
+        if paths:
+            if pending:
+                paths.append(_write_chunk(pending))
+                pending = []
+            _combine_chunks(paths, output)
+        else:
+            _merge_pdf((StringIO(pdf) for pdf in pending), output)
+    finally:
+        for path in paths:
+            os.unlink(path)
+    if return_value:
+        return output.getvalue()
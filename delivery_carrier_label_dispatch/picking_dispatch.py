@@ -39,8 +39,37 @@ class PickingDispatch(Model):
         'option_ids': fields.many2many(
             'delivery.carrier.option',
             string='Options'),
+        'label_job_state': fields.selection(
+            [('queued', 'Queued'),
+             ('in_progress', 'In Progress'),
+             ('done', 'Done'),
+             ('done_with_errors', 'Done with Errors'),
+             ('failed', 'Failed')],
+            string='Labels Generation',
+            readonly=True),
+        'label_job_date': fields.datetime('Labels Generation Queued On',
+                                          readonly=True),
+        'label_job_new_labels': fields.boolean('Generate New Labels',
+                                               readonly=True),
+        'label_job_attempts': fields.integer('Labels Generation Attempts',
+                                             readonly=True),
+        'label_pack_total': fields.integer('Packs', readonly=True),
+        'label_pack_done': fields.integer('Packs with Label', readonly=True),
+        'label_pack_failed': fields.integer('Packs in Error', readonly=True),
+        'label_job_errors': fields.text('Labels Generation Errors',
+                                        readonly=True),
     }
 
+    def copy_data(self, cr, uid, id, default=None, context=None):
+        if default is None:
+            default = {}
+        default.update(label_job_state=False,
+                       label_job_date=False,
+                       label_job_attempts=0,
+                       label_job_errors=False)
+        return super(PickingDispatch, self).copy_data(
+            cr, uid, id, default=default, context=context)
+
     def action_set_options(self, cr, uid, ids, context=None):
         """ Apply options to picking of the dispatch
 
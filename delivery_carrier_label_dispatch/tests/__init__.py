@@ -19,3 +19,4 @@
 #
 ##############################################################################
 from . import test_generate_labels
+from . import test_pdf_utils
@@ -18,8 +18,14 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
+from StringIO import StringIO
+
+import mock
+from PyPDF2 import PdfFileReader
+
 import openerp.tests.common as common
 from openerp.addons import get_module_resource
+from openerp.osv import orm
 
 
 class test_generate_labels(common.TransactionCase):
@@ -77,11 +83,11 @@ class test_generate_labels(common.TransactionCase):
              'location_dest_id': self.ref('stock.stock_location_7'),
              })
 
-        label = ''
+        self.label = label = ''
         dummy_pdf_path = get_module_resource('delivery_carrier_label_dispatch',
                                              'tests', 'dummy.pdf')
         with file(dummy_pdf_path) as dummy_pdf:
-            label = dummy_pdf.read()
+            self.label = label = dummy_pdf.read()
 
         self.ShippingLabel.create(
             cr, uid,
@@ -119,6 +125,213 @@ class test_generate_labels(common.TransactionCase):
             cr, uid, [wizard_id], context=None)
         self.DeliveryCarrierLabelGenerate.action_generate_labels(
             cr, uid, [wizard_id], context={'active_ids': active_ids})
-        wizard = self.DeliveryCarrierLabelGenerate.browse(
-            cr, uid, wizard_id, context=None)
-        assert wizard.label_pdf_file
+        attachment_ids = self.registry('ir.attachment').search(
+            cr, uid, [('res_model', '=', 'picking.dispatch'),
+                      ('res_id', '=', self.picking_dispatch_id)])
+        self.assertEqual(len(attachment_ids), 1)
+        attachment = self.registry('ir.attachment').browse(
+            cr, uid, attachment_ids[0])
+        merged = PdfFileReader(StringIO(attachment.datas.decode('base64')))
+        label_pages = PdfFileReader(StringIO(self.label)).getNumPages()
+        self.assertEqual(merged.getNumPages(), label_pages * 2)
+
+    def _create_picking(self, dispatch_id, pack_count):
+        """ Create a picking of the dispatch with a move per pack
+
+        :return: tuple (picking id, list of pack ids)
+
+        """
+        cr, uid = self.cr, self.uid
+        picking_id = self.Picking.create(
+            cr, uid,
+            {'partner_id': self.ref('base.res_partner_12'),
+             'type': 'out'})
+        pack_ids = []
+        for __ in range(pack_count):
+            pack_id = self.registry('stock.tracking').create(cr, uid, {})
+            self.Move.create(
+                cr, uid,
+                {'name': '/',
+                 'picking_id': picking_id,
+                 'dispatch_id': dispatch_id,
+                 'tracking_id': pack_id,
+                 'product_id': self.ref('product.product_product_33'),
+                 'product_uom': self.ref('product.product_uom_unit'),
+                 'product_qty': 1,
+                 'location_id': self.ref('stock.stock_location_14'),
+                 'location_dest_id': self.ref('stock.stock_location_7'),
+                 })
+            pack_ids.append(pack_id)
+        return picking_id, pack_ids
+
+    def _create_label(self, picking_id, pack_id):
+        return self.ShippingLabel.create(
+            self.cr, self.uid,
+            {'name': 'label',
+             'res_id': picking_id,
+             'res_model': 'stock.picking.out',
+             'tracking_id': pack_id,
+             'datas': self.label.encode('base64'),
+             'file_type': 'pdf',
+             })
+
+    def _fake_generate_labels(self, picking_obj, cr, uid, ids,
+                              tracking_ids=None, context=None):
+        """ Replace the carrier call, create a label per pack """
+        self.generated.append((ids[0], tuple(sorted(tracking_ids or []))))
+        if ids[0] in self.failing_ids:
+            raise orm.except_orm('Error', 'No label for this picking')
+        for pack_id in tracking_ids:
+            self._create_label(ids[0], pack_id)
+        return True
+
+    def _patch_generate_labels(self):
+        self.generated = []
+        picking_out_obj = self.registry('stock.picking.out')
+        return mock.patch.object(type(picking_out_obj), 'generate_labels',
+                                 autospec=True,
+                                 side_effect=self._fake_generate_labels)
+
+    def _create_dispatch(self):
+        """ Create a dispatch of 3 pickings
+
+        The first picking has one of its two packs labelled, the
+        second one has its only pack labelled and the third one has
+        two packs without label.
+
+        """
+        cr, uid = self.cr, self.uid
+        self.failing_ids = []
+        dispatch_id = self.PickingDispatch.create(
+            cr, uid,
+            {'name': 'demo_prep002',
+             'picker_id': self.ref('base.user_demo'),
+             })
+        self.picking_a, self.packs_a = self._create_picking(dispatch_id, 2)
+        self.picking_b, self.packs_b = self._create_picking(dispatch_id, 1)
+        self.picking_c, self.packs_c = self._create_picking(dispatch_id, 2)
+        self.label_a = self._create_label(self.picking_a, self.packs_a[0])
+        self.label_b = self._create_label(self.picking_b, self.packs_b[0])
+        return dispatch_id
+
+    def _run_wizard(self, dispatch_id, **values):
+        cr, uid = self.cr, self.uid
+        values['dispatch_ids'] = [(6, 0, [dispatch_id])]
+        wizard_id = self.DeliveryCarrierLabelGenerate.create(cr, uid, values)
+        self.DeliveryCarrierLabelGenerate.action_generate_labels(
+            cr, uid, [wizard_id])
+
+    def test_01_find_labels(self):
+        """ The existing labels of the packs are found at once """
+        cr, uid = self.cr, self.uid
+        dispatch_id = self._create_dispatch()
+        dispatch = self.PickingDispatch.browse(cr, uid, dispatch_id)
+        wizard_id = self.DeliveryCarrierLabelGenerate.create(cr, uid, {})
+        wizard = self.DeliveryCarrierLabelGenerate.browse(cr, uid, wizard_id)
+        packs = self.DeliveryCarrierLabelGenerate._group_packs(
+            cr, uid, dispatch)
+        labels = self.DeliveryCarrierLabelGenerate._find_labels(
+            cr, uid, wizard, packs)
+        self.assertEqual(
+            dict((key, label.id) for key, label in labels.iteritems()),
+            {('pack', self.packs_a[0]): self.label_a,
+             ('pack', self.packs_b[0]): self.label_b})
+        labels = self.DeliveryCarrierLabelGenerate._find_labels(
+            cr, uid, wizard, packs, since='2999-01-01 00:00:00')
+        self.assertEqual(labels, {})
+
+    def test_02_generate_missing_labels(self):
+        """ The missing labels are generated once per picking """
+        dispatch_id = self._create_dispatch()
+        with self._patch_generate_labels():
+            self._run_wizard(dispatch_id)
+        self.assertEqual(
+            sorted(self.generated),
+            sorted([(self.picking_a, (self.packs_a[1],)),
+                    (self.picking_c, tuple(sorted(self.packs_c)))]))
+        # the existing labels are reused
+        label_ids = self.ShippingLabel.search(
+            self.cr, self.uid, [('res_id', '=', self.picking_b)])
+        self.assertEqual(label_ids, [self.label_b])
+
+    def test_03_generate_new_labels(self):
+        """ All the labels are generated again when asked """
+        dispatch_id = self._create_dispatch()
+        with self._patch_generate_labels():
+            self._run_wizard(dispatch_id, generate_new_labels=True)
+        self.assertEqual(
+            sorted(self.generated),
+            sorted([(self.picking_a, tuple(sorted(self.packs_a))),
+                    (self.picking_b, tuple(self.packs_b)),
+                    (self.picking_c, tuple(sorted(self.packs_c)))]))
+
+    def _run_label_jobs(self, chunk_size=1):
+        """ Run the scheduled action, counting the commits """
+        wizard_obj = self.DeliveryCarrierLabelGenerate
+        with self._patch_generate_labels(), \
+                mock.patch.object(type(wizard_obj), '_background_chunk_size',
+                                  chunk_size), \
+                mock.patch.object(self.cr, 'commit') as commit:
+            wizard_obj.run_label_jobs(self.cr, self.uid)
+        return commit.call_count
+
+    def _get_attachment_ids(self, dispatch_id):
+        return self.registry('ir.attachment').search(
+            self.cr, self.uid, [('res_model', '=', 'picking.dispatch'),
+                                ('res_id', '=', dispatch_id)])
+
+    def test_04_background_job(self):
+        """ A background job generates the labels by chunks """
+        dispatch_id = self._create_dispatch()
+        with self._patch_generate_labels():
+            self._run_wizard(dispatch_id, background=True)
+        self.assertFalse(self.generated)
+        dispatch = self.PickingDispatch.browse(self.cr, self.uid, dispatch_id)
+        self.assertEqual(dispatch.label_job_state, 'queued')
+
+        commits = self._run_label_jobs()
+        # the start, each of the 2 chunks of 1 picking and the end
+        self.assertEqual(commits, 4)
+        self.assertEqual(len(self.generated), 2)
+        dispatch.refresh()
+        self.assertEqual(dispatch.label_job_state, 'done')
+        self.assertEqual(dispatch.label_job_attempts, 1)
+        self.assertEqual(dispatch.label_pack_total, 5)
+        self.assertEqual(dispatch.label_pack_done, 5)
+        self.assertEqual(dispatch.label_pack_failed, 0)
+        self.assertEqual(len(self._get_attachment_ids(dispatch_id)), 1)
+
+    def test_05_background_job_errors(self):
+        """ The packs which failed are counted and reported """
+        dispatch_id = self._create_dispatch()
+        self.failing_ids = [self.picking_c]
+        with self._patch_generate_labels():
+            self._run_wizard(dispatch_id, background=True)
+        commits = self._run_label_jobs(chunk_size=20)
+        self.assertEqual(commits, 3)
+        dispatch = self.PickingDispatch.browse(self.cr, self.uid, dispatch_id)
+        self.assertEqual(dispatch.label_job_state, 'done_with_errors')
+        self.assertEqual(dispatch.label_pack_total, 5)
+        self.assertEqual(dispatch.label_pack_done, 3)
+        self.assertEqual(dispatch.label_pack_failed, 2)
+        self.assertIn('No label for this picking', dispatch.label_job_errors)
+        # the labels which could be generated are still merged
+        self.assertEqual(len(self._get_attachment_ids(dispatch_id)), 1)
+
+    def test_06_background_job_attempts(self):
+        """ A job interrupted too many times is failed """
+        dispatch_id = self._create_dispatch()
+        max_attempts = self.DeliveryCarrierLabelGenerate.\
+            _background_max_attempts
+        self.PickingDispatch.write(
+            self.cr, self.uid, [dispatch_id],
+            {'label_job_state': 'in_progress',
+             'label_job_date': '2015-01-01 00:00:00',
+             'label_job_attempts': max_attempts,
+             })
+        self._run_label_jobs()
+        self.assertFalse(self.generated)
+        dispatch = self.PickingDispatch.browse(self.cr, self.uid, dispatch_id)
+        self.assertEqual(dispatch.label_job_state, 'failed')
+        self.assertIn('interrupted', dispatch.label_job_errors)
+        self.assertFalse(self._get_attachment_ids(dispatch_id))
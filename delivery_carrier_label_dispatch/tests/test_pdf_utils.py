@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import mock
+from PyPDF2 import PdfFileReader, PdfFileWriter
+
+from .. import pdf_utils
+from ..pdf_utils import assemble_pdf
+
+
+class TestAssemblePdf(unittest.TestCase):
+
+    def _make_pdf(self, width, pages=1):
+        """ Return a pdf of blank pages, identified by their width """
+        writer = PdfFileWriter()
+        for __ in range(pages):
+            writer.addBlankPage(width=width, height=100)
+        output = StringIO()
+        writer.write(output)
+        return output.getvalue()
+
+    def _widths(self, pdf):
+        reader = PdfFileReader(StringIO(pdf))
+        return [int(reader.getPage(index).mediaBox.getWidth())
+                for index in range(reader.getNumPages())]
+
+    def test_assemble_pdf(self):
+        pdfs = (self._make_pdf(100 + index) for index in range(250))
+        merged = assemble_pdf(pdfs)
+        self.assertEqual(self._widths(merged), range(100, 350))
+
+    def test_assemble_pdf_chunks(self):
+        pdfs = (self._make_pdf(100 + index) for index in range(250))
+        with mock.patch.object(pdf_utils, '_write_chunk',
+                               autospec=True,
+                               side_effect=pdf_utils._write_chunk) as chunk:
+            merged = assemble_pdf(pdfs, chunk_size=100)
+        self.assertEqual(chunk.call_count, 3)
+        self.assertEqual(self._widths(merged), range(100, 350))
+
+    def test_assemble_pdf_combine_without_tool(self):
+        pdfs = (self._make_pdf(100 + index) for index in range(25))
+        with mock.patch.object(pdf_utils, '_combine_command',
+                               return_value=None):
+            merged = assemble_pdf(pdfs, chunk_size=10)
+        self.assertEqual(self._widths(merged), range(100, 125))
+
+    def test_assemble_pdf_output(self):
+        pdfs = [self._make_pdf(100, pages=2), None, self._make_pdf(200)]
+        with tempfile.TemporaryFile() as output:
+            self.assertIsNone(assemble_pdf(iter(pdfs), output=output))
+            output.seek(0)
+            merged = output.read()
+        self.assertEqual(self._widths(merged), [100, 100, 200])
@@ -18,14 +18,44 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
+import base64
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
 from operator import attrgetter
 from itertools import groupby
 
 from openerp.osv import orm, fields
+from openerp.tools import ustr
 from openerp.tools.translate import _
 
 from ..pdf_utils import assemble_pdf
 
+_logger = logging.getLogger(__name__)
+
+
+def _encode_file(source):
+    """ Return the base64 content of a file
+
+    The file is encoded in a temporary file, so the only full copy
+    kept in memory is the returned one.
+
+    """
+    with tempfile.TemporaryFile() as encoded:
+        base64.encode(source, encoded)
+        encoded.seek(0)
+        return encoded.read()
+
+
+def _file_sha1(source):
+    """ Return the sha1 of a file, read by blocks """
+    sha = hashlib.sha1()
+    for block in iter(lambda: source.read(65536), ''):
+        sha.update(block)
+    return sha.hexdigest()
+
 
 class DeliveryCarrierLabelGenerate(orm.TransientModel):
 
@@ -48,101 +78,393 @@ class DeliveryCarrierLabelGenerate(orm.TransientModel):
             help="If this option is used, new labels will be     "
                  "generated for the packs even if they already have one.\n"
                  "The default is to use the existing label."),
+        'background': fields.boolean(
+            'Generate in background',
+            help="The labels are generated by a scheduled action, "
+                 "by chunks of pickings. The progress is shown on the "
+                 "dispatch and the merged PDF is attached to it at the "
+                 "end."),
     }
 
     _defaults = {
         'dispatch_ids': _get_dispatch_ids,
         'generate_new_labels': False,
+        'background': False,
     }
 
-    def _get_packs(self, cr, uid, wizard, dispatch, context=None):
+    # number of pickings of which the labels are generated before
+    # committing the progress of a background generation
+    _background_chunk_size = 20
+    # runs of a background generation before the dispatch is failed
+    _background_max_attempts = 3
+
+    def _group_packs(self, cr, uid, dispatch, context=None):
+        """ Return the list of (pack, moves) of a dispatch """
         moves = sorted(dispatch.move_ids, key=attrgetter('tracking_id.name'))
-        for pack, moves in groupby(moves, key=attrgetter('tracking_id')):
-            pack_label = self._find_pack_label(cr, uid, wizard, pack,
-                                               context=context)
-            yield pack, list(moves), pack_label
+        return [(pack, list(pack_moves)) for pack, pack_moves
+                in groupby(moves, key=attrgetter('tracking_id'))]
 
-    def _find_picking_label(self, cr, uid, wizard, picking, context=None):
+    def _get_packs(self, cr, uid, wizard, dispatch, since=None,
+                   context=None):
+        packs = self._group_packs(cr, uid, dispatch, context=context)
+        labels = self._find_labels(cr, uid, wizard, packs, since=since,
+                                   context=context)
+        for pack, moves in packs:
+            key = self._label_key(pack, moves[0].picking_id)
+            yield pack, moves, labels.get(key)
+
+    @staticmethod
+    def _label_key(pack, picking):
+        """ Key of the label of a pack in the result of `_find_labels` """
+        if pack:
+            return ('pack', pack.id)
+        return ('picking', picking.id)
+
+    def _find_labels(self, cr, uid, wizard, packs, since=None, context=None):
+        """ Find the latest label of many packs at once
+
+        :param packs: list of tuples (pack, moves), the label of the
+                      picking is used when there is no pack
+        :param since: optional date, older labels are ignored
+        :return: dict with `_label_key` as keys and labels as values
+
+        """
         label_obj = self.pool['shipping.label']
+        pack_ids = set()
+        picking_ids = set()
+        for pack, moves in packs:
+            if pack:
+                pack_ids.add(pack.id)
+            else:
+                picking_ids.add(moves[0].picking_id.id)
+        if not pack_ids and not picking_ids:
+            return {}
         domain = [('file_type', '=', 'pdf'),
-                  ('res_id', '=', picking.id),
+                  '|',
+                  ('tracking_id', 'in', list(pack_ids)),
+                  '&',
                   ('tracking_id', '=', False),
+                  ('res_id', 'in', list(picking_ids)),
                   ]
-        label_id = label_obj.search(cr, uid, domain, order='create_date DESC',
-                                    limit=1, context=context)
-        if not label_id:
-            return None
-        return label_obj.browse(cr, uid, label_id[0], context=context)
+        if since:
+            domain.append(('create_date', '>=', since))
+        label_ids = label_obj.search(cr, uid, domain,
+                                     order='create_date DESC',
+                                     context=context)
+        rows = label_obj.read(cr, uid, label_ids, ['tracking_id', 'res_id'],
+                              context=context, load='_classic_write')
+        labels = {}
+        for row in rows:
+            if row['tracking_id']:
+                key = ('pack', row['tracking_id'])
+            else:
+                key = ('picking', row['res_id'])
+            # the labels are sorted, keep the latest one
+            labels.setdefault(key, row['id'])
+        return dict((key, label_obj.browse(cr, uid, label_id,
+                                           context=context))
+                    for key, label_id in labels.iteritems())
 
-    def _find_pack_label(self, cr, uid, wizard, pack, context=None):
-        label_obj = self.pool['shipping.label']
-        domain = [('file_type', '=', 'pdf'),
-                  ('tracking_id', '=', pack.id),
-                  ]
-        label_id = label_obj.search(cr, uid, domain, order='create_date DESC',
-                                    limit=1, context=context)
-        if not label_id:
-            return None
-        return label_obj.browse(cr, uid, label_id[0], context=context)
+    @staticmethod
+    def _missing_labels(packs, generate_new_labels=False):
+        """ Return the packs without label grouped by picking
 
-    def _get_all_pdf(self, cr, uid, wizard, dispatch, context=None):
-        for pack, moves, label in self._get_packs(cr, uid, wizard, dispatch,
-                                                  context=context):
-            if not label or wizard.generate_new_labels:
-                picking_out_obj = self.pool['stock.picking.out']
+        :param packs: list of tuples (pack, moves, label)
+        :return: list of tuples (picking, list of packs)
+
+        """
+        missing = {}
+        pickings = []
+        for pack, moves, label in packs:
+            if not label or generate_new_labels:
                 picking = moves[0].picking_id
-                # generate the label of the pack
-                if pack:
-                    tracking_ids = [pack.id]
-                else:
-                    tracking_ids = None
-                try:
-                    picking_out_obj.generate_labels(
-                        cr, uid, [picking.id],
-                        tracking_ids=tracking_ids,
-                        context=context)
-                except orm.except_orm as e:
-                    picking_name = _('Picking: %s') % picking.name
-                    pack_num = _('Pack: %s') % pack.name if pack else ''
-                    raise orm.except_orm(
-                        e.name,
-                        _('%s %s - %s') % (picking_name, pack_num, e.value))
-                if pack:
-                    label = self._find_pack_label(cr, uid, wizard, pack,
-                                                  context=context)
-                else:
-                    label = self._find_picking_label(cr, uid, wizard, picking,
-                                                     context=context)
-                if not label:
-                    continue  # no label could be generated
+                if picking.id not in missing:
+                    missing[picking.id] = []
+                    pickings.append(picking)
+                missing[picking.id].append(pack)
+        return [(missing_picking, missing[missing_picking.id])
+                for missing_picking in pickings]
+
+    def _generate_picking_labels(self, cr, uid, picking, picking_packs,
+                                 context=None):
+        """ Generate the labels of packs of a picking
+
+        The labels of all the packs of the picking are generated when
+        there are moves without pack.
+
+        """
+        picking_out_obj = self.pool['stock.picking.out']
+        if all(picking_packs):
+            tracking_ids = [pack.id for pack in picking_packs]
+        else:
+            tracking_ids = None
+        try:
+            picking_out_obj.generate_labels(
+                cr, uid, [picking.id],
+                tracking_ids=tracking_ids,
+                context=context)
+        except orm.except_orm as e:
+            picking_name = _('Picking: %s') % picking.name
+            pack_num = ', '.join(pack.name for pack in picking_packs
+                                 if pack)
+            if pack_num:
+                pack_num = _('Pack: %s') % pack_num
+            raise orm.except_orm(
+                e.name,
+                _('%s %s - %s') % (picking_name, pack_num, e.value))
+
+    def _get_all_pdf(self, cr, uid, wizard, dispatch, context=None):
+        packs = list(self._get_packs(cr, uid, wizard, dispatch,
+                                     context=context))
+        missing = self._missing_labels(
+            packs, generate_new_labels=wizard.generate_new_labels)
+        for picking, picking_packs in missing:
+            self._generate_picking_labels(cr, uid, picking, picking_packs,
+                                          context=context)
+
+        generated = {}
+        picking_ids = set(picking.id for picking, __ in missing)
+        if missing:
+            generated = self._find_labels(
+                cr, uid, wizard,
+                [(pack, moves) for pack, moves, label in packs
+                 if moves[0].picking_id.id in picking_ids],
+                context=context)
+        for pack, moves, label in packs:
+            if moves[0].picking_id.id in picking_ids:
+                key = self._label_key(pack, moves[0].picking_id)
+                label = generated.get(key, label)
+            if not label:
+                continue  # no label could be generated
             yield label
 
+    def _read_label_file(self, cr, uid, label, context=None):
+        """ Return the decoded file of a label
+
+        The content is read without the browse record cache, so the
+        cache does not keep a second copy of the files of all the labels.
+
+        """
+        label_obj = self.pool['shipping.label']
+        datas = label_obj.read(cr, uid, [label.id], ['datas'],
+                               context=context)[0]['datas']
+        if not datas:
+            return None
+        return datas.decode('base64')
+
+    def _store_file(self, cr, uid, source, context=None):
+        """ Return the values storing the file ``source`` in an attachment
+
+        With a file storage, the file is copied in the filestore, at the
+        path the attachment would use, and the attachment is created with
+        this path, so its base64 content is never built in memory. In the
+        database storage, the content has to be passed base64-encoded.
+
+        """
+        attachment_obj = self.pool['ir.attachment']
+        if attachment_obj._storage(cr, uid) == 'db':
+            return {'datas': _encode_file(source)}
+        sha = _file_sha1(source)
+        fname = sha[:2] + '/' + sha
+        full_path = attachment_obj._full_path(cr, uid, fname)
+        if not os.path.isfile(full_path):
+            dirname = os.path.dirname(full_path)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            fd, tmp_path = tempfile.mkstemp(dir=dirname)
+            try:
+                with os.fdopen(fd, 'wb') as stored:
+                    source.seek(0)
+                    shutil.copyfileobj(source, stored)
+                os.rename(tmp_path, full_path)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+        return {'store_fname': fname,
+                'file_size': source.tell()}
+
+    def _attach_labels(self, cr, uid, dispatch, labels, context=None):
+        """ Merge the labels in a PDF attached to the dispatch
+
+        The labels are merged in a temporary file, which is sent to the
+        attachment store, see ``_store_file``.
+
+        """
+        attachment_obj = self.pool.get('ir.attachment')
+        labels = (self._read_label_file(cr, uid, label, context=context)
+                  for label in labels)
+        data = {
+            'name': dispatch.name + '.pdf',
+            'res_id': dispatch.id,
+            'res_model': 'picking.dispatch',
+        }
+        with tempfile.TemporaryFile() as merged:
+            assemble_pdf(labels, output=merged)
+            merged.seek(0)
+            data.update(self._store_file(cr, uid, merged, context=context))
+        return attachment_obj.create(cr, uid, data, context=context)
+
     def action_generate_labels(self, cr, uid, ids, context=None):
         """
         Call the creation of the delivery carrier label
         of the missing labels and get the existing ones
         Then merge all of them in a single PDF
 
+        In background mode, the dispatches are only queued for the
+        scheduled action.
+
         """
         this = self.browse(cr, uid, ids, context=context)[0]
         if not this.dispatch_ids:
             raise orm.except_orm(_('Error'), _('No picking dispatch selected'))
 
-        attachment_obj = self.pool.get('ir.attachment')
+        if this.background:
+            dispatch_obj = self.pool['picking.dispatch']
+            dispatch_ids = [dispatch.id for dispatch in this.dispatch_ids]
+            dispatch_obj.write(
+                cr, uid, dispatch_ids,
+                {'label_job_state': 'queued',
+                 'label_job_date': fields.datetime.now(),
+                 'label_job_new_labels': this.generate_new_labels,
+                 'label_pack_total': 0,
+                 'label_pack_done': 0,
+                 'label_pack_failed': 0,
+                 'label_job_errors': False,
+                 'label_job_attempts': 0,
+                 },
+                context=context)
+            return {
+                'type': 'ir.actions.act_window_close',
+            }
 
         for dispatch in this.dispatch_ids:
             labels = self._get_all_pdf(cr, uid, this, dispatch,
                                        context=context)
-            labels = (label.datas for label in labels)
-            labels = (label.decode('base64') for label in labels if labels)
-            data = {
-                'name': dispatch.name + '.pdf',
-                'res_id': dispatch.id,
-                'res_model': 'picking.dispatch',
-                'datas': assemble_pdf(labels).encode('base64'),
-            }
-            attachment_obj.create(cr, uid, data, context=context)
+            self._attach_labels(cr, uid, dispatch, labels, context=context)
 
         return {
             'type': 'ir.actions.act_window_close',
         }
+
+    def _run_label_job(self, cr, uid, wizard, dispatch, context=None):
+        """ Generate the labels of a dispatch by chunks of pickings
+
+        The progress is committed after each chunk. As the existing
+        labels are reused, a job interrupted by a crash resumes where
+        it stopped. When new labels are requested, only the labels
+        created since the job has been queued are reused. The job ends
+        in the 'done_with_errors' state when the labels of some packs
+        could not be generated.
+
+        """
+        dispatch_obj = self.pool['picking.dispatch']
+        since = None
+        if dispatch.label_job_new_labels:
+            since = dispatch.label_job_date
+        packs = list(self._get_packs(cr, uid, wizard, dispatch, since=since,
+                                     context=context))
+        missing = self._missing_labels(packs)
+        todo = sum(len(picking_packs) for __, picking_packs in missing)
+        done = len(packs) - todo
+        failed = 0
+        errors = []
+        dispatch_obj.write(cr, uid, [dispatch.id],
+                           {'label_job_state': 'in_progress',
+                            'label_job_attempts':
+                                dispatch.label_job_attempts + 1,
+                            'label_pack_total': len(packs),
+                            'label_pack_done': done,
+                            'label_pack_failed': 0,
+                            },
+                           context=context)
+        cr.commit()
+
+        step = self._background_chunk_size
+        for start in xrange(0, len(missing), step):
+            for picking, picking_packs in missing[start:start + step]:
+                try:
+                    with cr.savepoint():
+                        self._generate_picking_labels(
+                            cr, uid, picking, picking_packs, context=context)
+                except orm.except_orm as e:
+                    failed += len(picking_packs)
+                    errors.append(e.value)
+                except Exception as e:
+                    # errors of the carriers (web services, files, ...)
+                    _logger.exception('Label generation failed for '
+                                      'picking %s', picking.name)
+                    failed += len(picking_packs)
+                    errors.append(_('Picking: %s - %s')
+                                  % (picking.name, ustr(e)))
+                else:
+                    done += len(picking_packs)
+            dispatch_obj.write(cr, uid, [dispatch.id],
+                               {'label_pack_done': done,
+                                'label_pack_failed': failed,
+                                'label_job_errors': '\n'.join(errors),
+                                },
+                               context=context)
+            cr.commit()
+
+        labels = self._get_packs(cr, uid, wizard, dispatch, since=since,
+                                 context=context)
+        labels = (label for __, __, label in labels if label)
+        self._attach_labels(cr, uid, dispatch, labels, context=context)
+        state = 'done_with_errors' if failed else 'done'
+        dispatch_obj.write(cr, uid, [dispatch.id],
+                           {'label_job_state': state},
+                           context=context)
+        cr.commit()
+
+    def run_label_jobs(self, cr, uid, context=None):
+        """ Process the dispatches queued for background generation
+
+        Called by the scheduled action. The dispatches left in progress
+        after a crash are processed again, until they have been tried
+        `_background_max_attempts` times. A dispatch which fails is
+        marked as failed and the next dispatches are processed.
+
+        """
+        dispatch_obj = self.pool['picking.dispatch']
+        dispatch_ids = dispatch_obj.search(
+            cr, uid,
+            [('label_job_state', 'in', ('queued', 'in_progress'))],
+            order='label_job_date',
+            context=context)
+        for dispatch_id in dispatch_ids:
+            dispatch = dispatch_obj.browse(cr, uid, dispatch_id,
+                                           context=context)
+            if dispatch.label_job_attempts >= self._background_max_attempts:
+                self._fail_label_job(
+                    cr, uid, dispatch,
+                    _('The generation has been interrupted %s times.')
+                    % dispatch.label_job_attempts,
+                    context=context)
+                continue
+            try:
+                wizard_id = self.create(
+                    cr, uid, {'dispatch_ids': [(6, 0, [dispatch.id])]},
+                    context=context)
+                wizard = self.browse(cr, uid, wizard_id, context=context)
+                self._run_label_job(cr, uid, wizard, dispatch,
+                                    context=context)
+            except Exception as e:
+                _logger.exception('Label generation failed for '
+                                  'dispatch %s', dispatch.name)
+                cr.rollback()
+                dispatch = dispatch_obj.browse(cr, uid, dispatch_id,
+                                               context=context)
+                self._fail_label_job(cr, uid, dispatch, ustr(e),
+                                     context=context)
+        return True
+
+    def _fail_label_job(self, cr, uid, dispatch, message, context=None):
+        """ Stop the background generation of a dispatch """
+        errors = filter(None, [dispatch.label_job_errors, message])
+        self.pool['picking.dispatch'].write(
+            cr, uid, [dispatch.id],
+            {'label_job_state': 'failed',
+             'label_job_errors': '\n'.join(errors),
+             },
+            context=context)
+        cr.commit()
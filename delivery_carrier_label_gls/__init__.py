@@ -22,5 +22,6 @@
 from . import company
 from . import config
 from . import delivery
+from . import label_job
 from . import report
 from . import stock
@@ -59,8 +59,10 @@ Contributors
     'data': [
         'data/delivery_carrier.xml',
         'data/sequence.xml',
+        'data/cron.xml',
         'config_view.xml',
-        # 'security/ir.model.access.csv',
+        'label_job_view.xml',
+        'security/ir.model.access.csv',
     ],
     'demo': [
         'demo/res.partner.csv',
@@ -37,5 +37,10 @@ class ResCompany(orm.Model):
             help='Contact id for GLS International transportation (T8914)'),
         'gls_test': fields.boolean(
             'Url Test',
-            help="Check if requested webservice is test plateform")
+            help="Check if requested webservice is test plateform"),
+        'gls_async_label': fields.boolean(
+            'Asynchronous Labels',
+            help="Generate the labels in background after the transfer "
+                 "of the pickings, the transfer does not wait for the "
+                 "web service"),
     }
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+from datetime import datetime, timedelta
+import logging
+
+from openerp.osv import orm, fields
+from openerp.tools import DEFAULT_SERVER_DATETIME_FORMAT, ustr
+
+_logger = logging.getLogger(__name__)
+
+
+class GlsLabelJob(orm.Model):
+    """ GLS pickings waiting for the generation of their labels
+
+    With the 'Asynchronous Labels' option of the company, the transfer
+    of the pickings only inserts the jobs. The labels are generated by
+    a scheduled action once the transfer is committed, see `consume`.
+    The failed jobs are listed in a menu, to be tried again.
+    """
+    _name = 'gls.label.job'
+    _description = 'GLS Label Generation Queue'
+    _order = 'id'
+
+    # number of jobs read at once, each picking is committed alone
+    _batch_size = 100
+    # the last attempt prints a rescue label if the web service fails
+    _max_attempts = 5
+    # minutes before the first new attempt, doubled on each attempt
+    _retry_delay = 2
+
+    _columns = {
+        'picking_id': fields.many2one(
+            'stock.picking', 'Delivery Order',
+            required=True, ondelete='cascade'),
+        'attempts': fields.integer('Attempts'),
+        'next_date': fields.datetime('Next Attempt'),
+        'state': fields.selection(
+            [('pending', 'Pending'), ('failed', 'Failed')],
+            string='State', required=True),
+        'error': fields.text('Error'),
+    }
+
+    _defaults = {
+        'attempts': 0,
+        'state': 'pending',
+    }
+
+    def enqueue(self, cr, uid, picking_ids, context=None):
+        """ Queue the pickings with one query, the jobs are visible by
+        the scheduled action once the transaction is committed
+        """
+        if not picking_ids:
+            return
+        cr.execute(
+            "INSERT INTO gls_label_job "
+            "(picking_id, attempts, next_date, state, "
+            " create_uid, create_date, write_uid, write_date) "
+            "SELECT p.id, 0, now() at time zone 'UTC', 'pending', "
+            "       %s, now() at time zone 'UTC', "
+            "       %s, now() at time zone 'UTC' "
+            "FROM stock_picking p "
+            "WHERE p.id IN %s",
+            (uid, uid, tuple(picking_ids)))
+
+    def _get_due_jobs(self, cr, uid, limit, context=None):
+        now = datetime.utcnow().strftime(DEFAULT_SERVER_DATETIME_FORMAT)
+        return self.search(
+            cr, uid,
+            [('state', '=', 'pending'),
+             '|', ('next_date', '=', False), ('next_date', '<=', now)],
+            limit=limit, context=context)
+
+    def _run_job(self, cr, uid, job, context=None):
+        """ Generate the labels of the picking of a job """
+        ctx = dict(context or {})
+        if job.attempts + 1 >= self._max_attempts:
+            ctx['gls_rescue_on_error'] = True
+        self.pool['stock.picking'].generate_labels(
+            cr, uid, [job.picking_id.id], context=ctx)
+
+    def _postpone(self, cr, uid, job_id, error, context=None):
+        """ Plan a new attempt of a failed job, or mark it failed """
+        job = self.browse(cr, uid, job_id, context=context)
+        attempts = job.attempts + 1
+        values = {'attempts': attempts, 'error': error}
+        if attempts >= self._max_attempts:
+            values['state'] = 'failed'
+            _logger.error("GLS labels of the picking %s not generated "
+                          "after %s attempts: %s",
+                          job.picking_id.name, attempts, error)
+        else:
+            delay = timedelta(
+                minutes=self._retry_delay * 2 ** (attempts - 1))
+            values['next_date'] = (datetime.utcnow() + delay).strftime(
+                DEFAULT_SERVER_DATETIME_FORMAT)
+        self.write(cr, uid, job_id, values, context=context)
+
+    def action_retry(self, cr, uid, ids, context=None):
+        """ Plan the failed jobs again, from their first attempt """
+        self.write(cr, uid, ids,
+                   {'state': 'pending',
+                    'attempts': 0,
+                    'next_date': False,
+                    'error': False},
+                   context=context)
+        return True
+
+    def consume(self, cr, uid, commit=True, context=None):
+        """
+        Generate the labels of the queued pickings, each picking is
+        committed alone. A failed job is tried again later, on the last
+        attempt the rescue label is printed when the web service
+        fails. Called by the scheduled action.
+
+        :param bool commit: commit after each job, the errors are
+                            raised when False
+        """
+        # the System Parameters and the services are shared by the jobs
+        ctx = dict(context or {}, gls_cache={})
+        done_ids = set()
+        while True:
+            job_ids = [job_id for job_id in self._get_due_jobs(
+                cr, uid, self._batch_size, context=context)
+                if job_id not in done_ids]
+            if not job_ids:
+                break
+            for job in self.browse(cr, uid, job_ids, context=context):
+                done_ids.add(job.id)
+                try:
+                    self._run_job(cr, uid, job, context=ctx)
+                except Exception as e:
+                    if not commit:
+                        raise
+                    cr.rollback()
+                    _logger.exception("GLS labels of the picking %s not "
+                                      "generated", job.picking_id.name)
+                    self._postpone(cr, uid, job.id, ustr(e), context=context)
+                else:
+                    self.unlink(cr, uid, [job.id], context=context)
+                if commit:
+                    cr.commit()
+        return True
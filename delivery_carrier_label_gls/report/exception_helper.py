@@ -71,3 +71,12 @@ class InvalidCode(Exception):
 
 class InvalidKeyInTemplate(Exception):
     pass
+
+
+class InvalidParcels(Exception):
+    """ Errors of many parcels of a delivery, checked at once """
+
+    def __init__(self, message, errors=None):
+        super(InvalidParcels, self).__init__(message)
+        # list of (index of the parcel, exception)
+        self.errors = errors or []
@@ -22,11 +22,17 @@
 from mako.template import Template
 from mako.exceptions import RichTraceback
 from .label_helper import AbstractLabel
-from .exception_helper import (InvalidAccountNumber)
+from .exception_helper import (InvalidAccountNumber, InvalidParcels)
+import errno
 import httplib
 from unidecode import unidecode
 import logging
 import os
+import re
+import socket
+import threading
+import time
+import urlparse
 import pycountry
 
 REPORT_CODING = 'cp1252'
@@ -41,11 +47,109 @@ logger = logging.getLogger(__name__)
 URL_PROD = "http://www.gls-france.com/cgi-bin/glsboxGI.cgi"
 URL_TEST = "http://www.gls-france.com/cgi-bin/glsboxGITest.cgi"
 
+# seconds waited for the connection and for the response
+GLS_TIMEOUT = 10
+# new attempts when the web service is unavailable
+GLS_RETRIES = 2
+# seconds waited before the first new attempt, doubled on each attempt
+GLS_BACKOFF = 0.5
+RETRY_STATUSES = (503, 504)
+
 
 class InvalidDataForMako(Exception):
     ""
 
 
+# keys of the templates which are filled only by the web service
+NOT_IN_MAKO_BUT_KNOWN_CASE = frozenset(['T8900', 'T8901', 'T8717', 'T8911'])
+
+# compiled templates, by file name: (Template, keys used in the template)
+_templates = {}
+_templates_lock = threading.Lock()
+_template_module_directory = None
+
+
+def set_template_module_directory(module_directory):
+    """ Store the python modules compiled from the templates in a directory,
+    so they are compiled once for all the processes.
+    None compiles them in memory, once per process.
+    """
+    global _template_module_directory
+    with _templates_lock:
+        _template_module_directory = module_directory
+        _templates.clear()
+
+
+class ConnectionPool(object):
+    """ Keep-alive HTTP connections to the web service, shared by the
+    labels generated in a process
+    """
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, port, timeout):
+        """ Return an idle connection or a new one """
+        with self._lock:
+            connections = self._idle.get((host, port, timeout))
+            if connections:
+                return connections.pop()
+        return httplib.HTTPConnection(host, port, timeout=timeout)
+
+    def release(self, connection, host, port, timeout):
+        """ Give back a connection which can be reused """
+        with self._lock:
+            connections = self._idle.setdefault((host, port, timeout), [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def clear(self):
+        """ Close all the idle connections """
+        with self._lock:
+            for connections in self._idle.itervalues():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+
+connection_pool = ConnectionPool()
+
+
+def _is_closed_connection_error(error):
+    """ Whether an error shows that the server closed a kept-alive
+    connection before reading the request """
+    if isinstance(error, httplib.BadStatusLine):
+        return True
+    return (isinstance(error, socket.error) and
+            not isinstance(error, socket.timeout) and
+            error.errno in (errno.ECONNRESET, errno.EPIPE))
+
+
+def get_template(zpl_file):
+    """ Return the compiled template of a label and the set of the keys
+    it uses, they are loaded once per process
+    """
+    cached = _templates.get(zpl_file)
+    if cached is None:
+        with _templates_lock:
+            cached = _templates.get(zpl_file)
+            if cached is None:
+                template_path = os.path.join(os.path.dirname(__file__),
+                                             zpl_file)
+                with open(template_path, 'r') as template_file:
+                    content = template_file.read()
+                template = Template(
+                    filename=template_path,
+                    module_directory=_template_module_directory)
+                keys = frozenset(re.findall(r'\$\{(.+?)\}+', content))
+                cached = _templates[zpl_file] = (template, keys)
+    return cached
+
+
 def GLS_countries_prefix():
     """For GLS carrier 'Serbie Montenegro' is 'CS' and for wikipedia it's 'ME'
     We have to do a quick replacement
@@ -154,6 +258,15 @@ ACCOUNT_MAPPING = {
     'T821': "shipper_country",
 }
 
+# the origin reference depends on the parcel, the other keys of the
+# delivery are the same for all its parcels
+ORIGIN_REFERENCE_MAPPING = dict(
+    (T, key) for T, key in DELIVERY_MAPPING.items()
+    if key == 'gls_origin_reference')
+DELIVERY_COMMON_MAPPING = dict(
+    (T, key) for T, key in DELIVERY_MAPPING.items()
+    if key != 'gls_origin_reference')
+
 MAPPING = {}
 MAPPING.update(ACCOUNT_MAPPING)
 MAPPING.update(DELIVERY_MAPPING)
@@ -184,20 +297,28 @@ def gls_decode(data):
 
 class GLSLabel(AbstractLabel):
 
-    def __init__(self, sender, code, test_plateform=False):
+    def __init__(self, sender, code, test_plateform=False, url=None,
+                 timeout=GLS_TIMEOUT, retries=GLS_RETRIES,
+                 backoff=GLS_BACKOFF, rescue_on_error=False):
         self.check_model(sender, SENDER_MODEL, 'company')
-        if test_plateform:
-            url = URL_TEST
-        else:
-            url = URL_PROD
-        url_separ = url.find('.com/') + 4
-        start = 0
-        if url[:7] == 'http://':
-            start = 7
-        self.webservice_location = url[start:url_separ]
-        self.webservice_method = url[url_separ:]
+        if url is None:
+            if test_plateform:
+                url = URL_TEST
+            else:
+                url = URL_PROD
+        url = urlparse.urlsplit(url)
+        self.webservice_location = url.hostname
+        self.webservice_port = url.port or GLS_PORT
+        self.webservice_method = url.path
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # print the rescue label when the web service fails
+        # instead of raising the error
+        self.rescue_on_error = rescue_on_error
         self.filename = LABEL_FILE_NAME
         self.sender = sender
+        self._T_account = None
 
     def add_specific_keys(self, address):
         res = {}
@@ -246,6 +367,7 @@ class GLSLabel(AbstractLabel):
                 "this data is required" % address['country_code'])
 
     def select_label(self, parcel, all_dict, address, failed_webservice=False):
+        """ Return the name of the template of the label """
         self.filename = '_' + parcel
         if address['country_code'] == 'FR' and not failed_webservice:
             zpl_file = 'label.mako'
@@ -253,11 +375,8 @@ class GLSLabel(AbstractLabel):
             if failed_webservice:
                 self.filename += '_rescue'
             zpl_file = 'label_uniship.mako'
-        template_path = os.path.join(os.path.dirname(__file__), zpl_file)
-        with open(template_path, 'r') as template:
-            content = template.read()
-            all_dict.update(self.get_barcode_uniship(all_dict, address))
-        return content
+        all_dict.update(self.get_barcode_uniship(all_dict, address))
+        return zpl_file
 
     def get_result_analysis(self, result, all_dict):
         component = result.split(':')
@@ -292,39 +411,73 @@ code: %s ; message: %s ; result: %s""" % (code, message, result))
             return False
 
     def get_label(self, delivery, address, parcel):
-        tracking_number = False
-        self.check_model(parcel, PARCEL_MODEL, 'package')
+        return self.get_labels(delivery, address, [parcel])[0]
+
+    def get_labels(self, delivery, address, parcels):
+        """ Return the labels of the parcels of a delivery
+
+        The sender, the address and the delivery are checked and
+        transformed in GLS keys once for all the parcels.
+        The parcels are checked before the first call to the web
+        service, all their errors are raised at once.
+        """
+        errors = self.check_models(parcels, PARCEL_MODEL, 'package')
+        if errors:
+            raise InvalidParcels(
+                u'\n'.join(u'parcel %s: %s' % (index + 1, error)
+                           for index, error in errors),
+                errors)
         self.check_model(address, ADDRESS_MODEL, 'partner')
         self.product_code, self.uniship_product = self.get_product(
             address['country_code'])
         self.check_model(delivery, DELIVERY_MODEL, 'delivery')
-        delivery['gls_origin_reference'] = self.set_origin_reference(
-            parcel, address)
+        if address['country_code'] != 'FR' and (
+                'contact_id_inter' not in self.sender or
+                not self.sender['contact_id_inter']):
+            raise InvalidAccountNumber(
+                u"There is no account number defined for international "
+                "transportation, please set it in your company settings "
+                "to send parcel outside France")
         # transfom human keys in GLS keys (with 'T' prefix)
-        T_account = self.map_semantic_keys(ACCOUNT_MAPPING, self.sender)
-        T_delivery = self.map_semantic_keys(DELIVERY_MAPPING, delivery)
-        T_parcel = self.map_semantic_keys(PARCEL_MAPPING, parcel)
-        T_address = self.map_semantic_keys(ADDRESS_MAPPING, address)
-        # merge all datas
-        all_dict = {}
-        all_dict.update(T_account)
-        all_dict.update(T_delivery)
-        all_dict.update(T_parcel)
-        all_dict.update(T_address)
-        all_dict.update(self.add_specific_keys(address))
+        if self._T_account is None:
+            self._T_account = self.map_semantic_keys(ACCOUNT_MAPPING,
+                                                     self.sender)
+        # merge all datas common to the parcels
+        common_dict = {}
+        common_dict.update(self._T_account)
+        common_dict.update(
+            self.map_semantic_keys(DELIVERY_COMMON_MAPPING, delivery))
+        common_dict.update(self.map_semantic_keys(ADDRESS_MAPPING, address))
+        common_dict.update(self.add_specific_keys(address))
+        labels = []
+        for parcel in parcels:
+            delivery['gls_origin_reference'] = self.set_origin_reference(
+                parcel, address)
+            all_dict = common_dict.copy()
+            all_dict.update(
+                self.map_semantic_keys(ORIGIN_REFERENCE_MAPPING, delivery))
+            all_dict.update(self.map_semantic_keys(PARCEL_MAPPING, parcel))
+            labels.append(self._render_label(parcel, address, all_dict))
+        return labels
+
+    def _render_label(self, parcel, address, all_dict):
+        tracking_number = False
         if address['country_code'] != 'FR':
-            label_content = self.select_label(
+            zpl_file = self.select_label(
                 parcel['parcel_number_label'], all_dict, address)
-            if ('contact_id_inter' not in self.sender or
-                    not self.sender['contact_id_inter']):
-                raise InvalidAccountNumber(
-                    u"There is no account number defined for international "
-                    "transportation, please set it in your company settings "
-                    "to send parcel outside France")
         else:
             failed_webservice = False
             # webservice
-            response = self.get_webservice_response(all_dict)
+            try:
+                response = self.get_webservice_response(all_dict)
+            except Exception as e:
+                # any failure of the web service: connection, timeout,
+                # error status, invalid response...
+                if not self.rescue_on_error:
+                    raise
+                logger.info("GLS web service failed (%s), "
+                            "rescue label printed", e)
+                response = None
             # refactor webservice response failed and webservice downed
             if isinstance(response, dict):
                 if self.get_result_analysis(response['RESULT'], all_dict):
@@ -332,24 +485,19 @@ code: %s ; message: %s ; result: %s""" % (code, message, result))
                     tracking_number = all_dict['T8913']
                 else:
                     failed_webservice = True
-                    label_content = self.select_label(
-                        parcel['parcel_number_label'],
-                        all_dict, address,
-                    )
             else:
                 failed_webservice = True
-            label_content = self.select_label(
+            zpl_file = self.select_label(
                 parcel['parcel_number_label'], all_dict, address,
                 failed_webservice=failed_webservice)
         # some keys are not defined by GLS but are in mako template
         # this add empty values to these keys
-        keys_without_value = self.validate_mako(label_content, all_dict.keys())
+        template, template_keys = get_template(zpl_file)
+        keys_without_value = self.validate_mako(template_keys, all_dict)
         if keys_without_value:
-            empty_mapped = (zip(keys_without_value,
-                                [''] * len(keys_without_value)))
-            all_dict.update(dict(empty_mapped))
+            all_dict.update(dict.fromkeys(keys_without_value, ''))
         try:
-            tpl = Template(label_content).render(**all_dict)
+            tpl = template.render(**all_dict)
             content2print = tpl.encode(
                 encoding=REPORT_CODING, errors=ERROR_BEHAVIOR)
             return {
@@ -367,24 +515,78 @@ code: %s ; message: %s ; result: %s""" % (code, message, result))
                 % (str(traceback.error.__class__.__name__), traceback.error))
 
     def get_webservice_response(self, params):
-        request = dict_to_gls_data(params)
-        connection = httplib.HTTPConnection(self.webservice_location, GLS_PORT)
-        connection.request(
-            "POST",
-            self.webservice_method, request.encode(
-                WEB_SERVICE_CODING, 'ignore'))
-        response = connection.getresponse()
-        if response.status != 200:
+        """ Send the label datas to the web service
+
+        The connections are kept alive in `connection_pool`. The request
+        is sent again, after a growing delay, when the web service is
+        unavailable (503, 504), when the connection can't be opened or
+        when a kept-alive connection has been closed by the server
+        before it answers.
+        The request registers the parcel, so it is not sent again after
+        any other error, like a timeout while waiting for the response:
+        the parcel could be registered twice.
+
+        :return: the decoded response, or the HTTP status when the web
+                 service is still unavailable after the retries
+        """
+        request = dict_to_gls_data(params).encode(WEB_SERVICE_CODING,
+                                                  'ignore')
+        address = (self.webservice_location, self.webservice_port,
+                   self.timeout)
+        attempt = 0
+        wait = False
+        while True:
+            if wait:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            wait = True
+            attempt += 1
+            connection = connection_pool.get(*address)
+            reused = connection.sock is not None
+            if not reused:
+                try:
+                    connection.connect()
+                except socket.error as e:
+                    connection.close()
+                    if attempt > self.retries:
+                        raise
+                    logger.info("GLS web service unreachable (%s), "
+                                "new attempt", e)
+                    continue
+            try:
+                connection.request("POST", self.webservice_method, request)
+                response = connection.getresponse()
+            except (httplib.HTTPException, socket.error) as e:
+                connection.close()
+                if not reused or not _is_closed_connection_error(e):
+                    raise
+                logger.info("GLS kept-alive connection closed by the web "
+                            "service (%s), other connection used", e)
+                # the request has not been read, it is not an attempt
+                attempt -= 1
+                wait = False
+                continue
+            try:
+                datas = response.read()
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                raise
             # see http://docs.python.org/release/2.7/library/httplib.html,
             # search 100
-            if response.status in ['503', '504']:
+            if response.status not in (200, ) + RETRY_STATUSES:
+                connection.close()
+                raise Exception(
+                    "Error %s sending request: %s"
+                    % (response.status, response.reason))
+            if response.will_close:
+                connection.close()
+            else:
+                connection_pool.release(connection, *address)
+            if response.status == 200:
+                return gls_decode(datas)
+            if attempt > self.retries:
                 return response.status
-            raise Exception(
-                "Error %s sending request: %s"
-                % (response.status, response.reason))
-        datas = response.read()
-        connection.close()
-        return gls_decode(datas)
+            logger.info("GLS web service unavailable (%s), new attempt",
+                        response.status)
 
     def map_semantic_keys(self, T_keys, datas):
         mapping = {}
@@ -418,19 +620,16 @@ code: %s ; message: %s ; result: %s""" % (code, message, result))
             + address['country_code']
         )
 
-    def validate_mako(self, template, available_keys):
-        import re
-        keys2match = []
-        for match in re.findall(r'\$\{(.+?)\}+', template):
-            keys2match.append(match)
-        unmatch = list(set(keys2match) - set(available_keys))
-        not_in_mako_but_known_case = ['T8900', 'T8901', 'T8717', 'T8911']
-        unknown_unmatch = list(unmatch)
-        for elm in not_in_mako_but_known_case:
-            if elm in unknown_unmatch:
-                unknown_unmatch.remove(elm)
-        if len(unknown_unmatch) > 0:
+    def validate_mako(self, template_keys, available_keys):
+        """ Return the keys of the template without value
+
+        :param template_keys: keys used in the template, see `get_template`
+        :param available_keys: keys having a value
+        """
+        unmatch = template_keys.difference(available_keys)
+        unknown_unmatch = unmatch - NOT_IN_MAKO_BUT_KNOWN_CASE
+        if unknown_unmatch:
             logger.info("GLS carrier : these keys \n%s\nare defined "
                         "in mako template but without valid replacement "
-                        "values\n" % unknown_unmatch)
-        return unmatch
+                        "values\n" % list(unknown_unmatch))
+        return list(unmatch)
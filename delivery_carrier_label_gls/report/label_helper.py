@@ -20,6 +20,7 @@
 ###############################################################################
 
 from datetime import datetime
+import threading
 from . exception_helper import (
     InvalidSize,
     InvalidType,
@@ -28,6 +29,179 @@ from . exception_helper import (
 )
 
 
+def _check_type(field, types, data):
+    if type(data) not in types:
+        string_types = "' or '".join([elm.__name__ for elm in types])
+        raise InvalidType(
+            "'%s' field must be in '%s' type : '%s' given"
+            % (field, string_types, type(data).__name__))
+    return True
+
+
+def _size_check(field, key, val):
+    """ Check of the 'max_size', 'min_size', 'max_number' and
+    'min_number' keys """
+    if key in ('max_size', 'min_size'):
+        types = (str, unicode)
+        size = len
+        label = 'size'
+    else:
+        types = (int, float)
+        size = None
+        label = 'number'
+    maximum = key.startswith('max_')
+    message = "%s %s for field '%%s' is %%s :  %%s given" % (
+        'Max' if maximum else 'Min', label)
+
+    def check(datas):
+        data = datas[field]
+        _check_type(field, types, data)
+        value = size(data) if size else data
+        if value > val if maximum else value < val:
+            raise InvalidSize(message % (field, val, value))
+    return check
+
+
+def _in_check(field, val):
+    allowed = frozenset(val)
+
+    def check(datas):
+        data = datas[field]
+        try:
+            found = data in allowed
+        except TypeError:
+            # unhashable value
+            found = False
+        if not found:
+            raise InvalidValueNotInList(
+                "field '%s' with value '%s' must belong "
+                "to this list %s"
+                % (field, data, val))
+    return check
+
+
+def _date_check(field, val):
+
+    def check(datas):
+        data = datas[field]
+        _check_type(field, (str, datetime), data)
+        try:
+            if isinstance(data, datetime):
+                datas[field] = datetime.strftime(data, val)
+            else:
+                # transform in unicode to be used by template
+                datas[field] = unicode(
+                    datetime.strptime(data, val).strftime(val))
+        except Exception:
+            raise InvalidType(
+                "The date '%s' must be in the format '%s'" % (data, val))
+    return check
+
+
+def _numeric_check(field, val):
+
+    def check(datas):
+        # TODO : to end
+        data = datas[field]
+        _check_type(field, (int, float), data)
+        datas[field] = val % data
+    return check
+
+
+class FieldValidator(object):
+    """ Checks of a field of a model, built once from its definition """
+
+    __slots__ = ('field', 'types', 'required', 'checks')
+
+    def __init__(self, field, definition):
+        self.field = field
+        self.types = None
+        if 'type' in definition:
+            self.types = (definition['type'], )
+        self.required = definition.get('required') is True
+        self.checks = []
+        # same order as the keys of the definition
+        for key, val in definition.items():
+            if key in ('max_size', 'min_size', 'max_number', 'min_number'):
+                self.checks.append(_size_check(field, key, val))
+            elif key == 'in':
+                self.checks.append(_in_check(field, val))
+            elif key == 'date':
+                self.checks.append(_date_check(field, val))
+            elif key == 'numeric':
+                self.checks.append(_numeric_check(field, val))
+
+    def __call__(self, datas, model_name=''):
+        field = self.field
+        # check type before all other checks if requested in model
+        if self.types and field in datas:
+            _check_type(field, self.types, datas[field])
+        if datas.get(field, False) is not False:
+            for check in self.checks:
+                check(datas)
+        elif self.required:
+            raise InvalidMissingField(
+                "Required field '%s' is missing %s" % (field, model_name))
+        else:
+            # case 1/ and case 2/: must have an empty value to be called
+            # in python template (mako, jinja2, etc)
+            datas[field] = u''
+        # case 3/
+        if type(datas[field]) in (int, float, str):
+            datas[field] = unicode(datas[field])
+
+
+class ModelValidator(object):
+    """ Validator of the datas of a model, see AbstractLabel.check_model
+    for the keys of the model """
+
+    def __init__(self, model):
+        self.fields = [FieldValidator(field, definition)
+                       for field, definition in model.items()]
+
+    def _model_name(self, model_name):
+        if model_name:
+            return '(model: ' + model_name + ')'
+        return model_name
+
+    def __call__(self, datas, model_name=''):
+        """ Check and complete the datas, raise on the first error """
+        model_name = self._model_name(model_name)
+        for field in self.fields:
+            field(datas, model_name)
+        return datas
+
+    def errors(self, datas, model_name=''):
+        """ Check and complete the datas
+
+        :return: list of the errors (exceptions), one at most per field
+        """
+        model_name = self._model_name(model_name)
+        errors = []
+        for field in self.fields:
+            try:
+                field(datas, model_name)
+            except (InvalidSize, InvalidType, InvalidValueNotInList,
+                    InvalidMissingField) as e:
+                errors.append(e)
+        return errors
+
+
+# validators of the models, by id of the model
+_validators = {}
+_validators_lock = threading.Lock()
+
+
+def compile_model(model):
+    """ Return the validator of a model, built once per process """
+    cached = _validators.get(id(model))
+    # the model is kept with its validator so its id is never reused
+    if cached is None or cached[0] is not model:
+        with _validators_lock:
+            cached = _validators[id(model)] = (model, ModelValidator(model))
+    return cached[1]
+
+
 class AbstractLabel(object):
 
     def check_model(self, datas, model, model_name=''):
@@ -42,6 +216,7 @@ class AbstractLabel(object):
                                                         (convert one to other)
         - 'min_size' and 'max_size' : this is used for str or unicode
         - 'min_number' and 'max_number' : this is used for int or float
+        - 'in' key : list of the accepted values
         keys examples:
         model = {
             'my_field':     {'max_size': 35, 'required': True},
@@ -50,7 +225,7 @@ class AbstractLabel(object):
         }
 
         Carefull cases considered in this script (search each 'case' string
-        in source code below):
+        in source code above):
             Case 1/ key in model with not in datas :
                     => no check but with a default value '' (only for display)
             Case 2/ key in datas but with a False value (string with no value:
@@ -58,89 +233,23 @@ class AbstractLabel(object):
                     => no check but with a default value ''
             Case 3/ data == 0.0 or 0 which is considered like False but is not:
                     => check but convert in string
+
+        The model is compiled in a validator on its first check.
         """
-        if model_name:
-            model_name = '(model: ' + model_name + ')'
-        for field, definition in model.items():
-            # check type before all other checks if requested in model
-            if 'type' in definition and field in datas:
-                self.check_type(field, [definition['type']], datas[field])
-            to_check = self.must_be_checked(datas, field)
-            for key, val in definition.items():
-                if to_check:
-                    data = datas[field]
-                    size = self.evaluate_size_according_to_type(data)
-                    if key == 'max_size':
-                        self.check_type(field, [str, unicode], data)
-                        if size > val:
-                            raise InvalidSize(
-                                "Max size for field '%s' is "
-                                "%s :  %s given" % (field, val, size))
-                    elif key == 'min_size':
-                        self.check_type(field, [str, unicode], data)
-                        if size < val:
-                            raise InvalidSize(
-                                "Min size for field '%s' is "
-                                "%s :  %s given" % (field, val, size))
-                    elif key == 'min_number':
-                        self.check_type(field, [int, float], data)
-                        if size < val:
-                            raise InvalidSize(
-                                "Min number for field '%s' is "
-                                "%s :  %s given" % (field, val, size))
-                    elif key == 'max_number':
-                        self.check_type(field, [int, float], data)
-                        if size > val:
-                            raise InvalidSize(
-                                "Max number for field '%s' is "
-                                "%s :  %s given" % (field, val, size))
-                    elif key == 'in' and data not in val:
-                        raise InvalidValueNotInList(
-                            "field '%s' with value '%s' must belong "
-                            "to this list %s"
-                            % (field, data, val))
-                    elif key == 'date':
-                        self.check_type(field, [str, datetime], data)
-                        if isinstance(data, datetime):
-                            try:
-                                datas[field] = datetime.strftime(data, val)
-                            except:
-                                raise InvalidType(
-                                    "The date '%s' must be in the format '%s'"
-                                    % (data, val))
-                        elif isinstance(data, str):
-                            try:
-                                datas[field] = \
-                                    datetime.strptime(data, val).strftime(val)
-                                # transform in unicode to be used by template
-                                datas[field] = unicode(datas[field])
-                            except:
-                                raise InvalidType(
-                                    "The date '%s' must be in the format '%s'"
-                                    % (data, val))
-                    elif key == 'numeric':
-                        # TODO : to end
-                        self.check_type(field, [int, float], data)
-                        datas[field] = val % data
-                    data = ''
-                else:
-                    if key == 'required' and val is True:
-                        raise InvalidMissingField(
-                            "Required field '%s' is missing %s"
-                            % (field, model_name))
-                    else:
-                        # must have an empty value to be called
-                        # in python template (mako, jinja2, etc)
-                        if field not in datas:
-                            # case 1/
-                            datas[field] = u''
-                        elif type(datas[field]) == bool:
-                            # case 2/
-                            datas[field] = u''
-            # case 3/
-            if type(datas[field]) in [int, float, str]:
-                datas[field] = unicode(datas[field])
-        return datas
+        return compile_model(model)(datas, model_name)
+
+    def check_models(self, datas_list, model, model_name=''):
+        """ Check a list of datas of the same model, like the parcels
+        of a delivery, without stopping on the first error
+
+        :return: list of (index in datas_list, error) for all the errors
+        """
+        validator = compile_model(model)
+        errors = []
+        for index, datas in enumerate(datas_list):
+            for error in validator.errors(datas, model_name):
+                errors.append((index, error))
+        return errors
 
     def must_be_checked(self, datas, field):
         res = True
@@ -162,9 +271,4 @@ class AbstractLabel(object):
         return res
 
     def check_type(self, field, types, data):
-        if type(data) not in types:
-            string_types = "' or '".join([elm.__name__ for elm in types])
-            raise InvalidType(
-                "'%s' field must be in '%s' type : '%s' given"
-                % (field, string_types, type(data).__name__))
-        return True
+        return _check_type(field, types, data)
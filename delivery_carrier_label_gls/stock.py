@@ -22,7 +22,7 @@
 from openerp.osv import orm
 from openerp.tools.translate import _
 from .report.label import GLSLabel, InvalidDataForMako
-from .report.exception_helper import (InvalidAccountNumber)
+from .report.exception_helper import (InvalidAccountNumber, InvalidParcels)
 from .report.label_helper import (
     InvalidValueNotInList,
     InvalidMissingField,
@@ -60,10 +60,19 @@ class StockPicking(orm.Model):
         """
         :return: see original method
         """
+        gls_ids = []
+        async_ids = []
         for picking in self.browse(cr, uid, ids, context=context):
             if picking.carrier_type == 'gls':
-                self.generate_labels(
-                    cr, uid, [picking.id], context=context)
+                if picking.company_id.gls_async_label:
+                    async_ids.append(picking.id)
+                else:
+                    gls_ids.append(picking.id)
+        if gls_ids:
+            self.generate_gls_labels_batch(cr, uid, gls_ids, context=context)
+        # generated by the scheduled action once the transfer is committed
+        self.pool['gls.label.job'].enqueue(cr, uid, async_ids,
+                                           context=context)
 
         return super(StockPicking, self).action_done(
             cr, uid, ids, context=context)
@@ -72,8 +81,29 @@ class StockPicking(orm.Model):
         "Use this method to override gls picking"
         return True
 
+    def generate_gls_labels_batch(self, cr, uid, ids, context=None):
+        """ Generate the labels of many GLS pickings
+
+        The System Parameters, the senders and the web service
+        connections are shared by the pickings of a company.
+        """
+        ctx = dict(context or {}, gls_cache={})
+        for picking_id in ids:
+            self.generate_labels(cr, uid, [picking_id], context=ctx)
+        return True
+
+    def _get_gls_cache(self, context):
+        """ Cache of the datas shared by the pickings of a batch, see
+        `generate_gls_labels_batch` """
+        if context and 'gls_cache' in context:
+            return context['gls_cache']
+        return {}
+
     def _prepare_global_gls(self, cr, uid, picking=None, context=None):
-        res = {}
+        cache = self._get_gls_cache(context)
+        if 'global' in cache:
+            return cache['global']
+        res = cache['global'] = {}
         param_m = self.pool['ir.config_parameter']
         gls_keys = ['carrier_gls_warehouse', 'carrier_gls_customer_code']
         ids = param_m.search(cr, uid, [('key', 'in', gls_keys)],
@@ -151,13 +181,15 @@ class StockPicking(orm.Model):
         return sender
 
     def _prepare_pack_gls(
-            self, cr, uid, tracking, pack_number, weight=None, context=None):
+            self, cr, uid, tracking, pack_number, weight=None, sequence=None,
+            context=None):
+        if sequence is None:
+            sequence = self._get_sequence(cr, uid, 'gls', context=context)
         pack = {}
         pack.update({
             'parcel_number_label': pack_number,
             'parcel_number_barcode': pack_number,
-            'custom_sequence': self._get_sequence(
-                cr, uid, 'gls', context=context),
+            'custom_sequence': sequence,
         })
         if weight:
             pack.update({
@@ -200,7 +232,6 @@ class StockPicking(orm.Model):
             # restrict on the provided trackings
             trackings = self.pool['stock.tracking'].browse(
                 cr, uid, tracking_ids, context=context)
-        labels = []
         without_track = 0
         for track in trackings:
             if not track:
@@ -209,13 +240,10 @@ class StockPicking(orm.Model):
         delivery = self._prepare_delivery_gls(
             cr, uid, picking, pick2update['number_of_packages'],
             context=context)
-        # Write tracking_number on serial field
-        # for move lines with tracking
-        # and on picking for other moves
+        packings = []
         for packing in trackings:
             pack_nbr += 1
-            addr = address.copy()
-            deliv = delivery.copy()
+            weight = None
             if not packing:
                 without_track -= 1
                 if without_track > 0:
@@ -223,14 +251,23 @@ class StockPicking(orm.Model):
                 # only executed for the last move line with no tracking
                 weight = self._get_weight_from_moves_without_tracking(
                     cr, uid, picking, context=context)
-                pack = self._prepare_pack_gls(
-                    cr, uid, packing, pack_nbr, weight=weight, context=context)
-                label = self.get_zpl(service, deliv, addr, pack)
+            packings.append((packing, pack_nbr, weight))
+        sequences = self._reserve_sequences(
+            cr, uid, 'gls', len(packings), context=context)
+        packs = [self._prepare_pack_gls(cr, uid, packing, number,
+                                        weight=pack_weight, sequence=sequence,
+                                        context=context)
+                 for (packing, number, pack_weight), sequence
+                 in zip(packings, sequences)]
+        # Write tracking_number on serial field
+        # for move lines with tracking
+        # and on picking for other moves
+        labels = []
+        zpls = self.get_zpls(service, delivery, address, packs)
+        for (packing, __, __), label in zip(packings, zpls):
+            if not packing:
                 pick2update['carrier_tracking_ref'] = label['tracking_number']
             else:
-                pack = self._prepare_pack_gls(
-                    cr, uid, packing, pack_nbr, context=context)
-                label = self.get_zpl(service, deliv, addr, pack)
                 packing.write({'serial': label['tracking_number']})
             label_info = {
                 'tracking_id': packing.id if packing else False,
@@ -251,18 +288,68 @@ class StockPicking(orm.Model):
         return labels
 
     def get_zpl(self, service, delivery, address, pack):
+        return self.get_zpls(service, delivery, address, [pack])[0]
+
+    def get_zpls(self, service, delivery, address, packs):
         try:
-            result = service.get_label(delivery, address, pack)
+            result = service.get_labels(delivery, address, packs)
         except (InvalidMissingField,
                 InvalidDataForMako,
                 InvalidValueNotInList,
                 InvalidAccountNumber,
+                InvalidParcels,
                 InvalidType) as e:
             raise_exception(orm, e.message)
         except Exception, e:
             raise orm.except_orm(EXCEPT_TITLE, e.message)
         return result
 
+    def _prepare_gls_service_options(self, cr, uid, picking, context=None):
+        """ Timeout and retries of the web service, the defaults of
+        GLSLabel are used without 'carrier_gls_timeout' and
+        'carrier_gls_retries' System Parameters """
+        options = {}
+        param_m = self.pool['ir.config_parameter']
+        for key, option, convert in (('carrier_gls_timeout', 'timeout', float),
+                                     ('carrier_gls_retries', 'retries', int)):
+            value = param_m.get_param(cr, uid, key, context=context)
+            if value:
+                options[option] = convert(value)
+        if context and context.get('gls_rescue_on_error'):
+            options['rescue_on_error'] = True
+        return options
+
+    def _get_gls_service(self, cr, uid, picking, context=None):
+        """ Return the GLSLabel of the sender of the picking, it is shared
+        by the pickings of a batch with the same sender """
+        partner = self.pool['stock.picking.out']._get_label_sender_address(
+            cr, uid, picking, context=context)
+        services = self._get_gls_cache(context).setdefault('services', {})
+        key = (picking.company_id.id, partner.id, picking.carrier_code,
+               bool(context and context.get('gls_rescue_on_error')))
+        if key in services:
+            return services[key]
+        sender = self._prepare_sender_gls(
+            cr, uid, picking, context=context)
+        # gls has a rescue label without webservice required
+        # if webservice is down
+        # rescue label is also used for international carrier
+        test = False
+        if picking.company_id.gls_test:
+            test = True
+        options = self._prepare_gls_service_options(
+            cr, uid, picking, context=context)
+        try:
+            service = GLSLabel(
+                sender, picking.carrier_code, test_plateform=test,
+                **options)
+        except InvalidMissingField as e:
+            raise_exception(orm, e.message)
+        except Exception as e:
+            raise_exception(orm, e.message)
+        services[key] = service
+        return service
+
     def generate_shipping_labels(
             self, cr, uid, ids, tracking_ids=None, context=None):
         """ Add label generation for GLS """
@@ -271,21 +358,7 @@ class StockPicking(orm.Model):
         assert len(ids) == 1
         picking = self.browse(cr, uid, ids[0], context=context)
         if picking.carrier_id.type == 'gls':
-            sender = self._prepare_sender_gls(
-                cr, uid, picking, context=context)
-            # gls has a rescue label without webservice required
-            # if webservice is down
-            # rescue label is also used for international carrier
-            test = False
-            if picking.company_id.gls_test:
-                test = True
-            try:
-                service = GLSLabel(
-                    sender, picking.carrier_code, test_plateform=test)
-            except InvalidMissingField as e:
-                raise_exception(orm, e.message)
-            except Exception as e:
-                raise_exception(orm, e.message)
+            service = self._get_gls_service(cr, uid, picking, context=context)
             return self._generate_gls_labels(
                 cr, uid, picking, service,
                 tracking_ids=tracking_ids,
@@ -304,6 +377,57 @@ class StockPicking(orm.Model):
                 % label_name)
         return sequence
 
+    def _reserve_sequences(self, cr, uid, label_name, count, context=None):
+        """ Return `count` numbers of the sequence of a label, they are
+        taken in one query instead of one `next_by_code` per label """
+        if not count:
+            return []
+        seq_m = self.pool['ir.sequence']
+        company_ids = self.pool['res.company'].search(
+            cr, uid, [], context=context) + [False]
+        seq_ids = seq_m.search(
+            cr, uid, [('code', '=', 'stock.picking_' + label_name),
+                      ('company_id', 'in', company_ids)],
+            context=context)
+        if not seq_ids:
+            raise orm.except_orm(
+                _("Picking sequence"),
+                _("There is no sequence defined for the label '%s'")
+                % label_name)
+        # same choice of the sequence as ir.sequence._next
+        force_company = (context or {}).get('force_company')
+        if not force_company:
+            force_company = self.pool['res.users'].browse(
+                cr, uid, uid, context=context).company_id.id
+        sequences = seq_m.read(
+            cr, uid, seq_ids,
+            ['company_id', 'implementation', 'number_increment', 'padding',
+             'prefix', 'suffix'], context=context)
+        preferred = [seq for seq in sequences
+                     if seq['company_id'] and
+                     seq['company_id'][0] == force_company]
+        seq = preferred and preferred[0] or sequences[0]
+        if seq['implementation'] == 'standard':
+            cr.execute("SELECT nextval('ir_sequence_%03d') "
+                       "FROM generate_series(1, %%s)" % seq['id'], (count,))
+            numbers = [row[0] for row in cr.fetchall()]
+        else:
+            cr.execute("SELECT number_next FROM ir_sequence "
+                       "WHERE id=%s FOR UPDATE NOWAIT", (seq['id'], ))
+            number_next = cr.fetchone()[0]
+            cr.execute("UPDATE ir_sequence "
+                       "SET number_next=number_next+number_increment*%s "
+                       "WHERE id=%s", (count, seq['id']))
+            numbers = [number_next + index * seq['number_increment']
+                       for index in range(count)]
+            seq_m.invalidate_cache(cr, uid, ['number_next'], [seq['id']],
+                                   context=context)
+        d = seq_m._interpolation_dict()
+        prefix = seq_m._interpolate(seq['prefix'], d)
+        suffix = seq_m._interpolate(seq['suffix'], d)
+        return [prefix + '%%0%sd' % seq['padding'] % number + suffix
+                for number in numbers]
+
 
 class StockPickingOut(orm.Model):
     _inherit = 'stock.picking.out'
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from . import test_webservice
+from . import test_label_helper
+from . import test_reserve_sequences
+from . import test_label_job
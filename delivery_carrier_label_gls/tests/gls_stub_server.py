@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+""" Local stub of the GLS Unibox web service """
+
+import BaseHTTPServer
+import SocketServer
+import threading
+import time
+
+SUCCESS = (r'\\\\\GLS\\\\\|RESULT:E000:OK|T8913:TRACKING01|'
+           r'T8904:001|/////GLS/////')
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep-alive connections
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.getheader('content-length', 0))
+        server.requests.append(self.rfile.read(length))
+        server.clients.append(self.client_address)
+        options = {}
+        if server.responses:
+            response = server.responses.pop(0)
+            status, body = response[:2]
+            if len(response) > 2:
+                options = response[2]
+        else:
+            status, body = 200, SUCCESS
+        time.sleep(options.get('delay', 0))
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if options.get('close'):
+            # close the connection without telling the client
+            self.close_connection = 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+    # a kept-alive connection must not block the shutdown
+    daemon_threads = True
+
+
+class GLSStubServer(object):
+    """ Answer the requests with the given (status, body) responses,
+    then with a successful response
+
+    A response can have a third item, a dict of options: 'delay' waits
+    before answering, 'close' closes the kept-alive connection after
+    the response.
+
+    with GLSStubServer([(503, '')]) as server:
+        GLSLabel(sender, code, url=server.url)...
+    """
+
+    def __init__(self, responses=None):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.httpd.responses = list(responses or [])
+        self.httpd.requests = []
+        self.httpd.clients = []
+        self.url = 'http://127.0.0.1:%s/cgi-bin/glsboxGITest.cgi' % (
+            self.httpd.server_port)
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def clients(self):
+        return self.httpd.clients
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import unittest
+
+from ..report.exception_helper import (
+    InvalidMissingField,
+    InvalidSize,
+    InvalidValueNotInList,
+)
+from ..report.label_helper import AbstractLabel
+
+MODEL = {
+    'name': {'max_size': 5, 'required': True},
+    'country': {'in': ['FR', 'BE'], 'required': True},
+    'number': {'max_number': 99, 'type': int},
+    'date': {'date': '%Y%m%d'},
+    'note': {'max_size': 10},
+}
+
+
+class TestCheckModel(unittest.TestCase):
+
+    def setUp(self):
+        super(TestCheckModel, self).setUp()
+        self.label = AbstractLabel()
+
+    def test_check_model(self):
+        datas = {'name': 'Akr', 'country': 'FR', 'number': 0,
+                 'date': '20150101', 'note': False}
+        self.label.check_model(datas, MODEL, 'partner')
+        self.assertEqual(datas, {'name': u'Akr', 'country': u'FR',
+                                 'number': u'0', 'date': u'20150101',
+                                 'note': u''})
+
+    def test_check_model_error(self):
+        with self.assertRaises(InvalidValueNotInList):
+            self.label.check_model({'name': 'Akr', 'country': 'DE'}, MODEL)
+        with self.assertRaises(InvalidMissingField):
+            self.label.check_model({'name': 'Akr'}, MODEL)
+
+    def test_check_models(self):
+        """ All the errors of the datas are returned """
+        datas_list = [
+            {'name': 'Akr', 'country': 'FR'},
+            {'name': 'Akretion', 'country': 'DE'},
+            {'country': 'BE', 'number': 100},
+        ]
+        errors = self.label.check_models(datas_list, MODEL, 'partner')
+        self.assertEqual(
+            sorted((index, error.__class__) for index, error in errors),
+            [(1, InvalidSize), (1, InvalidValueNotInList),
+             (2, InvalidSize), (2, InvalidMissingField)])
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from datetime import datetime, timedelta
+import unittest
+
+from openerp.tools import DEFAULT_SERVER_DATETIME_FORMAT
+
+from .. import label_job
+from ..label_job import GlsLabelJob
+
+NOW = datetime(2015, 3, 2, 10, 0, 0)
+
+
+class FixedDatetime(datetime):
+
+    @classmethod
+    def utcnow(cls):
+        return NOW
+
+
+def date_str(date):
+    return date.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
+
+
+class FakeRecord(object):
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+class FakeCursor(object):
+
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakePicking(object):
+
+    """ generate_labels of the stock.picking model, failing for
+    the pickings in `failing_ids` """
+
+    def __init__(self, failing_ids=()):
+        self.failing_ids = failing_ids
+        self.calls = []
+
+    def generate_labels(self, cr, uid, ids, context=None):
+        self.calls.append((ids, context.get('gls_rescue_on_error', False)))
+        if set(ids) & set(self.failing_ids):
+            raise Exception('GLS web service unavailable')
+
+
+class FakeLabelJob(object):
+
+    """ The methods of the queue on jobs kept in memory """
+
+    _batch_size = GlsLabelJob._batch_size
+    _max_attempts = GlsLabelJob._max_attempts
+    _retry_delay = GlsLabelJob._retry_delay
+
+    _get_due_jobs = GlsLabelJob._get_due_jobs.__func__
+    _run_job = GlsLabelJob._run_job.__func__
+    _postpone = GlsLabelJob._postpone.__func__
+    consume = GlsLabelJob.consume.__func__
+    action_retry = GlsLabelJob.action_retry.__func__
+
+    def __init__(self, jobs, picking_model):
+        self.jobs = dict((job.id, job) for job in jobs)
+        self.pool = {'stock.picking': picking_model}
+
+    def search(self, cr, uid, domain, limit=None, context=None):
+        # only the domain of _get_due_jobs is supported
+        now = domain[-1][2]
+        self.searched_domain = domain
+        return sorted(
+            job.id for job in self.jobs.itervalues()
+            if job.state == 'pending' and
+            (not job.next_date or job.next_date <= now))[:limit]
+
+    def browse(self, cr, uid, ids, context=None):
+        if isinstance(ids, (int, long)):
+            return self.jobs[ids]
+        return [self.jobs[job_id] for job_id in ids]
+
+    def write(self, cr, uid, ids, values, context=None):
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        for job_id in ids:
+            self.jobs[job_id].__dict__.update(values)
+
+    def unlink(self, cr, uid, ids, context=None):
+        for job_id in ids:
+            del self.jobs[job_id]
+
+
+class TestLabelJob(unittest.TestCase):
+
+    def setUp(self):
+        super(TestLabelJob, self).setUp()
+        self._datetime = label_job.datetime
+        label_job.datetime = FixedDatetime
+        self.cr = FakeCursor()
+        self.pickings = FakePicking(failing_ids=[12])
+
+    def tearDown(self):
+        label_job.datetime = self._datetime
+        super(TestLabelJob, self).tearDown()
+
+    def _job(self, job_id, attempts=0, next_date=False, state='pending'):
+        return FakeRecord(
+            id=job_id, attempts=attempts, next_date=next_date,
+            state=state, error=False,
+            picking_id=FakeRecord(id=job_id + 10,
+                                  name='OUT/%05d' % job_id))
+
+    def test_postpone_delay(self):
+        """ The delay before the next attempt is doubled each time """
+        job = self._job(1)
+        queue = FakeLabelJob([job], self.pickings)
+        for attempts, minutes in ((1, 2), (2, 4), (3, 8), (4, 16)):
+            queue._postpone(self.cr, 1, job.id, u'error %s' % attempts)
+            self.assertEqual(job.attempts, attempts)
+            self.assertEqual(job.state, 'pending')
+            self.assertEqual(job.error, u'error %s' % attempts)
+            self.assertEqual(job.next_date,
+                             date_str(NOW + timedelta(minutes=minutes)))
+
+    def test_postpone_failed(self):
+        """ The job is failed after the last attempt """
+        job = self._job(1, attempts=4, next_date=date_str(NOW))
+        queue = FakeLabelJob([job], self.pickings)
+        queue._postpone(self.cr, 1, job.id, u'unavailable')
+        self.assertEqual(job.attempts, 5)
+        self.assertEqual(job.state, 'failed')
+        self.assertEqual(job.next_date, date_str(NOW))
+
+    def test_rescue_last_attempt(self):
+        """ The rescue label is only asked on the last attempt """
+        pickings = FakePicking()
+        queue = FakeLabelJob([], pickings)
+        queue._run_job(self.cr, 1, self._job(1, attempts=3))
+        queue._run_job(self.cr, 1, self._job(2, attempts=4))
+        self.assertEqual(pickings.calls, [([11], False), ([12], True)])
+
+    def test_consume(self):
+        """ The due jobs are run, the failed one is planned again """
+        past = date_str(NOW - timedelta(minutes=1))
+        future = date_str(NOW + timedelta(minutes=1))
+        jobs = [self._job(1),
+                self._job(2, next_date=past),
+                self._job(3, next_date=future),
+                self._job(4, attempts=5, state='failed')]
+        queue = FakeLabelJob(jobs, self.pickings)
+        queue.consume(self.cr, 1)
+        self.assertEqual(queue.searched_domain[-1],
+                         ('next_date', '<=', date_str(NOW)))
+        # the job not due and the failed job are not run
+        self.assertEqual(self.pickings.calls, [([11], False), ([12], False)])
+        self.assertEqual(sorted(queue.jobs), [2, 3, 4])
+        self.assertEqual(jobs[1].attempts, 1)
+        self.assertEqual(jobs[1].error, u'GLS web service unavailable')
+        self.assertEqual(jobs[1].next_date,
+                         date_str(NOW + timedelta(minutes=2)))
+        self.assertEqual(jobs[2].attempts, 0)
+        self.assertEqual(self.cr.commits, 2)
+        self.assertEqual(self.cr.rollbacks, 1)
+
+    def test_consume_no_commit(self):
+        """ Without commit, the errors are raised """
+        queue = FakeLabelJob([self._job(2)], self.pickings)
+        with self.assertRaises(Exception):
+            queue.consume(self.cr, 1, commit=False)
+        self.assertEqual(self.cr.rollbacks, 0)
+
+    def test_retry(self):
+        """ A failed job is planned again from its first attempt """
+        job = self._job(1, attempts=5, next_date=date_str(NOW),
+                        state='failed')
+        job.error = u'unavailable'
+        queue = FakeLabelJob([job], self.pickings)
+        queue.action_retry(self.cr, 1, [job.id])
+        self.assertEqual(job.state, 'pending')
+        self.assertEqual(job.attempts, 0)
+        self.assertFalse(job.next_date)
+        self.assertFalse(job.error)
+        queue.consume(self.cr, 1)
+        self.assertEqual(self.pickings.calls, [([11], False)])
+        self.assertFalse(queue.jobs)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import openerp.tests.common as common
+
+
+class TestReserveSequences(common.TransactionCase):
+
+    """ The numbers reserved at once follow the sequence like next_by_code """
+
+    def setUp(self):
+        super(TestReserveSequences, self).setUp()
+        self.Picking = self.registry('stock.picking')
+        self.Sequence = self.registry('ir.sequence')
+
+    def _create_sequence(self, implementation):
+        cr, uid = self.cr, self.uid
+        code = 'stock.picking_gls_%s' % implementation
+        self.registry('ir.sequence.type').create(
+            cr, uid, {'name': code, 'code': code})
+        self.Sequence.create(
+            cr, uid,
+            {'name': code,
+             'code': code,
+             'implementation': implementation,
+             'prefix': 'GLS/',
+             'suffix': '/X',
+             'padding': 4,
+             'number_next': 5,
+             'number_increment': 3,
+             'company_id': False})
+        return code
+
+    def _check_reserve(self, implementation):
+        cr, uid = self.cr, self.uid
+        code = self._create_sequence(implementation)
+        numbers = self.Picking._reserve_sequences(
+            cr, uid, 'gls_%s' % implementation, 3)
+        self.assertEqual(numbers, ['GLS/0005/X', 'GLS/0008/X', 'GLS/0011/X'])
+        # the next number is not one of the reserved numbers
+        self.assertEqual(self.Sequence.next_by_code(cr, uid, code),
+                         'GLS/0014/X')
+        self.assertEqual(self.Picking._reserve_sequences(
+            cr, uid, 'gls_%s' % implementation, 1), ['GLS/0017/X'])
+
+    def test_reserve_standard(self):
+        self._check_reserve('standard')
+
+    def test_reserve_no_gap(self):
+        self._check_reserve('no_gap')
+
+    def test_reserve_none(self):
+        self.assertEqual(self.Picking._reserve_sequences(
+            self.cr, self.uid, 'gls', 0), [])
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import errno
+import httplib
+import socket
+import unittest
+
+import mock
+
+from ..report.exception_helper import (
+    InvalidMissingField, InvalidParcels, InvalidType)
+from ..report import label as label_module
+from ..report.label import GLSLabel, connection_pool
+from .gls_stub_server import SUCCESS, GLSStubServer
+
+
+class TestWebservice(unittest.TestCase):
+
+    def setUp(self):
+        super(TestWebservice, self).setUp()
+        connection_pool.clear()
+        self.sender = {
+            'customer_id': u'2500000000',
+            'outbound_depot': u'250',
+            'shipper_name': u'Akretion',
+            'shipper_street': u'35 rue Montgolfier',
+            'shipper_zip': u'69100',
+            'shipper_city': u'Villeurbanne',
+            'shipper_country': 'FR',
+        }
+        self.params = {'T860': u'CONSIGNEE', 'T330': u'69100'}
+
+    def tearDown(self):
+        connection_pool.clear()
+        super(TestWebservice, self).tearDown()
+
+    def _get_service(self, server, **kwargs):
+        kwargs.setdefault('backoff', 0)
+        return GLSLabel(self.sender, 'gls', url=server.url, **kwargs)
+
+    def test_keep_alive(self):
+        """ The connection is reused by the next labels """
+        with GLSStubServer() as server:
+            service = self._get_service(server)
+            for __ in range(3):
+                response = service.get_webservice_response(self.params)
+                self.assertEqual(response['T8913'], u'TRACKING01')
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(len(set(server.clients)), 1)
+
+    def test_retry_unavailable(self):
+        """ The request is sent again when the service is unavailable """
+        with GLSStubServer([(503, 'busy'), (504, 'timeout')]) as server:
+            service = self._get_service(server, retries=2)
+            response = service.get_webservice_response(self.params)
+        self.assertEqual(response['T8913'], u'TRACKING01')
+        self.assertEqual(len(server.requests), 3)
+
+    def test_still_unavailable(self):
+        """ The status is returned when the retries are exhausted,
+        so a rescue label is printed """
+        with GLSStubServer([(503, 'busy')] * 3) as server:
+            service = self._get_service(server, retries=1)
+            response = service.get_webservice_response(self.params)
+        self.assertEqual(response, 503)
+        self.assertEqual(len(server.requests), 2)
+
+    def test_error(self):
+        """ Other errors are not retried """
+        with GLSStubServer([(500, 'error')]) as server:
+            service = self._get_service(server)
+            with self.assertRaises(Exception):
+                service.get_webservice_response(self.params)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_retry_connect(self):
+        """ The request is sent again when the connection fails """
+        refused = socket.error(errno.ECONNREFUSED, 'Connection refused')
+        with GLSStubServer() as server:
+            service = self._get_service(server, retries=2)
+            with mock.patch.object(httplib.HTTPConnection, 'connect',
+                                   side_effect=refused) as connect:
+                with self.assertRaises(socket.error):
+                    service.get_webservice_response(self.params)
+        self.assertEqual(connect.call_count, 3)
+        self.assertFalse(server.requests)
+
+    def test_retry_closed_connection(self):
+        """ A kept-alive connection closed by the server is replaced """
+        with GLSStubServer([(200, SUCCESS, {'close': True})]) as server:
+            service = self._get_service(server, retries=0)
+            for __ in range(2):
+                response = service.get_webservice_response(self.params)
+                self.assertEqual(response['T8913'], u'TRACKING01')
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(len(set(server.clients)), 2)
+
+    def test_read_timeout(self):
+        """ A slow response is not sent again, it could register the
+        parcel twice """
+        with GLSStubServer([(200, SUCCESS, {'delay': 0.5})]) as server:
+            service = self._get_service(server, timeout=0.1, retries=2)
+            with self.assertRaises(socket.timeout):
+                service.get_webservice_response(self.params)
+        self.assertEqual(len(server.requests), 1)
+
+    def _render_label(self, service):
+        """ Render a label without template, return the label and
+        whether the rescue label has been selected """
+        template = mock.Mock()
+        template.render.return_value = u'ZPL'
+        with mock.patch.object(label_module, 'get_template',
+                               return_value=(template, set())), \
+                mock.patch.object(GLSLabel, 'select_label',
+                                  return_value='label.mako') as select:
+            label = service._render_label(
+                {'parcel_number_label': 1}, {'country_code': 'FR'},
+                dict(self.params))
+        return label, select.call_args[1]['failed_webservice']
+
+    def test_rescue_on_error(self):
+        """ Any failure of the web service prints the rescue label """
+        with GLSStubServer([(500, 'error')]) as server:
+            service = self._get_service(server, rescue_on_error=True)
+            label, rescue = self._render_label(service)
+        self.assertTrue(rescue)
+        self.assertEqual(label['content'], 'ZPL')
+        self.assertFalse(label['tracking_number'])
+
+    def test_no_rescue_on_error(self):
+        """ Without rescue_on_error, the error is raised """
+        with GLSStubServer([(500, 'error')]) as server:
+            service = self._get_service(server)
+            with self.assertRaises(Exception):
+                self._render_label(service)
+
+    def test_invalid_parcels(self):
+        """ The errors of all the parcels are raised at once """
+        with GLSStubServer() as server:
+            service = self._get_service(server)
+            parcels = [
+                {'parcel_number_label': 1,
+                 'parcel_number_barcode': 1,
+                 'custom_sequence': u'0000000001'},
+                {'parcel_number_label': u'2',
+                 'parcel_number_barcode': 2,
+                 'custom_sequence': u'0000000002',
+                 'weight': u'1.00'},
+            ]
+            with self.assertRaises(InvalidParcels) as raised:
+                service.get_labels({}, {}, parcels)
+        self.assertFalse(server.requests)
+        self.assertEqual(
+            [(index, error.__class__) for index, error in
+             raised.exception.errors],
+            [(0, InvalidMissingField), (1, InvalidType)])
+        message = raised.exception.message
+        self.assertIn(u'parcel 1: ', message)
+        self.assertIn(u'parcel 2: ', message)
@@ -19,6 +19,7 @@
 #
 ##############################################################################
 from . import company
+from . import partner
 from . import res_config
 from . import postlogistics
 from . import delivery
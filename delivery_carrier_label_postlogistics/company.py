@@ -18,9 +18,11 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
-from openerp import models, fields
+from openerp import models, fields, api
 from openerp.tools import file_open
 
+from .postlogistics.web_service import PostlogisticsWebService
+
 
 class ResCompany(models.Model):
     _inherit = 'res.company'
@@ -76,3 +78,15 @@ class ResCompany(models.Model):
         wsdl_url = 'file://' + wsdl_path
         for company in self:
             self.postlogistics_wsdl_url = wsdl_url
+
+    @api.multi
+    def write(self, vals):
+        """ Drop the PostLogistics clients when their settings change """
+        res = super(ResCompany, self).write(vals)
+        if any(field.startswith('postlogistics_') for field in vals):
+            for company in self:
+                PostlogisticsWebService.clear_client_cache(company)
+        elif 'partner_id' in vals:
+            for company in self:
+                PostlogisticsWebService.clear_customer_cache(company)
+        return res
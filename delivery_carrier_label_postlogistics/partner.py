@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from openerp import models, api
+
+from .postlogistics.web_service import PostlogisticsWebService
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    # fields of the company partners sent in the PostLogistics customer
+    _postlogistics_customer_fields = ('name', 'street', 'zip', 'city',
+                                      'country_id')
+
+    @api.multi
+    def write(self, vals):
+        """ Drop the PostLogistics customer of the companies of the
+        partners, it is prepared from their address
+
+        """
+        res = super(ResPartner, self).write(vals)
+        if not any(field in vals
+                   for field in self._postlogistics_customer_fields):
+            return res
+        companies = self.env['res.company'].sudo().search(
+            [('partner_id', 'in', self.ids)])
+        for company in companies:
+            PostlogisticsWebService.clear_customer_cache(company)
+        return res
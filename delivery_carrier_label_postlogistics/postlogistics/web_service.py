@@ -18,18 +18,23 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
+import copy
+import os
 import re
 import logging
+import threading
 from PIL import Image
 from StringIO import StringIO
 
 from openerp.osv import orm
+from openerp.tools import config, ustr
 from openerp.tools.translate import _
 
 _compile_itemid = re.compile(r'[^0-9A-Za-z+\-_]')
 _logger = logging.getLogger(__name__)
 
 try:
+    from suds.cache import ObjectCache
     from suds.client import Client, WebFault
     from suds.transport.http import HttpAuthenticated
 except ImportError:
@@ -38,6 +43,16 @@ except ImportError:
         'If you plan to use it, please install the suds library '
         'from https://pypi.python.org/pypi/suds')
 
+# suds clients with a parsed WSDL, shared by the whole process
+# {(database, company id, wsdl url, username, password): client}
+_clients = {}
+# ns0:Language enumerations of the clients, with the same keys
+_languages = {}
+# prepared ns0:Customer of the companies
+# {(database, company id): (last update of company and partner, customer)}
+_customers = {}
+_clients_lock = threading.Lock()
+
 
 class PostlogisticsWebService(object):
 
@@ -50,16 +65,79 @@ class PostlogisticsWebService(object):
 
     """
 
+    # maximum number of items sent in a single GenerateLabel request
+    max_items_per_request = 100
+
     def __init__(self, company):
         self.init_connection(company)
 
     def init_connection(self, company):
-        t = HttpAuthenticated(
-            username=company.postlogistics_username,
-            password=company.postlogistics_password)
-        self.client = Client(
-            company.postlogistics_wsdl_url,
-            transport=t)
+        key = (company.env.cr.dbname,
+               company.id,
+               company.postlogistics_wsdl_url,
+               company.postlogistics_username,
+               company.postlogistics_password)
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                t = HttpAuthenticated(
+                    username=company.postlogistics_username,
+                    password=company.postlogistics_password)
+                client = Client(
+                    company.postlogistics_wsdl_url,
+                    transport=t,
+                    cache=self._get_wsdl_cache())
+                _clients[key] = client
+        self._client_key = key
+        # a clone shares the parsed WSDL but has its own options
+        # so it can be used concurrently with the other clones
+        self.client = client.clone()
+
+    def clone(self):
+        """ Return a copy of the web service with its own suds client
+
+        The copy can be used in another thread as it does not need
+        the ORM to be created.
+
+        """
+        web_service = copy.copy(self)
+        web_service.client = self.client.clone()
+        return web_service
+
+    def _get_wsdl_cache(self):
+        """ Return the on-disk cache of the WSDL and XSD documents """
+        location = os.path.join(config['data_dir'], 'postlogistics', 'suds')
+        return ObjectCache(location=location, days=30)
+
+    @staticmethod
+    def clear_client_cache(company=None):
+        """ Drop the shared clients, only the ones of a company if given
+
+        To call when the PostLogistics settings of a company change.
+
+        """
+        with _clients_lock:
+            if company is None:
+                _clients.clear()
+                _languages.clear()
+                _customers.clear()
+                return
+            company_key = (company.env.cr.dbname, company.id)
+            for key in _clients.keys():
+                if key[:2] == company_key:
+                    del _clients[key]
+                    _languages.pop(key, None)
+            _customers.pop(company_key, None)
+
+    @staticmethod
+    def clear_customer_cache(company):
+        """ Drop the prepared customer block of a company
+
+        To call when the address or the logo of the company change.
+
+        """
+        with _clients_lock:
+            _customers.pop((company.env.cr.dbname, company.id), None)
 
     def _send_request(self, request, **kwargs):
         """ Wrapper for API requests
@@ -96,7 +174,10 @@ class PostlogisticsWebService(object):
         :return: language code to use.
 
         """
-        available_languages = self.client.factory.create('ns0:Language')
+        available_languages = _languages.get(self._client_key)
+        if available_languages is None:
+            available_languages = self.client.factory.create('ns0:Language')
+            _languages[self._client_key] = available_languages
         lang_code = lang.split('_')[0]
         if lang_code in available_languages:
             return lang_code
@@ -193,6 +274,29 @@ class PostlogisticsWebService(object):
 
         """
         company = picking.company_id
+        key = (company.env.cr.dbname, company.id)
+        # the cache is dropped when the company or its partner are
+        # written, the stamp covers the writes made by other processes
+        stamp = (company.write_date,
+                 company.partner_id.id,
+                 company.partner_id.write_date)
+        cached = _customers.get(key)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, self._prepare_company_customer(company))
+            _customers[key] = cached
+        # callers may complete the dict
+        return dict(cached[1])
+
+    def _prepare_company_customer(self, company):
+        """ Create a ns0:Customer as a dict from a company
+
+        The result is kept for the next labels of the company, as the
+        detection of the logo format needs to decode the image.
+
+        :param company: company browse record
+        :return a dict containing data for ns0:Customer
+
+        """
         partner = company.partner_id
 
         customer = {
@@ -409,29 +513,141 @@ class PostlogisticsWebService(object):
 
         if not response['success']:
             return response
-        error_messages = []
-        warning_messages = []
         for item in response['value'].Data.Provider.Sending.Item:
-            if hasattr(item, 'Errors') and item.Errors:
-                for error in item.Errors.Error:
-                    message = '[%s] %s' % (error.Code, error.Message)
-                    error_messages.append(message)
-            else:
-                file_type = output_format if output_format != 'spdf' else 'pdf'
-                res['value'].append({
-                    'item_id': item.ItemID,
-                    'binary': item.Label,
-                    'tracking_number': item.IdentCode,
-                    'file_type': file_type,
-                })
-
-            if hasattr(item, 'Warnings') and item.Warnings:
-                for warning in item.Warnings.Warning:
-                    message = '[%s] %s' % (warning.Code, warning.Message)
-                    warning_messages.append(message)
-
-        if error_messages:
-            res['errors'] = error_messages
-        if warning_messages:
-            res['warnings'] = warning_messages
+            self._read_response_item(item, output_format, res)
         return res
+
+    def _read_response_item(self, item, output_format, res):
+        """ Add the label, errors and warnings of a response item to
+        a result as returned by `generate_label`
+
+        """
+        if hasattr(item, 'Errors') and item.Errors:
+            for error in item.Errors.Error:
+                message = '[%s] %s' % (error.Code, error.Message)
+                res.setdefault('errors', []).append(message)
+        else:
+            file_type = output_format if output_format != 'spdf' else 'pdf'
+            res['value'].append({
+                'item_id': item.ItemID,
+                'binary': item.Label,
+                'tracking_number': item.IdentCode,
+                'file_type': file_type,
+            })
+
+        if hasattr(item, 'Warnings') and item.Warnings:
+            for warning in item.Warnings.Warning:
+                message = '[%s] %s' % (warning.Code, warning.Message)
+                res.setdefault('warnings', []).append(message)
+
+    @staticmethod
+    def _error_message(error):
+        """ Return the message of an exception for the errors of a result
+        """
+        if isinstance(error, orm.except_orm):
+            return '%s: %s' % (error.name, error.value)
+        return ustr(error)
+
+    def _get_envelope_key(self, picking):
+        """ Return the values defining the envelope of a picking
+
+        Pickings having the same key can share a GenerateLabel request.
+
+        """
+        return (picking.company_id.id,
+                self._get_license(picking),
+                self._get_label_layout(picking),
+                self._get_output_format(picking),
+                self._get_image_resolution(picking))
+
+    def generate_labels_bulk(self, pickings, packages=None, user_lang=None):
+        """ Generate the labels of many pickings at once
+
+        The items of the pickings sharing the same envelope (license,
+        layout, output format and resolution) are sent together, in
+        requests of at most `max_items_per_request` items. When the
+        envelope of a picking cannot be prepared or a request fails,
+        the error is returned in the result of the pickings concerned
+        and the other requests are still sent.
+
+        :param pickings: browse records of pickings
+        :param packages: optional dict of picking id: list of browse
+                         records of packages to filter on
+        :param user_lang: OpenERP language code
+        :return: dict of picking id: result as returned by
+                 `generate_label`
+
+        """
+        if not user_lang:
+            user_lang = 'en_US'
+        if packages is None:
+            packages = {}
+        lang = self._get_language(user_lang)
+
+        results = {}
+        groups = {}
+        for picking in pickings:
+            try:
+                key = self._get_envelope_key(picking)
+            except Exception as e:
+                _logger.exception('Cannot prepare the PostLogistics label '
+                                  'of picking %s', picking.name)
+                results[picking.id] = {'value': [],
+                                       'errors': [self._error_message(e)]}
+                continue
+            groups.setdefault(key, []).append(picking)
+
+        request = self.client.service.GenerateLabel
+        for group in groups.itervalues():
+            item_list = []
+            # ItemID: picking id, to dispatch the returned items
+            item_pickings = {}
+            for picking in group:
+                res = results[picking.id] = {'value': []}
+                try:
+                    attributes = self._prepare_attributes(picking)
+                    recipient = self._prepare_recipient(picking)
+                    items = self._prepare_item_list(
+                        picking, recipient, attributes,
+                        packages.get(picking.id, []))
+                except Exception as e:
+                    _logger.exception('Cannot prepare the PostLogistics '
+                                      'label of picking %s', picking.name)
+                    res['errors'] = [self._error_message(e)]
+                    continue
+                for item in items:
+                    item_pickings[item['ItemID']] = picking.id
+                item_list += items
+            if not item_list:
+                continue
+
+            first = group[0]
+            step = self.max_items_per_request
+            for start in xrange(0, len(item_list), step):
+                chunk = item_list[start:start + step]
+                picking_ids = set(item_pickings[item['ItemID']]
+                                  for item in chunk)
+                try:
+                    post_customer = self._prepare_customer(first)
+                    output_format = self._get_output_format(first).lower()
+                    data = self._prepare_data(chunk)
+                    envelope = self._prepare_envelope(first, post_customer,
+                                                      data)
+                    response = self._send_request(request, Language=lang,
+                                                  Envelope=envelope)
+                except Exception as e:
+                    # authentication or transport error, the other
+                    # envelopes may still succeed
+                    _logger.exception('PostLogistics GenerateLabel request '
+                                      'failed')
+                    response = {'success': False,
+                                'errors': [self._error_message(e)]}
+                if not response['success']:
+                    for picking_id in picking_ids:
+                        results[picking_id].setdefault(
+                            'errors', []).extend(response['errors'])
+                    continue
+                for item in response['value'].Data.Provider.Sending.Item:
+                    res = results[item_pickings[item.ItemID]]
+                    self._read_response_item(item, output_format, res)
+        return results
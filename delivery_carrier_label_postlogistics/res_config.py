@@ -19,6 +19,7 @@
 #
 ##############################################################################
 import logging
+from multiprocessing.pool import ThreadPool
 
 from openerp import models, fields, api, exceptions, _
 
@@ -27,6 +28,12 @@ from .postlogistics.web_service import PostlogisticsWebService
 _logger = logging.getLogger(__name__)
 
 
+def _call_web_service(args):
+    """ Call a read method of the web service from a worker thread """
+    web_service, method, params = args
+    return getattr(web_service.clone(), method)(*params)
+
+
 class PostlogisticsConfigSettings(models.TransientModel):
     _name = 'postlogistics.config.settings'
     _inherit = 'res.config.settings'
@@ -56,6 +63,13 @@ class PostlogisticsConfigSettings(models.TransientModel):
     default_resolution = fields.Many2one(
         related='company_id.postlogistics_default_resolution',
     )
+    options_update_report = fields.Text(
+        string='Services Update Preview',
+        readonly=True,
+    )
+
+    # number of concurrent calls when reading the services
+    _postlogistics_max_workers = 4
 
     @api.onchange('company_id')
     def onchange_company_id(self):
@@ -79,244 +93,336 @@ class PostlogisticsConfigSettings(models.TransientModel):
         self.default_resolution = resolution
 
     @api.model
-    def _get_delivery_instructions(self, web_service, company, service_code):
-        lang = self.env.context.get('lang', 'en')
-        service_code_list = service_code.split(',')
-        res = web_service.read_delivery_instructions(company,
-                                                     service_code_list,
-                                                     lang)
+    def _check_services_response(self, res, error_message):
+        """ Raise the errors of a response of a read_* call """
         if 'errors' in res:
             errors = '\n'.join(res['errors'])
-            error_message = (_('Could not retrieve Postlogistics delivery '
-                               'instructions:\n%s') % errors)
-            raise exceptions.Warning(error_message)
+            raise exceptions.Warning(error_message % errors)
 
         if not res['value']:
-            return {}
+            return False
 
         if hasattr(res['value'], 'Errors') and res['value'].Errors:
             for error in res['value'].Errors.Error:
                 message = '[%s] %s' % (error.Code, error.Message)
             raise exceptions.Warning(message)
-
-        delivery_instructions = {}
-        for service in res['value'].DeliveryInstructions:
-            service_code = service.PRZL
-            delivery_instructions[service_code] = {'name': service.Description}
-
-        return delivery_instructions
-
-    @api.model
-    def _update_delivery_instructions(self, web_service, additional_services):
-        carrier_option_obj = self.env['delivery.carrier.template.option']
-
-        xmlid = 'delivery_carrier_label_postlogistics.postlogistics'
-        postlogistics_partner = self.env.ref(xmlid)
-
-        for service_code, data in additional_services.iteritems():
-            options = carrier_option_obj.search(
-                [('code', '=', service_code),
-                 ('postlogistics_type', '=', 'delivery')
-                 ]
-            )
-
-            if options:
-                options.write(data)
-            else:
-                data.update(code=service_code,
-                            postlogistics_type='delivery',
-                            partner_id=postlogistics_partner.id)
-                carrier_option_obj.create(data)
-        lang = self.env.context.get('lang', 'en')
-        _logger.info("Updated delivery instructions. [%s]", lang)
+        return True
 
     @api.model
-    def _get_additional_services(self, web_service, company, service_code):
-        lang = self.env.context.get('lang', 'en')
-        service_code_list = service_code.split(',')
-        res = web_service.read_additional_services(company,
-                                                   service_code_list,
-                                                   lang)
-        if 'errors' in res:
-            errors = '\n'.join(res['errors'])
-            error_message = (_('Could not retrieve Postlogistics base '
-                               'services:\n%s') % errors)
-            raise exceptions.Warning(error_message)
-
-        if not res['value']:
-            return {}
+    def _read_postlogistics_services(self, web_service, lang_codes):
+        """ Read the services of PostLogistics in several languages
+
+        The web service calls are done concurrently by at most
+        `_postlogistics_max_workers` threads.
+
+        :return: {lang code: {
+                    'groups': {group_extid: name},
+                    'basic': {(group_extid, service_code): name},
+                    'additional': {service_code: name},
+                    'delivery': {service_code: name},
+                    'additional_basic': {service_code: set of
+                                         (group_extid, basic service code)},
+                    'delivery_basic': {service_code: set of
+                                       (group_extid, basic service code)},
+                  }}
 
-        if hasattr(res['value'], 'Errors') and res['value'].Errors:
-            for error in res['value'].Errors.Error:
-                message = '[%s] %s' % (error.Code, error.Message)
-            raise exceptions.Warning(message)
-
-        additional_services = {}
-        for service in res['value'].AdditionalService:
-            service_code = service.PRZL
-            additional_services[service_code] = {'name': service.Description}
-
-        return additional_services
+        """
+        workers = min(self._postlogistics_max_workers, len(lang_codes) or 1)
+        pool = ThreadPool(workers)
+        try:
+            services = {}
+            calls = [(web_service, 'read_service_groups', (None, lang))
+                     for lang in lang_codes]
+            results = pool.map(_call_web_service, calls)
+            groups = []
+            for lang, res in zip(lang_codes, results):
+                services[lang] = lang_services = {
+                    'groups': {}, 'basic': {},
+                    'additional': {}, 'delivery': {},
+                    'additional_basic': {}, 'delivery_basic': {},
+                }
+                if not self._check_services_response(
+                        res, _('Could not retrieve Postlogistics group '
+                               'services:\n%s')):
+                    continue
+                for group in res['value'].ServiceGroup:
+                    group_extid = group.ServiceGroupID
+                    lang_services['groups'][group_extid] = group.Description
+                    groups.append((lang, group_extid))
+
+            calls = [(web_service, 'read_basic_services',
+                      (None, group_key[1], group_key[0]))
+                     for group_key in groups]
+            results = pool.map(_call_web_service, calls)
+            basic_services = []
+            for (lang, group_extid), res in zip(groups, results):
+                if not self._check_services_response(
+                        res, _('Could not retrieve Postlogistics base '
+                               'services:\n%s')):
+                    continue
+                for service in res['value'].BasicService:
+                    service_code = ','.join(service.PRZL)
+                    key = (group_extid, service_code)
+                    services[lang]['basic'][key] = service.Description
+                    basic_services.append((lang, key))
+
+            calls = []
+            for lang, (group_extid, service_code) in basic_services:
+                service_code_list = service_code.split(',')
+                calls.append((web_service, 'read_additional_services',
+                              (None, service_code_list, lang)))
+                calls.append((web_service, 'read_delivery_instructions',
+                              (None, service_code_list, lang)))
+            results = pool.map(_call_web_service, calls)
+        finally:
+            pool.close()
+            pool.join()
+
+        for index, (lang, basic_key) in enumerate(basic_services):
+            lang_services = services[lang]
+            additional = results[2 * index]
+            delivery = results[2 * index + 1]
+            if self._check_services_response(
+                    additional, _('Could not retrieve Postlogistics base '
+                                  'services:\n%s')):
+                for service in additional['value'].AdditionalService:
+                    code = service.PRZL
+                    lang_services['additional'][code] = service.Description
+                    lang_services['additional_basic'].setdefault(
+                        code, set()).add(basic_key)
+            if self._check_services_response(
+                    delivery, _('Could not retrieve Postlogistics delivery '
+                                'instructions:\n%s')):
+                for service in delivery['value'].DeliveryInstructions:
+                    code = service.PRZL
+                    lang_services['delivery'][code] = service.Description
+                    lang_services['delivery_basic'].setdefault(
+                        code, set()).add(basic_key)
+        return services
 
     @api.model
-    def _update_additional_services(self, web_service, additional_services):
-        carrier_option_obj = self.env['delivery.carrier.template.option']
-
-        xmlid = 'delivery_carrier_label_postlogistics.postlogistics'
-        postlogistics_partner = self.env.ref(xmlid)
+    def _write_changed_records(self, changes):
+        """ Write the values of a list of (record, values)
 
-        for service_code, data in additional_services.iteritems():
-            options = carrier_option_obj.search(
-                [('code', '=', service_code),
-                 ('postlogistics_type', '=', 'additional')
-                 ])
+        The records having the same values are written together.
 
-            if options:
-                options.write(data)
-            else:
-                data.update(code=service_code,
-                            postlogistics_type='additional',
-                            partner_id=postlogistics_partner.id)
-                carrier_option_obj.create(data)
-        lang = self.env.context.get('lang', 'en')
-        _logger.info("Updated additional services [%s]", lang)
+        """
+        grouped = {}
+        for record, vals in changes:
+            key = repr(sorted(vals.items()))
+            records, __ = grouped.get(key, (record.browse(), vals))
+            grouped[key] = (records | record, vals)
+        for records, vals in grouped.itervalues():
+            # use the context of self, the language to write in
+            records.with_env(self.env).write(vals)
 
     @api.model
-    def _update_basic_services(self, web_service, company, group):
-        """ Update of basic services
-
-        A basic service can be part only of one service group
-
-        :return: {additional_services: {<service_code>: service_data}
-                  delivery_instructions: {<service_code>: service_data}
-                  }
+    def _apply_postlogistics_services(self, services, source_lang,
+                                      dry_run=False):
+        """ Create or update the service groups and the options
+
+        The existing records are read once and only the records which
+        differ from the web service are written. The records which are
+        no longer returned by the web service are only reported, as they
+        might still be used by delivery methods.
+
+        :param services: as returned by `_read_postlogistics_services`
+        :param source_lang: language of the source terms in `services`
+        :param dry_run: when True, only compute the report
+        :return: {'added': list of str,
+                  'changed': list of str,
+                  'removed': list of str}
 
         """
+        service_group_obj = self.env['postlogistics.service.group']
         carrier_option_obj = self.env['delivery.carrier.template.option']
-
         xmlid = 'delivery_carrier_label_postlogistics.postlogistics'
         postlogistics_partner = self.env.ref(xmlid)
-        lang = self.env.context.get('lang', 'en')
-
-        res = web_service.read_basic_services(company, group.group_extid, lang)
-        if 'errors' in res:
-            errors = '\n'.join(res['errors'])
-            error_message = (_('Could not retrieve Postlogistics base '
-                               'services:\n%s') % errors)
-            raise exceptions.Warning(error_message)
+        report = {'added': [], 'changed': [], 'removed': []}
+        source = services[source_lang]
+        field = 'postlogistics_basic_service_ids'
+        labels = {'group': _('Service group'),
+                  'basic': _('Basic service'),
+                  'additional': _('Additional service'),
+                  'delivery': _('Delivery instruction'),
+                  }
 
-        additional_services = {}
-        delivery_instructions = {}
-        # Create or update basic service
-        for service in res['value'].BasicService:
-            service_code = ','.join(service.PRZL)
-            options = carrier_option_obj.search(
-                [('code', '=', service_code),
-                 ('postlogistics_service_group_id', '=', group.id),
-                 ('postlogistics_type', '=', 'basic')
-                 ]
-            )
-            data = {'name': service.Description}
-            if options:
-                options.write(data)
-                option = options[0]
+        def describe(kind, code, name, lang=None):
+            if lang:
+                return u'%s %s: %s [%s]' % (labels[kind], code, name, lang)
+            return u'%s %s: %s' % (labels[kind], code, name)
+
+        # service groups
+        groups = {}
+        for group in service_group_obj.search([]):
+            groups[group.group_extid] = group
+        changes = []
+        for group_extid, name in source['groups'].iteritems():
+            group = groups.get(group_extid)
+            if group is None:
+                report['added'].append(describe('group',
+                                                group_extid, name))
+                if not dry_run:
+                    groups[group_extid] = service_group_obj.create(
+                        {'group_extid': group_extid, 'name': name})
+            elif group.name != name:
+                report['changed'].append(describe('group',
+                                                  group_extid, name))
+                changes.append((group, {'name': name}))
+        for group_extid, group in groups.iteritems():
+            if group_extid not in source['groups']:
+                report['removed'].append(describe('group',
+                                                  group_extid, group.name))
+        if not dry_run:
+            self._write_changed_records(changes)
+
+        # options, by (type, key) where the key is (group_extid, code)
+        # for the basic services and code for the other ones
+        options = {}
+        existing = carrier_option_obj.search(
+            [('postlogistics_type', 'in', ('basic', 'additional', 'delivery'))]
+        )
+        for option in existing:
+            if option.postlogistics_type == 'basic':
+                group_extid = option.postlogistics_service_group_id.group_extid
+                key = (group_extid, option.code)
             else:
-                data.update(code=service_code,
-                            postlogistics_service_group_id=group.id,
-                            partner_id=postlogistics_partner.id,
-                            postlogistics_type='basic')
-                option = carrier_option_obj.create(data)
-
-            # Get related services
-            allowed_services = self._get_additional_services(web_service,
-                                                             company,
-                                                             service_code)
-            for key, value in additional_services.iteritems():
-                if key in allowed_services:
-                    field = 'postlogistics_basic_service_ids'
-                    additional_services[key][field][0][2].append(option.id)
-                    del allowed_services[key]
-            for key, value in allowed_services.iteritems():
-                field = 'postlogistics_basic_service_ids'
-                value[field] = [(6, 0, [option.id])]
-                additional_services[key] = value
-
-            allowed_services = self._get_delivery_instructions(web_service,
-                                                               company,
-                                                               service_code)
-            for key, value in delivery_instructions.iteritems():
-                if key in allowed_services:
-                    field = 'postlogistics_basic_service_ids'
-                    delivery_instructions[key][field][0][2].append(option.id)
-                    del allowed_services[key]
-            for key, value in allowed_services.iteritems():
-                field = 'postlogistics_basic_service_ids'
-                value[field] = [(6, 0, [option.id])]
-                delivery_instructions[key] = value
-
-        _logger.info("Updated '%s' basic service [%s].", group.name, lang)
-        return {'additional_services': additional_services,
-                'delivery_instructions': delivery_instructions}
-
-    @api.model
-    def _update_service_groups(self, web_service, company):
-        """ Also updates additional services and delivery instructions
-        as they are shared between groups
-
-        """
-        service_group_obj = self.env['postlogistics.service.group']
+                key = option.code
+            options.setdefault((option.postlogistics_type, key), option)
+
+        changes = []
+        for key, name in source['basic'].iteritems():
+            group_extid, service_code = key
+            option = options.get(('basic', key))
+            if option is None:
+                report['added'].append(describe('basic',
+                                                service_code, name))
+                if not dry_run:
+                    options[('basic', key)] = carrier_option_obj.create({
+                        'name': name,
+                        'code': service_code,
+                        'postlogistics_service_group_id':
+                            groups[group_extid].id,
+                        'partner_id': postlogistics_partner.id,
+                        'postlogistics_type': 'basic',
+                    })
+            elif option.name != name:
+                report['changed'].append(describe('basic',
+                                                  service_code, name))
+                changes.append((option, {'name': name}))
+
+        for option_type in ('additional', 'delivery'):
+            basic_keys = source['%s_basic' % option_type]
+            for code, name in source[option_type].iteritems():
+                option = options.get((option_type, code))
+                basic_ids = sorted(
+                    options[('basic', basic_key)].id
+                    for basic_key in basic_keys.get(code, ())
+                    if ('basic', basic_key) in options
+                )
+                if option is None:
+                    report['added'].append(describe(option_type, code, name))
+                    if not dry_run:
+                        options[(option_type, code)] = \
+                            carrier_option_obj.create({
+                                'name': name,
+                                'code': code,
+                                'partner_id': postlogistics_partner.id,
+                                'postlogistics_type': option_type,
+                                field: [(6, 0, basic_ids)],
+                            })
+                    continue
+                vals = {}
+                if option.name != name:
+                    vals['name'] = name
+                if sorted(option[field].ids) != basic_ids:
+                    vals[field] = [(6, 0, basic_ids)]
+                if vals:
+                    report['changed'].append(describe(option_type, code, name))
+                    changes.append((option, vals))
+
+        for (option_type, key), option in options.iteritems():
+            if option_type == 'basic':
+                found = key in source['basic']
+            else:
+                found = key in source[option_type]
+            if not found:
+                report['removed'].append(describe(option_type, option.code,
+                                                  option.name))
+        if not dry_run:
+            self._write_changed_records(changes)
+
+        # translations
+        all_groups = service_group_obj.browse(
+            [group.id for group in groups.itervalues()])
+        all_options = carrier_option_obj.browse(
+            [option.id for option in options.itervalues()])
+        for lang, lang_services in services.iteritems():
+            if lang == source_lang:
+                continue
+            translations = {}
+            for records in (all_groups, all_options):
+                for row in records.with_context(lang=lang).read(['name']):
+                    translations[(records._name, row['id'])] = row['name']
+            changes = []
+            for group_extid, name in lang_services['groups'].iteritems():
+                group = groups.get(group_extid)
+                if group is None:
+                    continue
+                if translations[(group._name, group.id)] != name:
+                    report['changed'].append(describe(
+                        'group', group_extid, name, lang=lang))
+                    changes.append((group, {'name': name}))
+            for option_type in ('basic', 'additional', 'delivery'):
+                for key, name in lang_services[option_type].iteritems():
+                    option = options.get((option_type, key))
+                    if option is None:
+                        continue
+                    if translations[(option._name, option.id)] != name:
+                        report['changed'].append(describe(
+                            option_type, option.code, name, lang=lang))
+                        changes.append((option, {'name': name}))
+            if not dry_run:
+                self.with_context(lang=lang)._write_changed_records(changes)
+        return report
 
-        lang = self.env.context.get('lang', 'en')
+    @api.multi
+    def _update_postlogistics_options(self, dry_run=False):
+        """ Read the services of the PostLogistics WebService API and
+        update the 'delivery.carrier.template.option' accordingly
 
-        res = web_service.read_service_groups(company, lang)
-        if 'errors' in res:
-            errors = '\n'.join(res['errors'])
-            error_message = (_('Could not retrieve Postlogistics group '
-                               'services:\n%s') % errors)
-            raise exceptions.Warning(error_message)
+        :return: report as returned by `_apply_postlogistics_services`
 
-        additional_services = {}
-        delivery_instructions = {}
-
-        # Create or update groups
-        for group in res['value'].ServiceGroup:
-            group_extid = group.ServiceGroupID
-            groups = service_group_obj.search(
-                [('group_extid', '=', group_extid)],
-            )
-            data = {'name': group.Description}
-            if groups:
-                groups.write(data)
-                group = groups[0]
-            else:
-                data['group_extid'] = group_extid
-                group = service_group_obj.create(data)
-
-            # Get related services for all basic services of this group
-            res = self._update_basic_services(web_service, company, group)
-
-            allowed_services = res.get('additional_services', {})
-            for key, value in additional_services.iteritems():
-                if key in allowed_services:
-                    field = 'postlogistics_basic_service_ids'
-                    option_ids = allowed_services[key][field][0][2]
-                    additional_services[key][field][0][2].extend(option_ids)
-                    del allowed_services[key]
-            additional_services.update(allowed_services)
-
-            allowed_services = res.get('delivery_instructions', {})
-            for key, value in delivery_instructions.iteritems():
-                if key in allowed_services:
-                    field = 'postlogistics_basic_service_ids'
-                    option_ids = allowed_services[key][field][0][2]
-                    delivery_instructions[key][field][0][2].extend(option_ids)
-                    del allowed_services[key]
-            delivery_instructions.update(allowed_services)
-
-        # Update related services
-        self._update_additional_services(web_service, additional_services)
-        self._update_delivery_instructions(web_service,
-                                           delivery_instructions,)
+        """
+        self.ensure_one()
+        company = self.company_id
+        web_service = PostlogisticsWebService(company)
+
+        # source text is in en_US, the other languages are
+        # translations, only for languages that exists on
+        # postlogistics, english source will be kept for the others
+        source_lang = 'en_US'
+        # {postlogistics language: [OpenERP language codes]}
+        languages = {'en': [source_lang]}
+        for lang in self.env['res.lang'].search([]):
+            postlogistics_lang = web_service._get_language(lang.code)
+            if postlogistics_lang != 'en':
+                languages.setdefault(postlogistics_lang, []).append(lang.code)
+
+        # read once per postlogistics language
+        lang_codes = [codes[0] for codes in languages.itervalues()]
+        services = self._read_postlogistics_services(web_service, lang_codes)
+        for codes in languages.itervalues():
+            for lang_code in codes[1:]:
+                services[lang_code] = services[codes[0]]
+        this = self.with_context(lang=source_lang)
+        report = this._apply_postlogistics_services(services, source_lang,
+                                                    dry_run=dry_run)
+        _logger.info("Updated PostLogistics services %s: %d added, "
+                     "%d changed, %d removed.", services.keys(),
+                     len(report['added']), len(report['changed']),
+                     len(report['removed']))
+        return report
 
     @api.multi
     def update_postlogistics_options(self):
@@ -327,32 +433,29 @@ class PostlogisticsConfigSettings(models.TransientModel):
 
         """
         for config in self:
-            company = config.company_id
-            web_service = PostlogisticsWebService(company)
-
-            # make sure we create source text in en_US
-            ctx = self.env.context.copy()
-            ctx['lang'] = 'en_US'
-            self._update_service_groups(web_service, company)
-
-            language_obj = self.env['res.lang']
-            languages = language_obj.search([])
-
-            # handle translations
-            # we call the same method with a different language context
-            for lang in languages:
-                lang_code = lang.code
-                postlogistics_lang = web_service._get_language(lang_code)
-                # add translations only for languages that exists on
-                # postlogistics, english source will be kept for other
-                # languages
-                if postlogistics_lang == 'en':
-                    continue
-                self.with_context(lang=lang_code)._update_service_groups(
-                    web_service, company
-                )
+            config._update_postlogistics_options()
         return True
 
+    @api.multi
+    def preview_postlogistics_options(self):
+        """ Show what `update_postlogistics_options` would change """
+        self.ensure_one()
+        report = self._update_postlogistics_options(dry_run=True)
+        lines = []
+        for title, key in ((_('Added'), 'added'),
+                           (_('Changed'), 'changed'),
+                           (_('Removed'), 'removed')):
+            lines.append(u'%s (%d)' % (title, len(report[key])))
+            lines += [u'  %s' % line for line in sorted(report[key])]
+        self.options_update_report = u'\n'.join(lines)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'inline',
+        }
+
     @api.model
     def _get_allowed_service_group_codes(self, web_service, company,
                                          cp_license):
@@ -61,28 +61,49 @@ class StockPicking(models.Model):
         return order.amount_total
 
     @api.multi
-    def _generate_postlogistics_label(self, webservice_class=None,
-                                      package_ids=None):
-        """ Generate labels and write tracking numbers received """
+    def _get_postlogistics_packages(self, package_ids=None,
+                                    packages_by_picking=None):
         self.ensure_one()
-        user = self.env.user
-        company = user.company_id
-        if webservice_class is None:
-            webservice_class = PostlogisticsWebService
-
         if package_ids is None:
-            packages = self._get_packages_from_picking()
+            packages = self._get_packages_from_picking(
+                packages_by_picking=packages_by_picking)
             packages = sorted(packages, key=attrgetter('name'))
         else:
             # restrict on the provided packages
             package_obj = self.env['stock.quant.package']
             packages = package_obj.browse(package_ids)
+        return packages
+
+    @api.multi
+    def _generate_postlogistics_label(self, webservice_class=None,
+                                      package_ids=None):
+        """ Generate labels and write tracking numbers received
+
+        The labels are requested with the credentials of the company of
+        the picking, as in `_call_carriers_batch`.
+
+        """
+        self.ensure_one()
+        user = self.env.user
+        company = self.company_id
+        if webservice_class is None:
+            webservice_class = PostlogisticsWebService
+
+        packages = self._get_postlogistics_packages(package_ids=package_ids)
 
         web_service = webservice_class(company)
         res = web_service.generate_label(self,
                                          packages,
                                          user_lang=user.lang)
+        return self._postlogistics_labels_from_result(res, packages)
+
+    @api.multi
+    def _postlogistics_labels_from_result(self, res, packages):
+        """ Write the tracking numbers of a web service result and
+        return the labels of the picking
 
+        """
+        self.ensure_one()
         if 'errors' in res:
             raise exceptions.Warning('\n'.join(res['errors']))
 
@@ -118,6 +139,68 @@ class StockPicking(models.Model):
 
         return labels
 
+    @api.multi
+    def _call_carriers_batch(self, package_ids=None,
+                             packages_by_picking=None,
+                             webservice_class=None):
+        """ Request the PostLogistics labels of all the pickings at once
+
+        The pickings are grouped by company, so each one is sent with
+        the credentials of its company. The result of a picking is a
+        tuple with the result of the web service and the packages sent,
+        used by `_get_shipping_label_values` when the labels of each
+        picking are generated.
+
+        """
+        results = super(StockPicking, self)._call_carriers_batch(
+            package_ids=package_ids,
+            packages_by_picking=packages_by_picking)
+        pickings = self.filtered(
+            lambda p: p.carrier_id.type == 'postlogistics')
+        if not pickings:
+            return results
+        if webservice_class is None:
+            webservice_class = PostlogisticsWebService
+        user = self.env.user
+        packages = {}
+        pickings_by_company = {}
+        if packages_by_picking is None:
+            packages_by_picking = pickings._get_packages_by_picking()
+        for pick in pickings:
+            pick_package_ids = pick._get_batch_package_ids(
+                package_ids, packages_by_picking)
+            if package_ids and not pick_package_ids:
+                # no label to print for this picking
+                continue
+            packages[pick.id] = pick._get_postlogistics_packages(
+                package_ids=pick_package_ids,
+                packages_by_picking=packages_by_picking)
+            pickings_by_company.setdefault(pick.company_id.id, []).append(
+                pick.id)
+        company_obj = self.env['res.company']
+        for company_id, picking_ids in pickings_by_company.iteritems():
+            web_service = webservice_class(company_obj.browse(company_id))
+            bulk_results = web_service.generate_labels_bulk(
+                self.browse(picking_ids), packages=packages,
+                user_lang=user.lang)
+            for picking_id, res in bulk_results.iteritems():
+                results[picking_id] = (res, packages[picking_id])
+        return results
+
+    @api.multi
+    def _get_shipping_label_values(self, package_ids=None,
+                                   batch_result=None):
+        """ Use the result of the batch request for PostLogistics """
+        self.ensure_one()
+        if (batch_result is not None and
+                self.carrier_id.type == 'postlogistics'):
+            res, packages = batch_result
+            labels = self._postlogistics_labels_from_result(res, packages)
+            return self._prepare_shipping_label_values(labels)
+        _super = super(StockPicking, self)
+        return _super._get_shipping_label_values(
+            package_ids=package_ids, batch_result=batch_result)
+
     @api.multi
     def generate_shipping_labels(self, package_ids=None):
         """ Add label generation for Postlogistics """
@@ -1,3 +1,4 @@
 # -*- coding: utf-8 -*-
 
 from . import test_postlogistics
+from . import test_update_options
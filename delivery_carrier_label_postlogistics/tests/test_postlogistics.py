@@ -20,6 +20,8 @@
 #
 
 import mock
+import socket
+
 from openerp.tests import common
 from openerp.addons.delivery_carrier_label_postlogistics\
     .postlogistics.web_service import PostlogisticsWebService
@@ -55,6 +57,8 @@ class TestPostlogistics(common.TransactionCase):
 
     def setUp(self):
         super(TestPostlogistics, self).setUp()
+        # the shared clients would keep the mocks between the tests
+        PostlogisticsWebService.clear_client_cache()
         Product = self.env['product.product']
         partner_xmlid = 'delivery_carrier_label_postlogistics.postlogistics'
         self.carrier = self.env['delivery.carrier'].create({
@@ -101,3 +105,192 @@ class TestPostlogistics(common.TransactionCase):
         with mock.patch(client_path), mock.patch(auth_path),\
                 mock.patch(output_path):
             self.picking._generate_postlogistics_label(webservice_class=FakeWS)
+
+    def test_generate_labels_bulk(self):
+        with mock.patch(client_path), mock.patch(auth_path),\
+                mock.patch(output_path):
+            web_service = PostlogisticsWebService(self.env.user.company_id)
+            item_id = web_service._get_itemid(self.picking, self.picking.name)
+            item = mock.Mock(ItemID=item_id, Label='', IdentCode='XYZ',
+                             Errors=None, Warnings=None)
+            request = web_service.client.service.GenerateLabel
+            request.return_value.Data.Provider.Sending.Item = [item]
+            res = web_service.generate_labels_bulk(self.picking)
+            self.assertEqual(request.call_count, 1)
+            self.assertNotIn('errors', res[self.picking.id])
+            label = res[self.picking.id]['value'][0]
+            self.assertEqual(label['tracking_number'], 'XYZ')
+
+    def test_generate_labels_bulk_error(self):
+        """ A failing envelope does not prevent the others """
+        Picking = self.env['stock.picking']
+        failing = Picking.create({
+            'carrier_id': self.carrier.id,
+            'picking_type_id': self.env.ref('stock.picking_type_out').id,
+        })
+        invalid = Picking.create({
+            'carrier_id': self.carrier.id,
+            'picking_type_id': self.env.ref('stock.picking_type_out').id,
+        })
+        pickings = self.picking | failing | invalid
+        key_path = output_path.replace('_get_output_format',
+                                       '_get_envelope_key')
+
+        def get_envelope_key(web_service, picking):
+            # one envelope per picking
+            if picking == invalid:
+                raise AssertionError('Two label layouts')
+            return picking.id
+
+        with mock.patch(client_path), mock.patch(auth_path),\
+                mock.patch(output_path),\
+                mock.patch(key_path, get_envelope_key):
+            web_service = PostlogisticsWebService(self.env.user.company_id)
+            item_id = web_service._get_itemid(self.picking, self.picking.name)
+            failing_id = web_service._get_itemid(failing, failing.name)
+            item = mock.Mock(ItemID=item_id, Label='', IdentCode='XYZ',
+                             Errors=None, Warnings=None)
+            response = mock.Mock()
+            response.Data.Provider.Sending.Item = [item]
+
+            def generate_label(Language=None, Envelope=None):
+                items = Envelope['Data']['Provider']['Sending']['Item']
+                if items[0]['ItemID'] == failing_id:
+                    raise socket.error('Connection reset by peer')
+                return response
+
+            request = web_service.client.service.GenerateLabel
+            request.side_effect = generate_label
+            res = web_service.generate_labels_bulk(pickings)
+        self.assertEqual(request.call_count, 2)
+        self.assertNotIn('errors', res[self.picking.id])
+        label = res[self.picking.id]['value'][0]
+        self.assertEqual(label['tracking_number'], 'XYZ')
+        self.assertFalse(res[failing.id]['value'])
+        self.assertIn('Connection reset', res[failing.id]['errors'][0])
+        self.assertFalse(res[invalid.id]['value'])
+        self.assertIn('Two label layouts', res[invalid.id]['errors'][0])
+
+    def test_generate_labels_bulk_prepare_error(self):
+        """ An error preparing the items of a picking is reported for it """
+        Picking = self.env['stock.picking']
+        invalid = Picking.create({
+            'carrier_id': self.carrier.id,
+            'picking_type_id': self.env.ref('stock.picking_type_out').id,
+        })
+        pickings = self.picking | invalid
+        recipient_path = output_path.replace('_get_output_format',
+                                             '_prepare_recipient')
+
+        def prepare_recipient(web_service, picking):
+            if picking == invalid:
+                raise KeyError('street')
+            return {}
+
+        with mock.patch(client_path), mock.patch(auth_path),\
+                mock.patch(output_path),\
+                mock.patch(recipient_path, prepare_recipient):
+            web_service = PostlogisticsWebService(self.env.user.company_id)
+            item_id = web_service._get_itemid(self.picking, self.picking.name)
+            item = mock.Mock(ItemID=item_id, Label='', IdentCode='XYZ',
+                             Errors=None, Warnings=None)
+            response = mock.Mock()
+            response.Data.Provider.Sending.Item = [item]
+            request = web_service.client.service.GenerateLabel
+            request.return_value = response
+            res = web_service.generate_labels_bulk(pickings)
+        self.assertEqual(request.call_count, 1)
+        self.assertEqual(res[self.picking.id]['value'][0]['tracking_number'],
+                         'XYZ')
+        self.assertFalse(res[invalid.id]['value'])
+        self.assertIn('street', res[invalid.id]['errors'][0])
+
+    def test_generate_labels_batch(self):
+        """ The labels of a batch are read from the bulk request """
+        result = {'value': [{'item_id': self.picking.id,
+                             'binary': '',
+                             'tracking_number': 'XYZ',
+                             'file_type': 'pdf',
+                             }]}
+        bulk_path = output_path.replace('_get_output_format',
+                                        'generate_labels_bulk')
+        label_path = output_path.replace('_get_output_format',
+                                         'generate_label')
+        with mock.patch(client_path), mock.patch(auth_path),\
+                mock.patch(output_path),\
+                mock.patch(bulk_path) as bulk,\
+                mock.patch(label_path) as single:
+            bulk.return_value = {self.picking.id: result}
+            report = self.picking.generate_labels_batch()
+        self.assertEqual(report, {self.picking.id: False})
+        self.assertEqual(bulk.call_count, 1)
+        self.assertFalse(single.called)
+        labels = self.env['shipping.label'].search(
+            [('res_id', '=', self.picking.id),
+             ('res_model', '=', 'stock.picking')])
+        self.assertEqual(labels.name, 'XYZ.pdf')
+        self.assertEqual(self.picking.carrier_tracking_ref, 'XYZ')
+
+    def test_client_cache(self):
+        company = self.env.user.company_id
+        with mock.patch(client_path) as client, mock.patch(auth_path):
+            PostlogisticsWebService(company)
+            PostlogisticsWebService(company)
+            self.assertEqual(client.call_count, 1)
+            company.postlogistics_username = 'other'
+            PostlogisticsWebService(company)
+            self.assertEqual(client.call_count, 2)
+
+    def test_language_cache(self):
+        company = self.env.user.company_id
+        with mock.patch(client_path), mock.patch(auth_path):
+            web_service = PostlogisticsWebService(company)
+            create = web_service.client.factory.create
+            create.return_value = ['de', 'fr', 'it', 'en']
+            self.assertEqual(web_service._get_language('fr_FR'), 'fr')
+            self.assertEqual(web_service._get_language('de_DE'), 'de')
+            self.assertEqual(create.call_count, 1)
+            company.postlogistics_username = 'other'
+            web_service = PostlogisticsWebService(company)
+            create = web_service.client.factory.create
+            create.reset_mock()
+            create.return_value = ['de', 'fr', 'it', 'en']
+            web_service._get_language('fr_FR')
+            self.assertEqual(create.call_count, 1)
+
+    def test_customer_cache(self):
+        company = self.env.user.company_id
+        prepare = PostlogisticsWebService._prepare_company_customer
+        with mock.patch(client_path), mock.patch(auth_path),\
+                mock.patch.object(PostlogisticsWebService,
+                                  '_prepare_company_customer',
+                                  autospec=True,
+                                  side_effect=prepare) as prepare_mock:
+            web_service = PostlogisticsWebService(company)
+            customer = web_service._prepare_customer(self.picking)
+            self.assertEqual(customer['Name1'], company.partner_id.name)
+            web_service._prepare_customer(self.picking)
+            self.assertEqual(prepare_mock.call_count, 1)
+
+            # written in the same second, the cache is dropped anyway
+            company.partner_id.name = 'Another Name'
+            customer = web_service._prepare_customer(self.picking)
+            self.assertEqual(customer['Name1'], 'Another Name')
+            self.assertEqual(prepare_mock.call_count, 2)
+
+            company.postlogistics_office = 'Another Office'
+            web_service = PostlogisticsWebService(company)
+            customer = web_service._prepare_customer(self.picking)
+            self.assertEqual(customer['DomicilePostOffice'],
+                             'Another Office')
+            self.assertEqual(prepare_mock.call_count, 3)
+
+    def test_customer_cache_partner_fields(self):
+        """ Only the partner fields sent in the customer drop the cache """
+        partner = self.env.user.company_id.partner_id
+        with mock.patch.object(PostlogisticsWebService,
+                               'clear_customer_cache') as clear_mock:
+            partner.phone = '+41 21 619 10 10'
+            self.assertFalse(clear_mock.called)
+            partner.city = 'Lausanne'
+            clear_mock.assert_called_once_with(self.env.user.company_id)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import mock
+from openerp.tests import common
+from openerp.addons.delivery_carrier_label_postlogistics\
+    .postlogistics.web_service import PostlogisticsWebService
+from openerp.addons.delivery_carrier_label_postlogistics\
+    .res_config import PostlogisticsConfigSettings
+
+module_path = 'openerp.addons.delivery_carrier_label_postlogistics'
+client_path = module_path + '.postlogistics.web_service.Client'
+auth_path = module_path + '.postlogistics.web_service.HttpAuthenticated'
+call_path = module_path + '.res_config._call_web_service'
+
+
+class TestUpdateOptions(common.TransactionCase):
+    """ Test the update of the options from the PostLogistics services """
+
+    def setUp(self):
+        super(TestUpdateOptions, self).setUp()
+        PostlogisticsWebService.clear_client_cache()
+        self.config = self.env['postlogistics.config.settings'].create({})
+        self.option_obj = self.env['delivery.carrier.template.option']
+        # services returned by the mocked web service
+        self.groups = {1: 'Parcels'}
+        self.basic = {(1, 'ECO'): 'Economy', (1, 'PRI'): 'Priority'}
+        # {code: (name, basic service codes)}
+        self.additional = {'SI': ('Signature', ('ECO', 'PRI'))}
+        self.delivery = {'ZAW3213': ('Phone', ('ECO',))}
+
+    def _call_web_service(self, args):
+        __, method, params = args
+        value = mock.Mock(Errors=None)
+        if method == 'read_service_groups':
+            value.ServiceGroup = [
+                mock.Mock(ServiceGroupID=group_extid, Description=name)
+                for group_extid, name in self.groups.iteritems()]
+        elif method == 'read_basic_services':
+            value.BasicService = [
+                mock.Mock(PRZL=code.split(','), Description=name)
+                for (group_extid, code), name in self.basic.iteritems()
+                if group_extid == params[1]]
+        else:
+            basic_code = ','.join(params[1])
+            if method == 'read_additional_services':
+                services, attribute = self.additional, 'AdditionalService'
+            else:
+                services, attribute = self.delivery, 'DeliveryInstructions'
+            setattr(value, attribute, [
+                mock.Mock(PRZL=code, Description=name)
+                for code, (name, basic_codes) in services.iteritems()
+                if basic_code in basic_codes])
+        return {'success': True, 'value': value}
+
+    def _update(self, dry_run=False):
+        write = PostlogisticsConfigSettings._write_changed_records
+        with mock.patch(client_path), mock.patch(auth_path), \
+                mock.patch(call_path, side_effect=self._call_web_service), \
+                mock.patch.object(PostlogisticsConfigSettings,
+                                  '_write_changed_records',
+                                  autospec=True,
+                                  side_effect=write) as write_mock:
+            report = self.config._update_postlogistics_options(
+                dry_run=dry_run)
+        written = self.option_obj.browse()
+        for call in write_mock.call_args_list:
+            for record, __ in call[0][1]:
+                written |= record
+        return report, written
+
+    def _search_options(self):
+        return self.option_obj.search(
+            [('postlogistics_type', 'in', ('basic', 'additional', 'delivery'))]
+        )
+
+    def test_update_options(self):
+        report, written = self._update(dry_run=True)
+        self.assertEqual(len(report['added']), 6)
+        self.assertFalse(report['changed'])
+        self.assertFalse(report['removed'])
+        self.assertFalse(written)
+        self.assertFalse(self._search_options())
+        self.assertFalse(self.env['postlogistics.service.group'].search([]))
+
+        report, written = self._update()
+        self.assertEqual(len(report['added']), 6)
+        self.assertFalse(written)
+        options = dict((option.code, option)
+                       for option in self._search_options())
+        self.assertEqual(sorted(options), ['ECO', 'PRI', 'SI', 'ZAW3213'])
+        self.assertEqual(
+            options['SI'].postlogistics_basic_service_ids,
+            options['ECO'] | options['PRI'])
+
+        # a changed, a removed and a new service
+        self.basic[(1, 'PRI')] = 'Priority Mail'
+        del self.delivery['ZAW3213']
+        self.additional['BLN'] = ('Cash on delivery', ('PRI',))
+        expected = {
+            'added': [u'Additional service BLN: Cash on delivery'],
+            'changed': [u'Basic service PRI: Priority Mail'],
+            'removed': [u'Delivery instruction ZAW3213: Phone'],
+        }
+
+        report, written = self._update(dry_run=True)
+        self.assertEqual(report, expected)
+        self.assertFalse(written)
+        self.assertEqual(options['PRI'].name, 'Priority')
+        self.assertEqual(len(self._search_options()), 4)
+
+        report, written = self._update()
+        self.assertEqual(report, expected)
+        # only the changed record is written
+        self.assertEqual(written, options['PRI'])
+        self.assertEqual(options['PRI'].name, 'Priority Mail')
+        new_option = self._search_options().filtered(
+            lambda option: option.code == 'BLN')
+        self.assertEqual(new_option.postlogistics_basic_service_ids,
+                         options['PRI'])
+        # the removed services are kept, they may still be used
+        self.assertTrue(options['ZAW3213'].exists())
+
+    def test_preview_options(self):
+        with mock.patch(client_path), mock.patch(auth_path), \
+                mock.patch(call_path, side_effect=self._call_web_service):
+            self.config.preview_postlogistics_options()
+        lines = self.config.options_update_report.splitlines()
+        self.assertEqual(lines[0], u'Added (6)')
+        self.assertIn(u'  Service group 1: Parcels', lines)
+        self.assertIn(u'Changed (0)', lines)
+        self.assertIn(u'Removed (0)', lines)
+        self.assertFalse(self._search_options())
@@ -41,6 +41,12 @@ class PostlogisticsWebServiceShop(web_service.PostlogisticsWebService):
             shop_logo['LogoFormat'] = logo_format
         return shop_logo
 
+    def _get_envelope_key(self, picking):
+        """ Pickings of different shops have different logos """
+        key = super(PostlogisticsWebServiceShop, self
+                    )._get_envelope_key(picking)
+        return key + (picking.sale_id.shop_id.id,)
+
     def _prepare_envelope(self, picking, post_customer, data):
         """ Replace company label logo by shop label logo in customer data """
         shop_logo = self._get_shop_label_logo(picking)
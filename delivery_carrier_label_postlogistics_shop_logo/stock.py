@@ -18,6 +18,7 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
+from openerp import api
 from openerp.osv import orm
 
 from .postlogistics.web_service import PostlogisticsWebServiceShop
@@ -38,3 +39,18 @@ class stock_picking(orm.Model):
             webservice_class=webservice_class,
             tracking_ids=tracking_ids,
             context=context)
+
+    @api.multi
+    def _call_carriers_batch(self, package_ids=None,
+                             packages_by_picking=None,
+                             webservice_class=None):
+        """ Request the batch labels using shop label, the pickings of
+        different shops are sent in different envelopes
+
+        """
+        if webservice_class is None:
+            webservice_class = PostlogisticsWebServiceShop
+        return super(stock_picking, self)._call_carriers_batch(
+            package_ids=package_ids,
+            packages_by_picking=packages_by_picking,
+            webservice_class=webservice_class)
@@ -10,6 +10,8 @@ from openerp import models, fields, api
 from openerp.tools.translate import _
 from openerp.exceptions import Warning as UserError
 
+from .stock_package import _roulier_get_labels
+
 _logger = logging.getLogger(__name__)
 try:
     from roulier import roulier
@@ -141,14 +143,117 @@ class StockPicking(models.Model):
         return _super.generate_shipping_labels(package_ids=package_ids)
 
     @api.multi
-    def _roulier_generate_labels(self):
-        """Create as many labels as package_ids or in self."""
+    def _get_shipping_label_values(self, package_ids=None,
+                                   batch_result=None):
+        """See base_delivery_carrier_label/stock.py.
+
+        In a batch, the carrier has already been called by
+        _roulier_call_batch, only its results are handled here.
+        """
         self.ensure_one()
-        packages = self._get_packages_from_picking()
+        if self._is_roulier():
+            if isinstance(batch_result, Exception):
+                raise batch_result
+            if batch_result is not None:
+                packages, payloads, results = batch_result
+                return packages._get_labels_values_from_results(
+                    self, payloads, results)
+            packages = self._roulier_get_packages(package_ids=package_ids)
+            return packages._get_labels_values(self)
+        _super = super(StockPicking, self)
+        return _super._get_shipping_label_values(
+            package_ids=package_ids, batch_result=batch_result)
+
+    @api.multi
+    def _call_carriers_batch(self, package_ids=None,
+                             packages_by_picking=None):
+        """See base_delivery_carrier_label/stock.py."""
+        roulier_pickings = self.filtered(lambda pick: pick._is_roulier())
+        _super = super(StockPicking, self - roulier_pickings)
+        results = _super._call_carriers_batch(
+            package_ids=package_ids, packages_by_picking=packages_by_picking)
+        if roulier_pickings:
+            results.update(roulier_pickings._roulier_call_batch(
+                package_ids=package_ids,
+                packages_by_picking=packages_by_picking))
+        return results
+
+    @api.multi
+    def _roulier_call_batch(self, package_ids=None, packages_by_picking=None):
+        """Call the carrier for the packages of many pickings.
+
+        The payloads are built in the current thread as they read the
+        database, then the web service calls of all the pickings are
+        run on the workers allowed for the carrier. The pickings must
+        have the same carrier type.
+
+        Returns:
+            dict with the picking ids as keys and as values a tuple
+            (packages, payloads, results), or the exception raised
+            while the payloads of the picking were built
+        """
+        if packages_by_picking is None:
+            packages_by_picking = self._get_packages_by_picking()
+        batch_results = {}
+        calls = []
+        for pick in self:
+            pick_package_ids = pick._get_batch_package_ids(
+                package_ids, packages_by_picking)
+            if package_ids and not pick_package_ids:
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    packages = pick._roulier_get_packages(
+                        package_ids=pick_package_ids,
+                        packages_by_picking=packages_by_picking)
+                    payloads = [package._prepare_roulier_payload(pick)
+                                for package in packages]
+            except Exception as e:
+                # raised again when the labels of the picking are prepared
+                batch_results[pick.id] = e
+                continue
+            calls.append((pick, packages, payloads))
+        if not calls:
+            return batch_results
+        pick, packages, __ = calls[0]
+        packages.carrier_type = pick.carrier_type  # on memory value !
+        max_workers = packages._get_max_workers(pick)
+        payloads = [payload for __, __, pick_payloads in calls
+                    for payload in pick_payloads]
+        # the workers must not read the ORM: the cursor and the
+        # cache of the environment are not thread-safe
+        results = iter(_roulier_get_labels(
+            pick.carrier_type, payloads, max_workers))
+        for pick, packages, pick_payloads in calls:
+            pick_results = [next(results) for __ in pick_payloads]
+            batch_results[pick.id] = (packages, pick_payloads, pick_results)
+        return batch_results
+
+    @api.multi
+    def _roulier_get_packages(self, package_ids=None,
+                              packages_by_picking=None):
+        """Packages of the picking for which a label is generated.
+
+        Args:
+            package_ids: optional list of ids restricting the packages
+            packages_by_picking: optional packages of many pickings, as
+                returned by _get_packages_by_picking
+        """
+        self.ensure_one()
+        packages = self._get_packages_from_picking(
+            packages_by_picking=packages_by_picking)
+        if package_ids:
+            packages = packages.filtered(lambda pack: pack.id in package_ids)
         if not packages:
             # It's not our responsibility to create the packages
             raise UserError(_('No package found for this picking'))
-        return packages._generate_labels(self)
+        return packages
+
+    @api.multi
+    def _roulier_generate_labels(self):
+        """Create as many labels as package_ids or in self."""
+        self.ensure_one()
+        return self._roulier_get_packages()._generate_labels(self)
 
     # default implementations
     def _roulier_get_auth(self, package):
@@ -3,6 +3,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
 from functools import wraps
+from multiprocessing.pool import ThreadPool
 import logging
 
 from openerp import models, api
@@ -45,6 +46,43 @@ def implemented_by_carrier(func):
     return wrapper
 
 
+def _roulier_get_label(carrier_type, payload):
+    """Call the carrier web service through roulier.
+
+    It doesn't use the ORM so it can run outside of the request thread.
+
+    Returns:
+        a tuple (response, exception)
+    """
+    try:
+        return roulier.get(carrier_type).get_label(payload), None
+    except Exception as e:
+        return None, e
+
+
+def _roulier_get_labels(carrier_type, payloads, max_workers):
+    """Call the carrier web service for many payloads through roulier.
+
+    The calls are run concurrently when more than one worker is allowed.
+    Like _roulier_get_label, it doesn't use the ORM.
+
+    Returns:
+        list of tuples (response, exception), in the order of payloads
+    """
+    max_workers = min(max_workers, len(payloads))
+    if max_workers <= 1:
+        return [_roulier_get_label(carrier_type, payload)
+                for payload in payloads]
+    pool = ThreadPool(max_workers)
+    try:
+        return pool.map(
+            lambda payload: _roulier_get_label(carrier_type, payload),
+            payloads)
+    finally:
+        pool.close()
+        pool.join()
+
+
 class StockQuantPackage(models.Model):
     _inherit = 'stock.quant.package'
 
@@ -83,28 +121,87 @@ class StockQuantPackage(models.Model):
     def _prepare_label(self, label, picking):
         pass
 
+    @implemented_by_carrier
+    def _get_max_workers(self, picking):
+        pass
+
     # end of API
 
     # Core functions
 
     @api.multi
     def _generate_labels(self, picking):
+        values = self._get_labels_values(picking)
+        return picking._create_shipping_labels(values)
+
+    @api.multi
+    def _get_labels_values(self, picking):
+        """Call the carrier for each package and prepare the labels values.
+
+        The payloads are built in the current thread as they read the
+        database. When more than one worker is allowed for the carrier,
+        only the web service calls are run concurrently.
+
+        Returns:
+            list of dict of values for shipping.label records
+        """
+        if not self:
+            return []
+        self.carrier_type = picking.carrier_type  # on memory value !
+        max_workers = min(self._get_max_workers(picking), len(self))
+        if max_workers > 1:
+            payloads = [package._prepare_roulier_payload(picking)
+                        for package in self]
+            # the workers must not read the ORM: the cursor and the
+            # cache of the environment are not thread-safe
+            results = _roulier_get_labels(
+                picking.carrier_type, payloads, max_workers)
+            return self._get_labels_values_from_results(
+                picking, payloads, results)
         ret = []
         for package in self:
             labels = package._call_roulier_api(picking)
-            if isinstance(labels, dict):
-                labels = [labels]
-            for label in labels:
-                data = package._prepare_label(picking, label)
-                ret.append(self.env['shipping.label'].create(data))
+            ret += package._prepare_labels(picking, labels)
         return ret
 
+    @api.multi
+    def _get_labels_values_from_results(self, picking, payloads, results):
+        """Prepare the labels values from the results of roulier calls.
+
+        Args:
+            payloads: list of the payloads sent for the packages (self)
+            results: list of tuples (response, exception) returned by
+                _roulier_get_label for these payloads
+        Returns:
+            list of dict of values for shipping.label records
+        """
+        ret = []
+        for package, payload, result in zip(self, payloads, results):
+            labels = package._handle_roulier_response(
+                picking, payload, result)
+            ret += package._prepare_labels(picking, labels)
+        return ret
+
+    def _prepare_labels(self, picking, labels):
+        """Prepare the values of the labels of a package (self)."""
+        self.carrier_type = picking.carrier_type  # on memory value !
+        if isinstance(labels, dict):
+            labels = [labels]
+        return [self._prepare_label(picking, label) for label in labels]
+
     def _call_roulier_api(self, picking):
         """Create a label for a given package_id (self)."""
         # There is low chance you need to override it.
         # Don't forget to implement _a-carrier_before_call
         # and _a-carrier_after_call
         self.ensure_one()
+        payload = self._prepare_roulier_payload(picking)
+        result = _roulier_get_label(picking.carrier_type, payload)
+        return self._handle_roulier_response(picking, payload, result)
+
+    def _prepare_roulier_payload(self, picking):
+        """Build the payload sent to roulier for a package (self)."""
+        self.ensure_one()
 
         self.carrier_type = picking.carrier_type  # on memory value !
         roulier_instance = roulier.get(picking.carrier_type)
@@ -124,14 +221,17 @@ class StockQuantPackage(models.Model):
         payload['parcel'] = self._get_parcel(picking)
 
         # hook to override request / payload
-        payload = self._before_call(picking, payload)
-        try:
-            # api call
-            ret = roulier_instance.get_label(payload)
-        except InvalidApiInput as e:
-            raise UserError(self._error_handling(payload, e.message))
-        except Exception as e:
-            raise UserError(e.message)
+        return self._before_call(picking, payload)
+
+    def _handle_roulier_response(self, picking, payload, result):
+        """Raise the errors of a roulier call or give its result."""
+        self.ensure_one()
+        self.carrier_type = picking.carrier_type  # on memory value !
+        ret, error = result
+        if isinstance(error, InvalidApiInput):
+            raise UserError(self._error_handling(payload, error.message))
+        elif error is not None:
+            raise UserError(error.message)
 
         # minimum error handling
         if ret.get('status', '') == 'error':
@@ -154,6 +254,22 @@ class StockQuantPackage(models.Model):
             data['type'] = 'binary'
         return data
 
+    def _roulier_get_max_workers(self, picking):
+        """Number of concurrent calls allowed to the carrier web service.
+
+        Read from the 'delivery_roulier.max_workers.<carrier type>'
+        system parameter. Labels are generated one after the other
+        when it's not set.
+        """
+        key = 'delivery_roulier.max_workers.%s' % picking.carrier_type
+        value = self.env['ir.config_parameter'].get_param(key, default='1')
+        try:
+            return max(int(value), 1)
+        except ValueError:
+            _logger.warning('Invalid value %r for system parameter %s',
+                            value, key)
+            return 1
+
     def _roulier_get_parcel(self, picking):
         weight = self.get_weight()
         parcel = {
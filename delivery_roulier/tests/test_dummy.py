@@ -163,3 +163,87 @@ class TestDummy(TransactionCase):
 
         labels = picking.generate_labels(package_ids)
         self.assertNotEqual(len(labels), len(package_ids))  # =1
+
+    def test_generate_shipping_labels_concurrent(self):
+        """It should create one label per package with many workers."""
+        self.env['ir.config_parameter'].set_param(
+            'delivery_roulier.max_workers.dummy', '2')
+        picking = self._generate_picking(self.products)
+
+        packages = [
+            self.env['stock.quant.package'].create({}),
+            self.env['stock.quant.package'].create({})
+        ]
+
+        for idx, product in enumerate(self.products):
+            self._create_operation(picking, {
+                'product_qty': 1,
+                'product_id': product.id,
+                'product_uom_id': product.uom_id.id,
+                'result_package_id': packages[idx % len(packages)].id,
+            })
+
+        labels = picking.generate_labels()
+        self.assertEqual(len(labels), len(packages))
+        self.assertEqual(
+            set(labels.mapped('package_id').ids),
+            set([package.id for package in packages]))
+
+    def test_generate_labels_batch(self):
+        """It should create the labels of the pickings of a batch."""
+        picking = self._generate_picking(self.products)
+        packages = [
+            self.env['stock.quant.package'].create({}),
+            self.env['stock.quant.package'].create({})
+        ]
+        for idx, product in enumerate(self.products):
+            self._create_operation(picking, {
+                'product_qty': 1,
+                'product_id': product.id,
+                'product_uom_id': product.uom_id.id,
+                'result_package_id': packages[idx % len(packages)].id,
+            })
+        other_picking = self._generate_picking(self.products)
+
+        report = (picking | other_picking).generate_labels_batch()
+
+        self.assertEqual(report[picking.id], False)
+        # no package, the error is reported for this picking only
+        self.assertTrue(report[other_picking.id])
+        labels = self.env['shipping.label'].search(
+            [('res_model', '=', 'stock.picking'),
+             ('res_id', 'in', [picking.id, other_picking.id])])
+        self.assertEqual(
+            set(labels.mapped('package_id').ids),
+            set([package.id for package in packages]))
+
+    def test_generate_labels_batch_package_ids(self):
+        """It should only print the given packages, on many workers."""
+        self.env['ir.config_parameter'].set_param(
+            'delivery_roulier.max_workers.dummy', '2')
+        pickings = self.env['stock.picking'].browse()
+        packages = self.env['stock.quant.package'].browse()
+        for __ in range(2):
+            picking = self._generate_picking(self.products)
+            pickings |= picking
+            picking_packages = [
+                self.env['stock.quant.package'].create({}),
+                self.env['stock.quant.package'].create({})
+            ]
+            for idx, product in enumerate(self.products):
+                self._create_operation(picking, {
+                    'product_qty': 1,
+                    'product_id': product.id,
+                    'product_uom_id': product.uom_id.id,
+                    'result_package_id':
+                        picking_packages[idx % len(picking_packages)].id,
+                })
+            packages |= picking_packages[0]
+
+        report = pickings.generate_labels_batch(package_ids=packages.ids)
+
+        self.assertEqual(report, dict.fromkeys(pickings.ids, False))
+        labels = self.env['shipping.label'].search(
+            [('res_model', '=', 'stock.picking'),
+             ('res_id', 'in', pickings.ids)])
+        self.assertEqual(labels.mapped('package_id'), packages)